@@ -0,0 +1,139 @@
+"""
+ansible_runner 执行产物管理。
+每次执行使用独立的 private_data_dir（按执行 UUID 分目录），并发请求互不干扰；
+产物按保留数量、保留时长与总大小上限后台回收，也可配置为内存模式（tmpfs 目录，执行结束即删除）。
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('django')
+
+ARTIFACTS_MODE_DISK = "disk"
+ARTIFACTS_MODE_MEMORY = "memory"
+
+
+class ArtifactManager:
+	"""
+	执行产物目录管理器。
+	- disk 模式：产物保留在 artifacts_dir/<uuid>，由后台回收线程按数量、时长、总大小清理；
+	- memory 模式：产物写入运行时 tmpfs 目录，事件解析完成后立即删除。
+	执行中的目录登记在 _active 中，回收时跳过（长任务的目录可能早于保留时长或位于最旧之列）。
+	"""
+
+	def __init__(self):
+		self._gc_lock = threading.Lock()
+		self._last_gc = 0.0
+		self._lock = threading.Lock()
+		self._active = set()  # 执行中的 private_data_dir
+
+	@contextmanager
+	def job_dir(self, config_context, execution_id):
+		"""
+		为一次执行创建独立的 private_data_dir，退出时按模式删除或触发回收。
+		:param config_context: AnsibleConfig 配置上下文
+		:param execution_id: 执行 UUID，作为目录名
+		:return: 目录路径
+		"""
+		if config_context.artifacts_mode == ARTIFACTS_MODE_MEMORY:
+			root = os.path.join(config_context.runtime_dir, "artifacts")
+		else:
+			root = config_context.artifacts_dir
+		path = os.path.join(root, execution_id)
+		os.makedirs(path, mode=0o700, exist_ok=True)
+		with self._lock:
+			self._active.add(path)
+		try:
+			yield path
+		finally:
+			with self._lock:
+				self._active.discard(path)
+			if config_context.artifacts_mode == ARTIFACTS_MODE_MEMORY:
+				shutil.rmtree(path, ignore_errors=True)
+			else:
+				self._maybe_gc(config_context)
+
+	def gc(self, config_context):
+		"""
+		按保留策略清理产物目录（从最旧的开始）：
+		1. 超过保留时长的目录；
+		2. 超过保留数量的目录；
+		3. 总大小超过上限时继续删除最旧目录。
+		执行中的目录计入数量与总大小，但不删除。
+		"""
+		root = config_context.artifacts_dir
+		with self._lock:
+			active = set(self._active)
+		try:
+			entries = []
+			for name in os.listdir(root):
+				path = os.path.join(root, name)
+				if os.path.isdir(path):
+					entries.append((os.path.getmtime(path), path))
+		except FileNotFoundError:
+			return
+		entries.sort()  # 最旧的在前
+
+		now = time.time()
+		keep = []
+		removed = 0
+		for index, (mtime, path) in enumerate(entries):
+			too_old = now - mtime > config_context.artifacts_max_age
+			too_many = len(entries) - index > config_context.artifacts_retention
+			if (too_old or too_many) and path not in active:
+				shutil.rmtree(path, ignore_errors=True)
+				removed += 1
+			else:
+				keep.append(path)
+
+		sizes = [(path, _dir_size(path)) for path in keep]
+		total = sum(size for _, size in sizes)
+		for path, size in sizes:
+			if total <= config_context.artifacts_max_bytes:
+				break
+			if path in active:
+				continue
+			shutil.rmtree(path, ignore_errors=True)
+			total -= size
+			removed += 1
+
+		if removed:
+			logger.info("Artifacts GC removed %d directories from %s", removed, root)
+
+	def _maybe_gc(self, config_context):
+		"""
+		距上次回收超过 artifacts_gc_interval 时，在后台线程中回收，避免阻塞请求。
+		"""
+		now = time.monotonic()
+		if now - self._last_gc < config_context.artifacts_gc_interval or not self._gc_lock.acquire(blocking=False):
+			return
+		self._last_gc = now
+
+		def run():
+			try:
+				self.gc(config_context)
+			except Exception as e:
+				logger.warning("Artifacts GC failed: %s", e)
+			finally:
+				self._gc_lock.release()
+
+		threading.Thread(target=run, name="artifacts-gc", daemon=True).start()
+
+
+def _dir_size(path) -> int:
+	total = 0
+	for dirpath, _, filenames in os.walk(path):
+		for filename in filenames:
+			try:
+				total += os.path.getsize(os.path.join(dirpath, filename))
+			except OSError:
+				pass
+	return total
+
+
+# 进程级单例
+artifact_manager = ArtifactManager()
@@ -0,0 +1,253 @@
+"""
+异步 ansible 执行后端，供 ASGI 异步视图使用。
+以 asyncio 子进程调用 ansible / ansible-playbook 命令行（json 回调输出结果），等待期间不占用线程，
+单个进程即可同时承载大量以网络 I/O 等待为主的远程调用。返回结构与 run_ansible_with_context 保持一致。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+from ansible.utils import fetch_bastion_key
+from ansible.scheduler import execution_scheduler, SchedulerTimeout
+from ansible.artifacts import artifact_manager
+from ansible.multiplex import get_ssh_env_args
+from ansible.runner import get_task_label
+from ansible.warm_pool import warm_ansible_pool
+from remote_call.metrics import stage
+
+logger = logging.getLogger('django')
+
+# 取消检查间隔（秒）：调度器的取消事件为 threading.Event，需定期检查
+CANCEL_CHECK_INTERVAL = 0.5
+# 终止子进程后等待其退出的时间（秒），超时则强制 kill
+TERMINATE_GRACE = 5
+
+
+def _ansible_bin(name):
+	"""
+	预热进程池运行中时使用其替身命令；否则优先使用当前解释器所在目录（虚拟环境 bin）中的 ansible 命令，
+	找不到时交由 PATH 解析。
+	"""
+	shim = warm_ansible_pool.shim(name)
+	if shim:
+		return shim
+	path = os.path.join(os.path.dirname(sys.executable), name)
+	return path if os.path.exists(path) else name
+
+
+def _build_command(task, forks=None):
+	"""
+	将任务链中的单个任务转换为命令行参数。
+	"""
+	if task.get("playbook"):
+		cmd = [_ansible_bin("ansible-playbook"), "-i", task["inventory"], task["playbook"]]
+	else:
+		cmd = [
+			_ansible_bin("ansible"), task["host_pattern"],
+			"-i", task["inventory"],
+			"-m", task["module"],
+			"-a", task["args"],
+		]
+	if forks:
+		cmd += ["-f", str(forks)]
+	return cmd
+
+
+def _build_env(user_context, config_context, task):
+	env = dict(os.environ)
+	env.update({
+		"ANSIBLE_STDOUT_CALLBACK": "json",
+		"ANSIBLE_LOAD_CALLBACK_PLUGINS": "1",  # ad-hoc 模式下同样使用 json 回调
+		"ANSIBLE_NOCOLOR": "1",
+	})
+	if task.get("playbook") and user_context.is_h3c():
+		env["ANSIBLE_SSH_ARGS"] = "-o ControlMaster=no -o ControlPath=none"
+		env["ANSIBLE_HOST_KEY_CHECKING"] = "False"
+	else:
+		env["ANSIBLE_SSH_ARGS"] = get_ssh_env_args(config_context)
+	env.update(warm_ansible_pool.envvars(config_context))
+	return env
+
+
+def _parse_time(value):
+	if not value:
+		return None
+	try:
+		return datetime.fromisoformat(value.rstrip("Z"))
+	except ValueError:
+		return None
+
+
+def parse_json_output(stdout, task_name=None):
+	"""
+	解析 json 回调输出，按主机聚合结果，结构与 extract_ansible_events 一致。
+	:param stdout: ansible 命令标准输出（json 回调）
+	:param task_name: 仅聚合指定任务名的结果（可选）
+	:return: (results, error, focus_event_data)
+	"""
+	data = json.loads(stdout)
+	results = []
+	error = None
+	focus_event_data = None
+	for play in data.get("plays", []):
+		for task in play.get("tasks", []):
+			meta = task.get("task", {})
+			if task_name is not None and meta.get("name") != task_name:
+				continue
+			duration = meta.get("duration") or {}
+			start, end = _parse_time(duration.get("start")), _parse_time(duration.get("end"))
+			timing = {
+				"start": duration.get("start"),
+				"end": duration.get("end"),
+				"duration": (end - start).total_seconds() if start and end else None,
+			}
+			for host, res in task.get("hosts", {}).items():
+				if res.get("skipped"):
+					continue
+				failed = res.get("failed") or res.get("unreachable")
+				result_item = {
+					"host": host,
+					"stdout": res.get("stdout", ""),
+					"stderr": res.get("stderr", ""),
+					"rc": res.get("rc", 1 if failed else 0),
+					"msg": res.get("msg", ""),
+				}
+				if failed:
+					result_item["failed"] = True
+					if error is None:
+						error = res
+				else:
+					result_item["changed"] = res.get("changed", False)
+					if focus_event_data is None:
+						focus_event_data = {"host": host, "task": meta.get("name"), "task_action": res.get("action"), "res": res}
+				result_item.update(timing)
+				results.append(result_item)
+	return results, error, focus_event_data
+
+
+async def _run_process(cmd, env, cwd, cancel_event, timeout):
+	"""
+	运行子进程并等待结束，超时或被取消时终止进程。
+	:return: (stdout, stderr, rc, canceled)
+	"""
+	proc = await asyncio.create_subprocess_exec(
+		*cmd, cwd=cwd, env=env,
+		stdin=asyncio.subprocess.DEVNULL,
+		stdout=asyncio.subprocess.PIPE,
+		stderr=asyncio.subprocess.PIPE,
+	)
+	communicate = asyncio.ensure_future(proc.communicate())
+	deadline = time.monotonic() + timeout
+	try:
+		while not communicate.done():
+			remaining = deadline - time.monotonic()
+			if remaining <= 0 or cancel_event.is_set():
+				break
+			await asyncio.wait({communicate}, timeout=min(remaining, CANCEL_CHECK_INTERVAL))
+		if communicate.done():
+			stdout, stderr = communicate.result()
+			return stdout.decode("utf-8", errors="replace"), stderr.decode("utf-8", errors="replace"), proc.returncode, False
+		_terminate(proc)
+		try:
+			await asyncio.wait_for(asyncio.shield(communicate), TERMINATE_GRACE)
+		except asyncio.TimeoutError:
+			proc.kill()
+		return "", "", proc.returncode, True
+	except asyncio.CancelledError:
+		# 客户端断开等导致协程被取消时，不遗留 ansible 子进程
+		_terminate(proc)
+		raise
+
+
+def _terminate(proc):
+	try:
+		proc.terminate()
+	except ProcessLookupError:
+		pass
+
+
+async def arun_ansible_with_context(user_context, config_context, task_context, inventory_path, playbook_path, forks=None, targets=None):
+	"""
+	run_ansible_with_context 的异步版本：调度器异步槽位 + ansible 命令行子进程。
+	:return: dict 统一结构 {status, data, error, all_results, target, raw, scheduler}
+	"""
+	cleanup = None
+	task_chain = task_context.get_task_chain(inventory_path, playbook_path)
+	all_results = []
+	focus_result = None
+	error = None
+	target = None
+	timeout = user_context.timeout or config_context.default_timeout
+	deadline = time.monotonic() + timeout
+	try:
+		if user_context.is_use_bastion():
+			# 启用私钥缓存时多数情况直接命中，首次拉取在线程中进行，不阻塞事件循环；拉取失败作为错误结果返回
+			with stage("key_fetch"):
+				cleanup = await asyncio.to_thread(fetch_bastion_key, user_context, config_context)
+
+		async with execution_scheduler.aslot(
+			config_context,
+			targets or [user_context.get_target_addr()],
+			user_context.get_erp(),
+			execution_id=user_context.get_uuid(),
+			bastion=config_context.bastion_ip if user_context.is_use_bastion() else None,
+			forks=forks
+		) as slot:
+			with artifact_manager.job_dir(config_context, user_context.get_uuid()) as private_data_dir:
+				for task in task_chain:
+					with stage("runner_run"):
+						# 先构建环境变量（按需启动预热进程池），再解析命令路径
+						env = _build_env(user_context, config_context, task)
+						stdout, stderr, rc, canceled = await _run_process(
+							_build_command(task, forks),
+							env,
+							private_data_dir,
+							slot.cancel_event,
+							deadline - time.monotonic()
+						)
+					if canceled:
+						reason = "执行已取消" if slot.cancel_event.is_set() else f"执行超时（{timeout}s），已终止"
+						return {"status": "error", "data": focus_result, "error": reason, "all_results": all_results, "target": target, "raw": None, "scheduler": slot.info()}
+
+					steps = task.get("steps") or [{"task": get_task_label(task), "focus": task.get("focus", False)}]
+					for step in steps:
+						try:
+							with stage("extract_events"):
+								results, task_error, event_data = parse_json_output(
+									stdout, task_name=step.get("name", step["task"]) if task.get("steps") else None
+								)
+						except ValueError:
+							# 未产生 json 输出（如参数错误、ansible 未安装），返回进程错误输出
+							logger.error(f"ansible exited with rc={rc}: {stderr.strip()}")
+							return {"status": "error", "data": None, "error": stderr.strip() or f"ansible exited with rc={rc}", "all_results": all_results, "target": target, "raw": None, "scheduler": slot.info()}
+						all_results.append({
+							"task": step["task"],
+							"focus": step.get("focus", False),
+							"result": results
+						})
+						if step.get("focus", False):
+							focus_result = results[0] if results else results
+							target = event_data
+						if task_error and not error:
+							error = task_error
+			return {
+				"status": "error" if error else "success",
+				"data": focus_result,
+				"error": error,
+				"all_results": all_results,
+				"target": target,
+				"raw": None,
+				"scheduler": slot.info()
+			}
+	except SchedulerTimeout as e:
+		return {"status": "error", "data": None, "error": str(e), "raw": None, "scheduler": e.info}
+	except Exception as e:
+		return {"status": "error", "data": None, "error": str(e), "raw": None}
+	finally:
+		if cleanup:
+			cleanup()
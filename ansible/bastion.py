@@ -0,0 +1,237 @@
+"""
+堡垒机池。
+配置 BASTIONS 后，每个请求按目标地址选择一台堡垒机，而不是所有流量都经过同一台：
+- 路由：BASTION_ROUTES 按目标网段（CIDR，最长前缀优先）限定候选堡垒机，未命中任何网段时候选为全部堡垒机；
+  登记表主机指定了 bastion 时直接使用该堡垒机；
+- 选择：least_connections 取调度器中占用会话最少的一台（并列时轮转），round_robin 按顺序轮转；
+- 健康探测：后台线程定期建立 TCP 连接并读取 SSH 版本标识，失败的堡垒机不再参与选择，探测恢复后重新加入；
+- 故障切换：仅在连接阶段失败时切换——拉取私钥或原生引擎连接堡垒机失败，或 ansible ProxyCommand 报告
+  "ssh: connect to host <堡垒机> port <端口>: Connection refused/timed out"；此时立即标记故障，
+  服务层换用其他堡垒机重试一次。命令执行中途连接被关闭/重置时命令可能已执行，不做切换。
+未配置 BASTIONS 时，池中只有 BASTION_IP 对应的一台堡垒机（名称 default），行为与单堡垒机一致。
+"""
+
+import ipaddress
+import itertools
+import logging
+import re
+import socket
+import threading
+import time
+
+import paramiko
+
+logger = logging.getLogger('django')
+
+DEFAULT_BASTION = "default"
+
+
+class Bastion:
+	"""
+	池中的单台堡垒机，未单独配置的字段取 BASTION_CONFIG 顶层的默认值。
+	"""
+
+	def __init__(self, name, ip, port, user, private_key, jump_private_key):
+		self.name = name
+		self.ip = ip
+		self.port = int(port)
+		self.user = user
+		self.private_key = private_key
+		self.jump_private_key = jump_private_key
+		self.healthy = True
+		self.down_since = None
+		self.last_error = None
+
+
+class BastionPool:
+	"""
+	堡垒机池（每个服务进程一个），配置在首次选择时按 AnsibleConfig 加载。
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._bastions = None  # 名称 -> Bastion，保持配置顺序
+		self._routes = []  # [(网段, [Bastion])]，按前缀长度降序
+		self._selection = "least_connections"
+		self._health_interval = 30
+		self._health_timeout = 3.0
+		self._rr = itertools.count()
+		self._prober = None
+
+	def select(self, user_context, config_context) -> Bastion:
+		"""
+		为目标主机选择堡垒机。
+		"""
+		self._ensure_loaded(config_context)
+		candidates = self._candidates(user_context)
+		healthy = [b for b in candidates if b.healthy]
+		if not healthy:
+			# 候选均已标记故障时仍返回最早故障的一台（可能已恢复而探测尚未发现），由执行结果反映故障
+			return min(candidates, key=lambda b: b.down_since or 0)
+		if self._selection != "round_robin" and len(healthy) > 1:
+			from ansible.scheduler import execution_scheduler
+			sessions = execution_scheduler.stats()["bastion_sessions"]
+			least = min(sessions.get(b.ip, 0) for b in healthy)
+			# 会话数并列最少的几台之间轮转，避免同时到达的请求集中到同一台
+			healthy = [b for b in healthy if sessions.get(b.ip, 0) == least]
+		return healthy[next(self._rr) % len(healthy)]
+
+	def mark_down(self, name, error=None):
+		"""
+		标记堡垒机故障（连接被拒绝、超时等），恢复由健康探测完成。
+		只有一台堡垒机时无可切换的对象，不做标记。
+		"""
+		bastions = self._bastions or {}
+		bastion = bastions.get(name)
+		if bastion is None or len(bastions) < 2:
+			return
+		with self._lock:
+			was_healthy = bastion.healthy
+			bastion.healthy = False
+			bastion.last_error = str(error) if error else None
+			if was_healthy:
+				bastion.down_since = time.monotonic()
+		if was_healthy:
+			logger.warning("Bastion %s (%s:%d) marked down: %s", name, bastion.ip, bastion.port, error)
+
+	def report_unreachable(self, config_context, error):
+		"""
+		记录本次请求连接堡垒机失败（拉取私钥、原生引擎连接等连接阶段），并标记该堡垒机故障。
+		"""
+		config_context.bastion_error = str(error)
+		self.mark_down(config_context.bastion_name, error)
+
+	def check_failover(self, user_context, config_context, response) -> bool:
+		"""
+		执行失败后判断是否因连接所用堡垒机失败，是则标记故障并返回是否有其他可用堡垒机可以重试。
+		只认连接阶段的失败（report_unreachable 记录的错误，或 ssh 连接堡垒机被拒绝/超时），
+		且只匹配 error 中的 msg/stderr，不匹配命令的 stdout。
+		:param response: 服务层结果
+		"""
+		name = getattr(config_context, "bastion_name", None)
+		bastion = (self._bastions or {}).get(name)
+		if bastion is None or response.get("status") != "error":
+			return False
+		if not getattr(config_context, "bastion_error", None):
+			match = re.search(
+				rf"ssh: connect to host {re.escape(bastion.ip)} port {bastion.port}: "
+				r"(?:Connection refused|Connection timed out|Operation timed out)",
+				_error_text(response.get("error"))
+			)
+			if not match:
+				return False
+			self.mark_down(name, match.group(0))
+		return any(b.healthy and b is not bastion for b in self._candidates(user_context))
+
+	def stats(self) -> dict:
+		"""
+		各堡垒机健康状态：{名称: 1/0}。
+		"""
+		return {name: int(b.healthy) for name, b in (self._bastions or {}).items()}
+
+	def _candidates(self, user_context) -> list:
+		preferred = user_context.extra.get("bastion")
+		if preferred and preferred in self._bastions:
+			return [self._bastions[preferred]]
+		try:
+			address = ipaddress.ip_address(user_context.ip)
+		except ValueError:
+			address = None
+		if address is not None:
+			for network, bastions in self._routes:
+				if address.version == network.version and address in network:
+					return bastions
+		return list(self._bastions.values())
+
+	def _ensure_loaded(self, config_context):
+		if self._bastions is not None:
+			return
+		with self._lock:
+			if self._bastions is not None:
+				return
+			bastions = {}
+			for item in config_context.bastions:
+				bastion = Bastion(
+					item["name"],
+					item["ip"],
+					item.get("port", config_context.bastion_port),
+					item.get("user", config_context.bastion_user),
+					item.get("private_key", config_context.bastion_private_key),
+					item.get("jump_private_key", config_context.jump_private_key),
+				)
+				bastions[bastion.name] = bastion
+			if not bastions:
+				bastions[DEFAULT_BASTION] = Bastion(
+					DEFAULT_BASTION,
+					config_context.bastion_ip,
+					config_context.bastion_port,
+					config_context.bastion_user,
+					config_context.bastion_private_key,
+					config_context.jump_private_key,
+				)
+			routes = []
+			for route in config_context.bastion_routes:
+				members = [bastions[name] for name in route["bastions"] if name in bastions]
+				if members:
+					routes.append((ipaddress.ip_network(route["cidr"], strict=False), members))
+				else:
+					logger.warning("Bastion route %s has no known bastions, ignored", route["cidr"])
+			routes.sort(key=lambda r: r[0].prefixlen, reverse=True)
+			self._routes = routes
+			self._selection = config_context.bastion_selection
+			self._health_interval = config_context.bastion_health_interval
+			self._health_timeout = config_context.bastion_health_timeout
+			self._bastions = bastions
+			if len(bastions) > 1 and self._health_interval > 0:
+				self._prober = threading.Thread(target=self._probe_loop, name="bastion-health", daemon=True)
+				self._prober.start()
+
+	def _probe_loop(self):
+		while True:
+			time.sleep(self._health_interval)
+			for bastion in list(self._bastions.values()):
+				ok, error = _probe(bastion, self._health_timeout)
+				if ok and not bastion.healthy:
+					with self._lock:
+						bastion.healthy = True
+						bastion.down_since = None
+						bastion.last_error = None
+					logger.info("Bastion %s (%s:%d) recovered", bastion.name, bastion.ip, bastion.port)
+				elif not ok:
+					self.mark_down(bastion.name, error)
+
+
+def _probe(bastion, timeout):
+	"""
+	建立 TCP 连接并读取 SSH 版本标识（不做认证），返回 (是否正常, 错误信息)。
+	"""
+	try:
+		with socket.create_connection((bastion.ip, bastion.port), timeout=timeout) as sock:
+			banner = sock.recv(64)
+	except OSError as e:
+		return False, f"probe failed: {e}"
+	if not banner.startswith(b"SSH-"):
+		return False, f"probe failed: unexpected banner {banner[:32]!r}"
+	return True, None
+
+
+def _error_text(error) -> str:
+	"""
+	错误信息中可能包含 ssh 连接错误的部分：字符串错误本身，或 ansible 失败结果的 msg 与 stderr。
+	"""
+	if isinstance(error, dict):
+		return f"{error.get('msg') or ''}\n{error.get('stderr') or ''}"
+	return str(error or "")
+
+
+def is_bastion_unreachable(error) -> bool:
+	"""
+	连接堡垒机时的异常是否表示堡垒机不可用（拒绝连接、超时、握手被断开），认证失败等不计入。
+	"""
+	if isinstance(error, paramiko.AuthenticationException):
+		return False
+	return isinstance(error, (OSError, EOFError, paramiko.SSHException))
+
+
+# 进程级单例
+bastion_pool = BastionPool()
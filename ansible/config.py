@@ -4,8 +4,11 @@
 """
 
 import os
+import tempfile
 from django.conf import settings
 
+from ansible.bastion import bastion_pool
+
 
 class AnsibleConfig:
 	"""
@@ -27,6 +30,11 @@ class AnsibleConfig:
 		
 		# 堡垒机 IP 地址
 		self.bastion_ip = cfg.get("BASTION_IP") or os.getenv("BASTION_IP")
+
+		# 堡垒机 SSH 端口
+		self.bastion_port = int(
+			cfg.get("BASTION_PORT", os.getenv("BASTION_PORT", 22))
+		)
 		
 		# 堡垒机登录用户名
 		self.bastion_user = cfg.get("BASTION_USER") or os.getenv("BASTION_USER")
@@ -45,15 +53,174 @@ class AnsibleConfig:
 		self.jump_private_key = os.path.expanduser(
 			cfg.get("JUMP_PRIVATE_KEY") or os.getenv("JUMP_PRIVATE_KEY") or ""
 		)
-		
 
-		if user_context is not None:
+		# 堡垒机私钥缓存有效期（秒），0 表示不缓存、每次请求单独拉取
+		self.key_cache_ttl = int(
+			cfg.get("KEY_CACHE_TTL", os.getenv("KEY_CACHE_TTL", 300))
+		)
+		# 私钥回源失败、沿用旧副本后再次回源前的等待时间（秒）
+		self.key_cache_retry_interval = int(
+			cfg.get("KEY_CACHE_RETRY_INTERVAL", os.getenv("KEY_CACHE_RETRY_INTERVAL", 30))
+		)
+
+		# SSH 连接复用（ControlMaster）配置
+		self.ssh_mux_enabled = str(
+			cfg.get("SSH_MUX_ENABLED", os.getenv("SSH_MUX_ENABLED", True))
+		).lower() not in ("0", "false", "no")
+		# 控制套接字根目录，路径需尽量短以满足 unix socket 长度限制
+		self.ssh_control_dir = os.path.expanduser(
+			cfg.get("SSH_CONTROL_DIR") or os.getenv("SSH_CONTROL_DIR") or "/tmp/rc-mux"
+		)
+		# 空闲连接保持时间（秒），超时后 ssh 主进程自动退出
+		self.ssh_control_persist = int(
+			cfg.get("SSH_CONTROL_PERSIST", os.getenv("SSH_CONTROL_PERSIST", 300))
+		)
+		# 最多保持的控制套接字数量，超出时按 LRU 关闭
+		self.ssh_max_control_sockets = int(
+			cfg.get("SSH_MAX_CONTROL_SOCKETS", os.getenv("SSH_MAX_CONTROL_SOCKETS", 256))
+		)
+		# 控制套接字健康检查间隔（秒）
+		self.ssh_health_check_interval = int(
+			cfg.get("SSH_HEALTH_CHECK_INTERVAL", os.getenv("SSH_HEALTH_CHECK_INTERVAL", 30))
+		)
+		# 默认执行引擎：ansible / native（原生 SSH，仅 Linux 命令模式生效）
+		self.execution_engine = cfg.get("EXECUTION_ENGINE") or os.getenv("EXECUTION_ENGINE") or "ansible"
+		# 原生引擎连接/命令超时（秒）
+		self.native_connect_timeout = int(
+			cfg.get("NATIVE_CONNECT_TIMEOUT", os.getenv("NATIVE_CONNECT_TIMEOUT", 10))
+		)
+		self.native_command_timeout = int(
+			cfg.get("NATIVE_COMMAND_TIMEOUT", os.getenv("NATIVE_COMMAND_TIMEOUT", 300))
+		)
+		# 原生引擎连接池：空闲回收时间（秒）与最大目标连接数
+		self.native_idle_timeout = int(
+			cfg.get("NATIVE_IDLE_TIMEOUT", os.getenv("NATIVE_IDLE_TIMEOUT", 300))
+		)
+		self.native_max_sessions = int(
+			cfg.get("NATIVE_MAX_SESSIONS", os.getenv("NATIVE_MAX_SESSIONS", 256))
+		)
+		# H3C CLI 会话引擎：是否启用、空闲回收时间（秒）、最大会话数、单条命令等待提示符的超时（秒）
+		self.h3c_session_enabled = str(
+			cfg.get("H3C_SESSION_ENABLED", os.getenv("H3C_SESSION_ENABLED", True))
+		).lower() not in ("0", "false", "no")
+		self.h3c_idle_timeout = int(
+			cfg.get("H3C_IDLE_TIMEOUT", os.getenv("H3C_IDLE_TIMEOUT", 300))
+		)
+		self.h3c_max_sessions = int(
+			cfg.get("H3C_MAX_SESSIONS", os.getenv("H3C_MAX_SESSIONS", 64))
+		)
+		self.h3c_command_timeout = int(
+			cfg.get("H3C_COMMAND_TIMEOUT", os.getenv("H3C_COMMAND_TIMEOUT", 60))
+		)
+		# 批量执行默认并行数（ansible forks / 原生引擎线程数）
+		self.batch_forks = int(
+			cfg.get("BATCH_FORKS", os.getenv("BATCH_FORKS", 20))
+		)
+		# 预定义主机分组：分组名 -> IP 列表，供批量接口按 group 下发
+		self.host_groups = cfg.get("HOST_GROUPS") or {}
+		# 执行调度：全局/每堡垒机/每目标/每用户并发上限，排队超时（秒），单次执行默认超时（秒）
+		self.scheduler_max_concurrent = int(
+			cfg.get("SCHEDULER_MAX_CONCURRENT", os.getenv("SCHEDULER_MAX_CONCURRENT", 32))
+		)
+		self.scheduler_max_per_target = int(
+			cfg.get("SCHEDULER_MAX_PER_TARGET", os.getenv("SCHEDULER_MAX_PER_TARGET", 4))
+		)
+		self.scheduler_max_per_user = int(
+			cfg.get("SCHEDULER_MAX_PER_USER", os.getenv("SCHEDULER_MAX_PER_USER", 8))
+		)
+		# 每个堡垒机的并发会话上限，应低于堡垒机 sshd MaxStartups/MaxSessions 的承载能力
+		self.scheduler_max_per_bastion = int(
+			cfg.get("SCHEDULER_MAX_PER_BASTION", os.getenv("SCHEDULER_MAX_PER_BASTION", 30))
+		)
+		self.scheduler_queue_timeout = int(
+			cfg.get("SCHEDULER_QUEUE_TIMEOUT", os.getenv("SCHEDULER_QUEUE_TIMEOUT", 60))
+		)
+		self.default_timeout = int(
+			cfg.get("DEFAULT_TIMEOUT", os.getenv("DEFAULT_TIMEOUT", 600))
+		)
+		# 运行时临时目录（inventory/playbook 缓存等），默认位于 tmpfs 以避免落盘
+		self.runtime_dir = os.path.expanduser(
+			cfg.get("RUNTIME_DIR") or os.getenv("RUNTIME_DIR") or _default_runtime_dir()
+		)
+		# inventory/playbook 缓存文件闲置保留时间（秒）
+		self.runtime_cache_ttl = int(
+			cfg.get("RUNTIME_CACHE_TTL", os.getenv("RUNTIME_CACHE_TTL", 600))
+		)
+		# ansible_runner 执行产物：disk 模式按执行 UUID 分目录保留于 ARTIFACTS_DIR，memory 模式写入运行时目录并在执行后删除
+		self.artifacts_mode = cfg.get("ARTIFACTS_MODE") or os.getenv("ARTIFACTS_MODE") or "disk"
+		self.artifacts_dir = os.path.expanduser(
+			cfg.get("ARTIFACTS_DIR") or os.getenv("ARTIFACTS_DIR") or os.path.join(self.working_dir, "artifacts")
+		)
+		# 产物保留策略：最多保留目录数、最长保留时间（秒）、总大小上限（字节）、回收间隔（秒）
+		self.artifacts_retention = int(
+			cfg.get("ARTIFACTS_RETENTION", os.getenv("ARTIFACTS_RETENTION", 500))
+		)
+		self.artifacts_max_age = int(
+			cfg.get("ARTIFACTS_MAX_AGE", os.getenv("ARTIFACTS_MAX_AGE", 86400))
+		)
+		self.artifacts_max_bytes = int(
+			cfg.get("ARTIFACTS_MAX_BYTES", os.getenv("ARTIFACTS_MAX_BYTES", 1024 * 1024 * 1024))
+		)
+		self.artifacts_gc_interval = int(
+			cfg.get("ARTIFACTS_GC_INTERVAL", os.getenv("ARTIFACTS_GC_INTERVAL", 60))
+		)
+		# 预热 ansible 工作进程池：进程数（0 表示关闭，每次执行启动新的 ansible 进程）、
+		# 单个工作进程处理多少次执行后回收重建、shim 与 IPC 套接字目录（需允许执行）
+		self.warm_pool_size = int(
+			cfg.get("WARM_POOL_SIZE", os.getenv("WARM_POOL_SIZE", 0))
+		)
+		self.warm_pool_max_jobs = int(
+			cfg.get("WARM_POOL_MAX_JOBS", os.getenv("WARM_POOL_MAX_JOBS", 200))
+		)
+		self.warm_pool_dir = os.path.expanduser(
+			cfg.get("WARM_POOL_DIR") or os.getenv("WARM_POOL_DIR") or os.path.join(tempfile.gettempdir(), "rc-warm")
+		)
+		# 堡垒机池：BASTIONS 为 [{name, ip, port?, user?, private_key?, jump_private_key?}]（缺省字段取上面的默认值），
+		# BASTION_ROUTES 为 [{cidr, bastions: [name]}]；未配置 BASTIONS 时只有上面一台堡垒机
+		self.bastions = cfg.get("BASTIONS") or []
+		self.bastion_routes = cfg.get("BASTION_ROUTES") or []
+		# 选择策略：least_connections / round_robin；健康探测间隔与超时（秒），间隔为 0 时不探测
+		self.bastion_selection = cfg.get("BASTION_SELECTION") or os.getenv("BASTION_SELECTION") or "least_connections"
+		self.bastion_health_interval = int(
+			cfg.get("BASTION_HEALTH_INTERVAL", os.getenv("BASTION_HEALTH_INTERVAL", 30))
+		)
+		self.bastion_health_timeout = float(
+			cfg.get("BASTION_HEALTH_TIMEOUT", os.getenv("BASTION_HEALTH_TIMEOUT", 3))
+		)
+		self.bastion_name = None
+		# 本次请求连接堡垒机失败的错误信息（由 bastion_pool.report_unreachable 记录，用于故障切换判断）
+		self.bastion_error = None
+		if user_context is not None and user_context.is_use_bastion():
+			self._apply_bastion(bastion_pool.select(user_context, self))
+
+		# 由 ControlSocketPool.acquire 按请求填充
+		self.bastion_control_path = None
+		self.target_control_path = None
+
+		if self.key_cache_ttl > 0:
+			# 启用缓存时所有请求共享同一份本地私钥副本
+			self.bastion_temp_private_key_with_user = self.bastion_temp_private_key
+		elif user_context is not None:
 			self.bastion_temp_private_key_with_user = (
                 f"{self.bastion_temp_private_key}_{user_context.erp}_{user_context.uuid}"
             )
 		else:
 			self.bastion_temp_private_key_with_user = self.bastion_temp_private_key
 
+	def _apply_bastion(self, bastion):
+		"""
+		使用堡垒机池为本次请求选出的堡垒机。
+		"""
+		self.bastion_name = bastion.name
+		self.bastion_ip = bastion.ip
+		self.bastion_port = bastion.port
+		self.bastion_user = bastion.user
+		self.bastion_private_key = os.path.expanduser(bastion.private_key or "")
+		self.jump_private_key = os.path.expanduser(bastion.jump_private_key or "")
+		if self.bastions:
+			# 各堡垒机上的目标私钥可能不同，本地副本按堡垒机区分
+			self.bastion_temp_private_key = f"{self.bastion_temp_private_key}_{bastion.name}"
+
 	def to_dict(self):
 		"""
 		将配置对象转为字典，便于序列化或调试。
@@ -63,14 +230,34 @@ class AnsibleConfig:
 		return {
 			"WORKING_DIR": self.working_dir,
 			"BASTION_IP": self.bastion_ip,
+			"BASTION_PORT": self.bastion_port,
 			"BASTION_USER": self.bastion_user,
+			"BASTION_NAME": self.bastion_name,
 			"BASTION_PRIVATE_KEY": self.bastion_private_key,
 			"BASTION_TEMP_PRIVATE_KEY": self.bastion_temp_private_key,
 			"BASTION_TEMP_PRIVATE_KEY_WITH_USER": self.bastion_temp_private_key_with_user,
 			"JUMP_PRIVATE_KEY": self.jump_private_key,
+			"KEY_CACHE_TTL": self.key_cache_ttl,
+			"SSH_MUX_ENABLED": self.ssh_mux_enabled,
+			"SSH_CONTROL_DIR": self.ssh_control_dir,
+			"SSH_CONTROL_PERSIST": self.ssh_control_persist,
+			"SSH_MAX_CONTROL_SOCKETS": self.ssh_max_control_sockets,
+			"EXECUTION_ENGINE": self.execution_engine,
+			"RUNTIME_DIR": self.runtime_dir,
+			"ARTIFACTS_MODE": self.artifacts_mode,
+			"ARTIFACTS_DIR": self.artifacts_dir,
 		}
 
 
+def _default_runtime_dir() -> str:
+	"""
+	默认运行时目录：优先使用 tmpfs（/dev/shm），不存在时回退到系统临时目录。
+	"""
+	if os.path.isdir("/dev/shm"):
+		return "/dev/shm/remote-command"
+	return os.path.join(tempfile.gettempdir(), "remote-command")
+
+
 def get_ansible_config(user_context=None) -> AnsibleConfig:
 	"""
 	获取 ansible 内部配置上下文对象。
@@ -0,0 +1,427 @@
+"""
+H3C 设备 CLI 会话引擎。
+H3C 交换机只支持 diffie-hellman-group1-sha1 等老旧密钥交换，低性能 CPU 上每次握手耗时明显，
+经 ansible raw 任务执行时每个请求都要重新握手登录。本模块按设备保持已认证的交互式 CLI 会话：
+- 会话按 (erp, ip, port, username, 凭据指纹) 复用，空闲超过 h3c_idle_timeout 或数量超过 h3c_max_sessions 时关闭；
+- 登录后识别提示符（<sysname> 用户视图 / [sysname] 系统视图），关闭分屏（screen-length disable），
+  仍出现 ---- More ---- 时自动翻页；
+- 命令逐条发送，读到提示符即为该命令输出结束，返回每条命令各自的输出、状态与耗时；
+  输出中出现 Comware 错误提示（% ...）的命令视为失败，可选择失败后继续或跳过后续命令。
+同一会话同一时刻只执行一个请求，并发请求在会话锁上排队。返回结构与 run_ansible_with_context 保持一致。
+"""
+
+import logging
+import re
+import select
+import threading
+import time
+from datetime import datetime
+
+import paramiko
+
+from ansible.utils import fetch_bastion_key
+from ansible.scheduler import execution_scheduler, ExecutionCanceled, SchedulerTimeout
+from ansible.native import _LineCollector
+from remote_call.metrics import stage
+
+logger = logging.getLogger('django')
+
+# 提示符：<H3C>、[H3C]、[H3C-GigabitEthernet1/0/1] 等，位于输出末行
+PROMPT_RE = re.compile(r"[<\[]([^\s<>\[\]]{1,128}?)(?:-[^\s<>\[\]]*)?[>\]]\s*$")
+# 分屏提示
+MORE_RE = re.compile(r"-{2,}\s*More\s*-{2,}\s*$")
+# 翻页后擦除 More 提示：光标左移、空格覆盖、再左移
+ERASE_RE = re.compile(r"\x1b\[\d*D +\x1b\[\d*D")
+# 其余终端控制序列
+ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+# Comware 命令错误提示行（"% " 开头），设备日志为 "%Oct 18 ..." 形式不匹配
+COMWARE_ERROR_RE = re.compile(r"^[ \t]*% \S.*$", re.MULTILINE)
+# 末行疑似提示符但不是已知设备名时，确认输出已停止的静默时间（秒）
+PROMPT_SETTLE = 0.5
+RECV_SIZE = 65536
+
+
+class H3CSessionError(Exception):
+	"""
+	会话建立或命令读取失败（连接断开、等待提示符超时等），会话随之丢弃。
+	"""
+
+
+def _clean(text: str) -> str:
+	text = ANSI_RE.sub("", ERASE_RE.sub("", text)).replace("\r", "")
+	return text.replace("\x08", "")
+
+
+class _H3CSession:
+	"""
+	单个设备上已登录的交互式 CLI 会话。
+	"""
+
+	def __init__(self, client, timeout):
+		self.client = client
+		self.lock = threading.Lock()
+		self.last_used = time.monotonic()
+		self.sysname = None
+		self.channel = client.invoke_shell(term="vt100", width=512, height=1000)
+		# 登录横幅之后出现首个提示符即登录完成
+		self._read_until_prompt(timeout)
+		# 部分版本或权限下不支持（设备回显错误提示），此时翻页由 _read_until_prompt 处理
+		self.run("screen-length disable", timeout)
+
+	def is_active(self) -> bool:
+		transport = self.client.get_transport()
+		return transport is not None and transport.is_active() and not self.channel.closed
+
+	def close(self):
+		try:
+			self.client.close()
+		except Exception:
+			pass
+
+	def run(self, command: str, timeout, cancel_event=None) -> str:
+		"""
+		发送一条命令并返回其输出（不含回显与提示符）。
+		"""
+		self._drain()
+		self.channel.sendall((command + "\n").encode("utf-8"))
+		output = self._read_until_prompt(timeout, cancel_event)
+		lines = output.split("\n")
+		# 首行为命令回显
+		if lines and lines[0].strip() == command.strip():
+			lines = lines[1:]
+		self.last_used = time.monotonic()
+		return "\n".join(lines).strip("\n")
+
+	def _drain(self):
+		"""
+		丢弃上一条命令之后残留的输出（如设备异步日志）。
+		"""
+		while self.channel.recv_ready():
+			self.channel.recv(RECV_SIZE)
+
+	def _read_until_prompt(self, timeout, cancel_event=None) -> str:
+		"""
+		读取输出直到末行为提示符，返回提示符之前的内容。
+		cancel_event 被 set 时抛出 ExecutionCanceled，会话由调用方丢弃。
+		"""
+		deadline = time.monotonic() + timeout
+		buffer = ""
+		while True:
+			if cancel_event is not None and cancel_event.is_set():
+				raise ExecutionCanceled("执行已取消")
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				raise H3CSessionError(f"timed out after {timeout}s waiting for prompt")
+			readable, _, _ = select.select([self.channel], [], [], min(remaining, 1.0))
+			if not readable:
+				continue
+			data = self.channel.recv(RECV_SIZE)
+			if not data:
+				raise H3CSessionError("session closed by device")
+			buffer += data.decode("utf-8", errors="replace")
+
+			text = _clean(buffer)
+			if MORE_RE.search(text):
+				buffer = MORE_RE.sub("", text).rstrip(" ")
+				self.channel.sendall(b" ")
+				continue
+			head, _, last = text.rpartition("\n")
+			match = PROMPT_RE.fullmatch(last.strip())
+			if not match:
+				continue
+			if match.group(1) != self.sysname:
+				# 未知设备名（首次登录或 sysname 被修改）：输出静默一段时间才认定为提示符
+				readable, _, _ = select.select([self.channel], [], [], PROMPT_SETTLE)
+				if readable:
+					continue
+				self.sysname = match.group(1)
+			return head
+
+
+class H3CSessionPool:
+	"""
+	H3C CLI 会话池，结构与 NativeSSHPool 一致，不同 ERP 用户之间互不共享会话。
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._sessions = {}
+		self._connecting = {}
+
+	def acquire(self, user_context, config_context) -> _H3CSession:
+		"""
+		获取设备会话并独占使用，用毕须调用 release。
+		"""
+		key = self._key(user_context)
+		session = self._get(key, user_context, config_context)
+		session.lock.acquire()
+		if not session.is_active():
+			# 排队期间会话被设备断开
+			session.lock.release()
+			self._drop(key, session)
+			session = self._get(key, user_context, config_context)
+			session.lock.acquire()
+		return session
+
+	def release(self, user_context, session, discard=False):
+		"""
+		归还会话；discard 为 True（执行异常）时关闭会话，下次请求重新登录。
+		"""
+		session.last_used = time.monotonic()
+		session.lock.release()
+		if discard:
+			self._drop(self._key(user_context), session)
+
+	def close_all(self):
+		with self._lock:
+			sessions = list(self._sessions.values())
+			self._sessions.clear()
+		for session in sessions:
+			session.close()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"device": len(self._sessions)}
+
+	@staticmethod
+	def _key(user_context):
+		# 含凭据指纹：密码不同（包括错误的密码）的请求不能复用他人已登录的会话
+		return (
+			user_context.get_erp(), user_context.ip, user_context.get_port(), user_context.username,
+			user_context.get_credential_fingerprint()
+		)
+
+	def _get(self, key, user_context, config_context) -> _H3CSession:
+		with self._lock:
+			self._evict(config_context)
+			session = self._sessions.get(key)
+			if session and session.is_active():
+				return session
+			# 同一设备只建立一个会话，并发请求等待先到者登录完成，避免重复握手
+			connecting = self._connecting.setdefault(key, threading.Lock())
+
+		with connecting:
+			with self._lock:
+				session = self._sessions.get(key)
+				if session and session.is_active():
+					return session
+			try:
+				session = self._connect(user_context, config_context)
+			except BaseException:
+				with self._lock:
+					self._connecting.pop(key, None)
+				raise
+			# 登记会话与移除登录锁在同一临界区内完成：否则其间到达的请求会找不到会话而再次登录，
+			# 并在登记时关闭本请求正在使用的会话
+			with self._lock:
+				old = self._sessions.get(key)
+				self._sessions[key] = session
+				self._connecting.pop(key, None)
+		if old:
+			old.close()
+		return session
+
+	def _drop(self, key, session):
+		with self._lock:
+			if self._sessions.get(key) is session:
+				self._sessions.pop(key)
+		session.close()
+
+	def _evict(self, config_context):
+		"""
+		关闭空闲超时或已断开的会话，超过上限时按最久未用淘汰；使用中的会话不回收（调用方需持有锁）。
+		"""
+		deadline = time.monotonic() - config_context.h3c_idle_timeout
+		for key in [
+			k for k, s in self._sessions.items()
+			if not s.lock.locked() and (s.last_used < deadline or not s.is_active())
+		]:
+			self._sessions.pop(key).close()
+		idle = [k for k, s in self._sessions.items() if not s.lock.locked()]
+		while len(self._sessions) >= config_context.h3c_max_sessions and idle:
+			key = min(idle, key=lambda k: self._sessions[k].last_used)
+			idle.remove(key)
+			self._sessions.pop(key).close()
+
+	@staticmethod
+	def _connect(user_context, config_context) -> _H3CSession:
+		auth = {}
+		if user_context.is_password_auth():
+			auth["password"] = user_context.password
+			auth["look_for_keys"] = False
+			auth["allow_agent"] = False
+		elif user_context.is_use_bastion():
+			auth["key_filename"] = config_context.bastion_temp_private_key_with_user
+
+		# 与 get_ssh_args 一致直连设备；paramiko 默认算法列表包含 diffie-hellman-group1-sha1 与 ssh-rsa
+		client = paramiko.SSHClient()
+		client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+		client.connect(
+			hostname=user_context.ip,
+			port=user_context.get_port(),
+			username=user_context.username,
+			timeout=config_context.native_connect_timeout,
+			**auth
+		)
+		client.get_transport().set_keepalive(30)
+		try:
+			return _H3CSession(client, config_context.native_connect_timeout)
+		except Exception:
+			client.close()
+			raise
+
+
+def split_commands(command) -> list:
+	"""
+	将请求中的命令拆为逐条发送的命令列表：字符串按行拆分，忽略空行。
+	"""
+	if isinstance(command, (list, tuple)):
+		return list(command)
+	return [line.strip() for line in (command or "").splitlines() if line.strip()]
+
+
+def comware_errors(output: str) -> list:
+	"""
+	提取 Comware 命令错误提示（如 "% Unrecognized command found at '^' position."）。
+	CLI 没有退出码，命令是否失败只能以此判断；"%Oct 18 ..." 形式的设备日志不计入。
+	"""
+	return [m.group(0).strip() for m in COMWARE_ERROR_RE.finditer(output)]
+
+
+def _execute(user_context, config_context, commands, event_handler=None, items=None):
+	"""
+	在设备会话上顺序执行命令，continue_on_error 为 False 时首个失败命令之后的命令标记为 skipped。
+	:param items: 结果列表（可选），逐条追加；执行中途抛出异常时调用方仍可取得已完成命令的结果
+	:return: (每条命令的结果 [{command, host, stdout, stderr, rc, start, end, duration, failed/skipped}], 调度信息)
+	"""
+	timeout = user_context.timeout or config_context.h3c_command_timeout
+	key_cleanup = None
+	if user_context.is_use_bastion() and not user_context.is_password_auth():
+		with stage("key_fetch"):
+			key_cleanup = fetch_bastion_key(user_context, config_context)
+	try:
+		with execution_scheduler.slot(
+			config_context,
+			[user_context.get_target_addr()],
+			user_context.get_erp(),
+			execution_id=user_context.get_uuid()
+		) as slot:
+			with stage("connect"):
+				session = h3c_session_pool.acquire(user_context, config_context)
+			items = [] if items is None else items
+			failed = True
+			try:
+				stop = False
+				for command in commands:
+					if stop:
+						items.append({"command": command, "host": user_context.ip, "skipped": True})
+						continue
+					start = datetime.now()
+					with stage("remote_exec"):
+						out = session.run(command, timeout, slot.cancel_event)
+					end = datetime.now()
+					if event_handler:
+						collector = _LineCollector("stdout", user_context.ip, event_handler)
+						collector.feed(out.encode("utf-8"))
+						collector.close()
+					errors = comware_errors(out)
+					item = {
+						"command": command,
+						"host": user_context.ip,
+						"stdout": out,
+						"stderr": "\n".join(errors),
+						"rc": 1 if errors else 0,
+						"start": str(start),
+						"end": str(end),
+						"duration": (end - start).total_seconds(),
+					}
+					if errors:
+						item["failed"] = True
+						item["msg"] = errors[0]
+						stop = not user_context.continue_on_error
+					items.append(item)
+				failed = False
+			finally:
+				h3c_session_pool.release(user_context, session, discard=failed)
+			return items, slot.info()
+	finally:
+		if key_cleanup:
+			# 未启用私钥缓存时删除本次请求的临时私钥（会话已登录，不再需要私钥文件）
+			key_cleanup()
+
+
+def run_h3c_with_context(user_context, config_context, task_context, event_handler=None):
+	"""
+	在复用的 H3C CLI 会话上逐条执行命令，返回与 run_ansible_with_context 相同的统一结构。
+	all_results 中每条命令一个步骤，data 为全部命令输出的汇总。
+	:param user_context: RemoteCallContext 用户上下文
+	:param config_context: ansible 配置上下文
+	:param task_context: AnsibleTaskContext 任务上下文
+	:param event_handler: 输出事件回调（可选），每条命令结束后按行推送其输出
+	:return: dict 统一结构 {status, data, error, all_results, target, raw, scheduler}
+	"""
+	commands = split_commands(user_context.command)
+	try:
+		items, scheduler = _execute(user_context, config_context, commands, event_handler)
+	except SchedulerTimeout as e:
+		return {"status": "error", "data": None, "error": str(e), "raw": None, "scheduler": e.info}
+	except Exception as e:
+		logger.error(f"H3C session execution failed: {e}")
+		return {"status": "error", "data": None, "error": str(e), "raw": None}
+
+	failures = [item for item in items if item.get("failed")]
+	result_item = {
+		"host": user_context.ip,
+		"stdout": "\n".join(item["stdout"] for item in items if "stdout" in item),
+		"stderr": "\n".join(item["stderr"] for item in failures),
+		"rc": 1 if failures else 0,
+		"msg": f"{failures[0]['command']}: {failures[0]['msg']}" if failures else "",
+	}
+	if failures:
+		result_item["failed"] = True
+	else:
+		result_item["changed"] = True
+	return {
+		"status": "error" if failures else "success",
+		"data": result_item,
+		"error": result_item["msg"] or None,
+		"all_results": [{
+			"task": f"{task_context.module}:{item['command']}",
+			"focus": len(items) == 1,
+			"result": [item]
+		} for item in items],
+		"target": {"host": user_context.ip, "task_action": task_context.module, "engine": "h3c_cli", "res": items},
+		"raw": None,
+		"scheduler": scheduler
+	}
+
+
+def run_h3c_commands(user_context, config_context):
+	"""
+	在同一个 H3C CLI 会话中顺序执行命令列表（user_context.command 为列表），与 run_native_commands 返回结构一致。
+	:return: (results, error)
+		results: 每条命令的结果 [{command, host, stdout, stderr, rc, start, end, duration, failed/skipped}]
+		error: 整体执行异常信息（如登录失败、等待提示符超时），无则为 None
+	"""
+	items = []
+	try:
+		_execute(user_context, config_context, list(user_context.command), items=items)
+	except Exception as e:
+		logger.error(f"H3C session execution failed: {e}")
+		# 中途失败时返回已完成命令的结果
+		return items, str(e)
+	return items, None
+
+
+def use_h3c_session(user_context, config_context) -> bool:
+	"""
+	判断当前请求是否走 H3C 会话引擎：H3C 命令模式默认使用（配置 H3C_SESSION_ENABLED），请求指定 engine=ansible 时回退到 raw 任务。
+	"""
+	return (
+		user_context.is_h3c() and user_context.is_command_mode()
+		and config_context.h3c_session_enabled and user_context.engine != "ansible"
+	)
+
+
+# 进程级单例
+h3c_session_pool = H3CSessionPool()
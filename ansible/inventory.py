@@ -1,23 +1,25 @@
 """
 动态生成 Ansible inventory 文件。
-本模块根据用户上下文和 Ansible 配置，动态拼接 inventory 内容并写入临时文件，
+本模块根据用户上下文和 Ansible 配置，动态拼接 inventory 内容并按内容哈希写入运行时缓存目录，
 用于后续 ansible-playbook 或 ansible 命令的调用。
 """
-from typing import Tuple, Callable
-from remote_call.utils import write_temp_file
+from typing import Tuple, Callable, List
+from remote_call.utils import write_cached_file, write_temp_file, redact_text
 from remote_call.context import RemoteCallContext
 from ansible.config import AnsibleConfig
+from ansible.multiplex import control_socket_pool
 import logging
+import os
 
 logger = logging.getLogger('django')
 
-def generate_inventory(
+def build_host_line(
 	user_ctx: 'RemoteCallContext',
 	ansible_cfg: 'AnsibleConfig',
 	extra_vars: dict = None
-) -> Tuple[str, Callable]:
+) -> str:
 	"""
-	动态生成 ansible inventory 内容并写入临时文件。
+	拼接单个主机在 inventory 中的主机行（IP 及全部主机变量）。
 
 	Args:
 		user_ctx (RemoteCallContext): 用户参数上下文，包含主机、端口、认证等信息。
@@ -25,25 +27,30 @@ def generate_inventory(
 		extra_vars (dict, optional): 额外的主机变量参数，会追加到 inventory 主机行。
 
 	Returns:
-		tuple[str, callable]: (inventory 文件路径, 清理函数)
+		str: 主机行内容
 	"""
-	# 获取主机分组名
-	group_name = user_ctx.get_group_name()
+	profile = user_ctx.extra.get("profile")
+	if profile:
+		# 登记表中的主机：端口与连接方式参数已在登记时预编译
+		host_params = [f"{user_ctx.ip}", f"ansible_user={user_ctx.username}", profile["host_vars"]]
+		if not profile.get("port"):
+			# 未预编译端口（未指定端口的 Windows 主机）时按本次请求计算
+			host_params.insert(2, f"ansible_port={user_ctx.get_port()}")
+	else:
+		# 构建主机参数列表，基础参数：IP、用户名、端口
+		host_params = [
+			f"{user_ctx.ip}",
+			f"ansible_user={user_ctx.username}",
+			f"ansible_port={user_ctx.get_port()}"  # 修改为调用 get_port() 方法
+		]
 
-	# 构建主机参数列表，基础参数：IP、用户名、端口
-	host_params = [
-		f"{user_ctx.ip}",
-		f"ansible_user={user_ctx.username}",
-		f"ansible_port={user_ctx.get_port()}"  # 修改为调用 get_port() 方法
-	]
-	
-    # 添加基础参数
-	if user_ctx.is_linux():
-		host_params.append(user_ctx.get_linux_inventory())
-	if user_ctx.is_windows():
-		host_params.append(user_ctx.get_windows_inventory())
-	if user_ctx.is_h3c():
-		host_params.append(user_ctx.get_h3c_inventory())
+		# 添加基础参数
+		if user_ctx.is_linux():
+			host_params.append(user_ctx.get_linux_inventory())
+		if user_ctx.is_windows():
+			host_params.append(user_ctx.get_windows_inventory())
+		if user_ctx.is_h3c():
+			host_params.append(user_ctx.get_h3c_inventory())
 
 	# 添加认证参数（如密码/密钥等）
 	host_params.extend(user_ctx.get_auth_params(ansible_cfg))
@@ -60,14 +67,83 @@ def generate_inventory(
 			host_params.append(f"{k}={v}")
 
 	# 拼接主机行内容
-	host_line = ' '.join(host_params)
+	return ' '.join(host_params)
+
+
+def generate_inventory(
+	user_ctx: 'RemoteCallContext',
+	ansible_cfg: 'AnsibleConfig',
+	extra_vars: dict = None
+) -> Tuple[str, Callable]:
+	"""
+	动态生成 ansible inventory 内容并写入运行时目录（相同内容复用；含密码时执行后删除）。
+
+	Args:
+		user_ctx (RemoteCallContext): 用户参数上下文，包含主机、端口、认证等信息。
+		ansible_cfg (AnsibleConfig): ansible 配置上下文。
+		extra_vars (dict, optional): 额外的主机变量参数，会追加到 inventory 主机行。
+
+	Returns:
+		tuple[str, callable]: (inventory 文件路径, 清理函数)
+	"""
+	# 获取主机分组名
+	group_name = user_ctx.get_group_name()
+
+	host_line = build_host_line(user_ctx, ansible_cfg, extra_vars)
 	# 组装 inventory 文件内容
 	content = f"[{group_name}]\n{host_line}\n"
 
-	# 日志记录 inventory 内容，便于调试
-	logger.info("[Inventory Content : ERP - %s]:\n%s",user_ctx.get_erp(), content)
+	host_id = user_ctx.extra.get("host_id")
+	if host_id:
+		# 登记表中的主机只记录主机标识，连接参数可在登记表中查看
+		logger.info("[Inventory : ERP - %s] host_id=%s", user_ctx.get_erp(), host_id)
+	else:
+		# 日志记录 inventory 内容，便于调试（密码等敏感参数脱敏）
+		logger.info("[Inventory Content : ERP - %s]:\n%s",user_ctx.get_erp(), redact_text(content))
+
+	return _write_inventory(content, ansible_cfg, user_ctx.is_password_auth())
+
+
+def generate_batch_inventory(
+	user_ctx_list: List['RemoteCallContext'],
+	ansible_cfg: 'AnsibleConfig',
+	extra_vars: dict = None
+) -> Tuple[str, Callable]:
+	"""
+	为多台主机生成同一分组下的 inventory 文件，供一次 ansible_runner.run 批量执行。
+
+	Args:
+		user_ctx_list (list[RemoteCallContext]): 每台目标主机各自的用户参数上下文，操作系统类型需一致。
+		ansible_cfg (AnsibleConfig): ansible 配置上下文。
+		extra_vars (dict, optional): 额外的主机变量参数，会追加到每个主机行。
+
+	Returns:
+		tuple[str, callable]: (inventory 文件路径, 清理函数)
+	"""
+	group_name = user_ctx_list[0].get_group_name()
+
+	host_lines = []
+	for user_ctx in user_ctx_list:
+		# 每台主机分配各自的 SSH 复用控制套接字后再拼接主机行
+		control_socket_pool.acquire(user_ctx, ansible_cfg)
+		host_lines.append(build_host_line(user_ctx, ansible_cfg, extra_vars))
+	content = f"[{group_name}]\n" + "\n".join(host_lines) + "\n"
 
-	# 写入临时文件，返回文件路径和清理函数
-	file_path, close_func, cleanup_func = write_temp_file(content, suffix=".ini")
-	close_func()  # 立即关闭文件句柄，防止资源泄漏
-	return file_path, cleanup_func
\ No newline at end of file
+	logger.info("[Batch Inventory : ERP - %s] %d hosts", user_ctx_list[0].get_erp(), len(host_lines))
+
+	return _write_inventory(content, ansible_cfg, any(ctx.is_password_auth() for ctx in user_ctx_list))
+
+
+def _write_inventory(content: str, ansible_cfg: 'AnsibleConfig', has_password: bool) -> Tuple[str, Callable]:
+	"""
+	写入 inventory 文件。
+	- 含明文密码（ansible_password）时每次请求单独写入，清理函数在执行结束后删除文件；
+	- 否则按内容哈希写入运行时目录（tmpfs），相同 inventory 直接复用，清理函数为空操作。
+	"""
+	if has_password:
+		os.makedirs(ansible_cfg.runtime_dir, mode=0o700, exist_ok=True)
+		# 与缓存文件同目录：进程异常退出遗留的文件同样由缓存清理按 ttl 删除
+		path, close, cleanup = write_temp_file(content, suffix=".ini", prefix=".inv", dir=ansible_cfg.runtime_dir)
+		close()
+		return path, cleanup
+	return write_cached_file(content, suffix=".ini", dir=ansible_cfg.runtime_dir, ttl=ansible_cfg.runtime_cache_ttl)
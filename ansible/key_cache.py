@@ -0,0 +1,180 @@
+"""
+堡垒机私钥本地缓存。
+同一进程内的并发请求共享一份本地私钥副本，按 TTL 定期回源校验（sha256），
+校验通过则不重写磁盘；同一时刻只允许一个请求回源，其余请求等待其结果。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import paramiko
+
+from ansible.bastion import bastion_pool, is_bastion_unreachable
+
+logger = logging.getLogger('django')
+
+
+class _KeyEntry:
+	"""
+	单个本地私钥副本的缓存记录。
+	"""
+
+	def __init__(self, checksum, validated_at):
+		self.checksum = checksum  # 私钥内容 sha256
+		self.validated_at = validated_at  # 最近一次回源校验时间
+		self.retry_at = None  # 回源失败沿用旧副本时，下一次允许回源的时间
+
+	def is_fresh(self, ttl, now) -> bool:
+		return now - self.validated_at < ttl or (self.retry_at is not None and now < self.retry_at)
+
+
+class BastionKeyCache:
+	"""
+	堡垒机私钥缓存。
+	- TTL 内直接复用本地副本，不建立任何 SSH 连接；
+	- TTL 过期后回源读取私钥并比对 sha256，内容未变化时不重写本地文件；
+	- 同一本地路径的回源操作在进程内去重，并发请求共享同一次拉取结果；
+	- 回源失败时沿用旧副本，key_cache_retry_interval 内不再回源，避免堡垒机故障期间每个请求都等待连接超时。
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._entries = {}  # 本地路径 -> _KeyEntry
+		self._inflight = {}  # 本地路径 -> threading.Event
+
+	def get(self, config_context) -> str:
+		"""
+		获取可用的本地私钥路径，必要时回源刷新。
+		:param config_context: AnsibleConfig，提供堡垒机连接信息、私钥路径及 key_cache_ttl
+		:return: 本地私钥路径
+		"""
+		local_path = config_context.bastion_temp_private_key_with_user
+		ttl = config_context.key_cache_ttl
+		while True:
+			with self._lock:
+				entry = self._entries.get(local_path)
+				if entry and entry.is_fresh(ttl, time.monotonic()) and os.path.exists(local_path):
+					return local_path
+				waiter = self._inflight.get(local_path)
+				if waiter is None:
+					# 当前请求负责回源，其余请求等待
+					waiter = threading.Event()
+					self._inflight[local_path] = waiter
+					break
+			waiter.wait()
+			# 回源请求已结束，重新检查缓存（失败时由下一个请求接手回源）
+
+		try:
+			self._refresh(config_context, local_path, entry)
+			return local_path
+		finally:
+			with self._lock:
+				self._inflight.pop(local_path, None)
+			waiter.set()
+
+	def invalidate(self, local_path=None):
+		"""
+		使缓存失效，下一次 get 将强制回源。
+		:param local_path: 指定本地路径；为空时清空全部缓存记录
+		"""
+		with self._lock:
+			if local_path is None:
+				self._entries.clear()
+			else:
+				self._entries.pop(local_path, None)
+
+	def _refresh(self, config_context, local_path, entry):
+		"""
+		回源读取私钥并与缓存 sha256 比对，仅在内容变化或本地副本缺失时重写文件。
+		"""
+		try:
+			content = _read_bastion_key(config_context)
+		except Exception as e:
+			if entry and os.path.exists(local_path):
+				# 堡垒机暂不可达时继续使用旧副本，下次请求再尝试回源；
+				# 请求仍会继续执行，不记为连接堡垒机失败，避免执行失败后被当作未到达目标而切换重试
+				logger.warning("Bastion key revalidation failed, serving cached copy: %s", local_path)
+				with self._lock:
+					entry.retry_at = time.monotonic() + config_context.key_cache_retry_interval
+				return
+			if is_bastion_unreachable(e):
+				bastion_pool.report_unreachable(config_context, e)
+			raise
+
+		checksum = hashlib.sha256(content).hexdigest()
+		if not (entry and entry.checksum == checksum and _file_checksum(local_path) == checksum):
+			_write_private_file(local_path, content)
+			logger.info("Bastion key refreshed: %s", local_path)
+
+		with self._lock:
+			self._entries[local_path] = _KeyEntry(checksum, time.monotonic())
+
+
+def _read_bastion_key(config_context) -> bytes:
+	"""
+	通过 SFTP 将堡垒机上的私钥读入内存。
+	"""
+	ssh = paramiko.SSHClient()
+	ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())  # 自动接受未知主机密钥
+	try:
+		ssh.connect(
+			hostname=config_context.bastion_ip,
+			port=config_context.bastion_port,
+			username=config_context.bastion_user,
+			key_filename=config_context.jump_private_key
+		)
+	except Exception as e:
+		logger.error(f"Failed to connect to bastion: {e}")
+		raise
+
+	try:
+		sftp = ssh.open_sftp()
+		try:
+			with sftp.open(config_context.bastion_private_key, "rb") as f:
+				return f.read()
+		finally:
+			sftp.close()
+	except Exception as e:
+		logger.error(f"Failed to fetch private key from bastion: {e}")
+		raise
+	finally:
+		ssh.close()
+
+
+def _file_checksum(path):
+	"""
+	计算本地文件 sha256，文件不存在时返回 None。
+	"""
+	try:
+		with open(path, "rb") as f:
+			return hashlib.sha256(f.read()).hexdigest()
+	except OSError:
+		return None
+
+
+def _write_private_file(path, content: bytes):
+	"""
+	以 600 权限原子写入私钥文件：先写同目录临时文件，再 rename 覆盖，
+	避免并发读取到写了一半的私钥。
+	"""
+	directory = os.path.dirname(path) or "."
+	os.makedirs(directory, mode=0o700, exist_ok=True)
+	fd, tmp_path = tempfile.mkstemp(prefix=".key_", dir=directory)  # mkstemp 默认即为 600 权限
+	try:
+		with os.fdopen(fd, "wb") as f:
+			f.write(content)
+		os.replace(tmp_path, path)
+	except Exception:
+		try:
+			os.remove(tmp_path)
+		except OSError:
+			pass
+		raise
+
+
+# 进程级单例
+bastion_key_cache = BastionKeyCache()
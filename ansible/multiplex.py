@@ -0,0 +1,175 @@
+"""
+SSH 连接复用（ControlMaster）控制套接字池。
+为堡垒机及每个目标主机（ip, port, user）分配固定的 ControlPath，使重复请求复用已建立的 SSH 连接，
+并负责空闲回收、数量上限、健康检查以及按 ERP 用户隔离套接字目录。
+"""
+
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('django')
+
+
+class _SocketEntry:
+	"""
+	单个控制套接字的登记信息。
+	"""
+
+	def __init__(self, now):
+		self.last_used = now  # 最近一次被请求使用的时间
+		self.checked_at = now  # 最近一次健康检查的时间
+
+
+class ControlSocketPool:
+	"""
+	控制套接字池。
+	- 套接字实际由 ssh 的 ControlMaster=auto 建立，ControlPersist 负责空闲超时后自动退出；
+	- 本池记录套接字的使用时间，超过上限时按 LRU 主动关闭最久未用的连接；
+	- 复用前定期执行 `ssh -O check`，清理已失效的套接字文件，避免 ssh 放弃复用。
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._sockets = OrderedDict()  # 套接字路径 -> _SocketEntry，按最近使用排序
+
+	def acquire(self, user_context, config_context):
+		"""
+		为当前请求分配堡垒机与目标主机的控制套接字路径，结果写回 config_context：
+		bastion_control_path / target_control_path。
+		:param user_context: RemoteCallContext 用户上下文
+		:param config_context: AnsibleConfig 配置上下文
+		"""
+		config_context.bastion_control_path = None
+		config_context.target_control_path = None
+		if not config_context.ssh_mux_enabled or not user_context.is_linux() or user_context.is_password_auth():
+			# 密码认证的连接不复用（见 RemoteCallContext.get_ssh_args）
+			return
+
+		self.prune(config_context)
+		user_dir = self._user_dir(config_context, user_context.get_erp())
+		if user_context.is_use_bastion():
+			config_context.bastion_control_path = self._touch(
+				config_context,
+				_socket_path(user_dir, "b", config_context.bastion_user, config_context.bastion_ip, config_context.bastion_port)
+			)
+		config_context.target_control_path = self._touch(
+			config_context,
+			_socket_path(user_dir, "t", user_context.username, user_context.ip, user_context.get_port())
+		)
+
+	def prune(self, config_context):
+		"""
+		移除已空闲超过 ControlPersist 的登记记录（ssh 主进程此时已自行退出）。
+		"""
+		deadline = time.monotonic() - config_context.ssh_control_persist
+		with self._lock:
+			for path in [p for p, e in self._sockets.items() if e.last_used < deadline]:
+				self._sockets.pop(path, None)
+
+	def close_all(self):
+		"""
+		关闭全部已登记的控制连接，用于进程退出或配置变更。
+		"""
+		with self._lock:
+			paths = list(self._sockets.keys())
+			self._sockets.clear()
+		for path in paths:
+			_control(path, "exit")
+
+	def stats(self) -> dict:
+		"""
+		已登记的控制套接字数量：{"bastion": 堡垒机, "target": 目标主机}。
+		"""
+		with self._lock:
+			names = [os.path.basename(path) for path in self._sockets]
+		bastion = sum(1 for name in names if name.startswith("b"))
+		return {"bastion": bastion, "target": len(names) - bastion}
+
+	def _user_dir(self, config_context, erp):
+		"""
+		每个 ERP 用户独立的 700 权限目录，防止不同用户间复用彼此的已认证连接。
+		目录名取哈希，保证套接字路径不超过 unix socket 的长度限制。
+		"""
+		user_dir = os.path.join(config_context.ssh_control_dir, _short_hash(erp or "-"))
+		os.makedirs(user_dir, mode=0o700, exist_ok=True)
+		return user_dir
+
+	def _touch(self, config_context, path):
+		"""
+		登记一次使用：必要时做健康检查，超出上限时按 LRU 淘汰。
+		"""
+		now = time.monotonic()
+		need_check = False
+		evicted = []
+		with self._lock:
+			entry = self._sockets.get(path)
+			if entry is None:
+				entry = _SocketEntry(now)
+				self._sockets[path] = entry
+			elif now - entry.checked_at >= config_context.ssh_health_check_interval:
+				entry.checked_at = now
+				need_check = True
+			entry.last_used = now
+			self._sockets.move_to_end(path)
+			while len(self._sockets) > config_context.ssh_max_control_sockets:
+				evicted.append(self._sockets.popitem(last=False)[0])
+
+		for old_path in evicted:
+			logger.info("Closing idle SSH control socket: %s", old_path)
+			_control(old_path, "exit")
+
+		if need_check and os.path.exists(path) and not _control(path, "check"):
+			# 主进程已不存在但套接字文件残留，删除后由下一次 ssh 重新建立
+			logger.warning("Stale SSH control socket removed: %s", path)
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+		return path
+
+
+def _short_hash(value) -> str:
+	return hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:16]
+
+
+def _socket_path(user_dir, kind, user, host, port) -> str:
+	return os.path.join(user_dir, f"{kind}{_short_hash(f'{user}@{host}:{port}')}")
+
+
+def _control(path, command) -> bool:
+	"""
+	对控制套接字执行 ssh -O 命令（check/exit），返回是否成功。
+	"""
+	if not os.path.exists(path):
+		return False
+	try:
+		r = subprocess.run(
+			["ssh", "-o", f"ControlPath={path}", "-O", command, "mux"],
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.DEVNULL,
+			timeout=5
+		)
+		return r.returncode == 0
+	except Exception as e:
+		logger.warning("ssh -O %s failed for %s: %s", command, path, e)
+		return False
+
+
+def get_ssh_env_args(config_context) -> str:
+	"""
+	返回 ANSIBLE_SSH_ARGS：启用复用时开启 ControlMaster/ControlPersist，否则保持禁用。
+	启用复用时，密码认证与 H3C 主机由 inventory 中的 ansible_ssh_common_args 单独关闭复用
+	（ControlPath=none），其余主机使用 ControlSocketPool 分配的按 ERP 隔离的 ControlPath。
+	"""
+	if config_context.ssh_mux_enabled:
+		return f"-o ControlMaster=auto -o ControlPersist={config_context.ssh_control_persist}s"
+	return "-o ControlMaster=no -o ControlPath=none"
+
+
+# 进程级单例
+control_socket_pool = ControlSocketPool()
@@ -0,0 +1,526 @@
+"""
+原生 SSH 执行引擎。
+对 Linux 命令模式直接通过 paramiko 在复用的 SSH 连接上执行命令，绕过 ansible_runner 的进程启动与插件加载，
+堡垒机跳转通过堡垒机连接上的 direct-tcpip 通道完成。返回结构与 run_ansible_with_context 保持一致。
+"""
+
+import logging
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import paramiko
+
+from ansible.utils import fetch_bastion_key
+from ansible.bastion import bastion_pool, is_bastion_unreachable
+from ansible.scheduler import execution_scheduler, ExecutionCanceled, SchedulerTimeout
+from remote_call.metrics import stage
+
+logger = logging.getLogger('django')
+
+
+class _PooledClient:
+	"""
+	连接池中的单个 SSH 连接。
+	"""
+
+	def __init__(self, client, sock=None, bastion_key=None):
+		self.client = client
+		self.sock = sock  # 经堡垒机跳转时的 direct-tcpip 通道
+		self.bastion_key = bastion_key  # 经堡垒机跳转时所用堡垒机连接的键
+		self.last_used = time.monotonic()
+		self.in_use = 0  # 正在执行命令的请求数，大于 0 时不淘汰
+
+	def is_active(self) -> bool:
+		transport = self.client.get_transport()
+		return transport is not None and transport.is_active()
+
+	def close(self):
+		try:
+			self.client.close()
+		except Exception:
+			pass
+
+
+class NativeSSHPool:
+	"""
+	paramiko 连接池。
+	- 堡垒机连接按 (bastion_ip, bastion_port, bastion_user) 复用；
+	- 目标主机连接按 (erp, ip, port, username, 凭据指纹) 复用，不同 ERP 用户之间互不共享；
+	- 连接空闲超过 native_idle_timeout 或数量超过 native_max_sessions 时关闭最久未用的连接；
+	  正在执行命令的目标连接、仍有目标连接经其跳转的堡垒机连接不淘汰。
+	get_client 与 release 成对调用，期间连接计为使用中。
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._bastions = {}
+		self._targets = {}
+
+	def get_client(self, user_context, config_context) -> paramiko.SSHClient:
+		"""
+		获取（必要时新建）到目标主机的 SSH 连接，用完后调用 release。
+		"""
+		key = self._key(user_context)
+		with self._lock:
+			self._evict(config_context)
+			pooled = self._targets.get(key)
+			if pooled and pooled.is_active():
+				self._touch(pooled, 1)
+				return pooled.client
+			if pooled:
+				pooled.close()
+				self._targets.pop(key, None)
+
+		# 建立连接不持有全局锁，避免慢主机阻塞其他请求
+		pooled = self._connect_target(user_context, config_context)
+		with self._lock:
+			existing = self._targets.get(key)
+			if existing and existing.is_active():
+				# 并发请求已建立连接，保留先到者
+				pooled.close()
+				self._touch(existing, 1)
+				return existing.client
+			self._targets[key] = pooled
+			self._touch(pooled, 1)
+			return pooled.client
+
+	def release(self, user_context, client):
+		"""
+		命令执行结束，归还 get_client 取得的连接（连接已被丢弃时忽略）。
+		"""
+		with self._lock:
+			pooled = self._targets.get(self._key(user_context))
+			if pooled is not None and pooled.client is client:
+				self._touch(pooled, -1)
+
+	def _touch(self, pooled, delta):
+		"""
+		更新使用计数与最近使用时间，并刷新其跳转所用堡垒机连接的最近使用时间（调用方需持有锁）。
+		"""
+		now = time.monotonic()
+		pooled.in_use += delta
+		pooled.last_used = now
+		bastion = self._bastions.get(pooled.bastion_key)
+		if bastion is not None:
+			bastion.last_used = now
+
+	def discard(self, user_context):
+		"""
+		丢弃目标主机连接（执行异常后调用，下次请求重新建立）。
+		"""
+		key = self._key(user_context)
+		with self._lock:
+			pooled = self._targets.pop(key, None)
+		if pooled:
+			pooled.close()
+
+	@staticmethod
+	def _key(user_context):
+		# 含凭据指纹：密码不同（包括错误的密码）的请求不能复用他人已认证的连接
+		return (
+			user_context.get_erp(), user_context.ip, user_context.get_port(), user_context.username,
+			user_context.get_credential_fingerprint()
+		)
+
+	def close_all(self):
+		with self._lock:
+			pooled_list = list(self._targets.values()) + list(self._bastions.values())
+			self._targets.clear()
+			self._bastions.clear()
+		for pooled in pooled_list:
+			pooled.close()
+
+	def stats(self) -> dict:
+		"""
+		池中连接数量：{"bastion": 堡垒机, "target": 目标主机}。
+		"""
+		with self._lock:
+			return {"bastion": len(self._bastions), "target": len(self._targets)}
+
+	def _evict(self, config_context):
+		"""
+		关闭空闲超时的连接，并在超过上限时按最久未用淘汰（调用方需持有锁）。
+		使用中的目标连接不淘汰（允许暂时超过上限），堡垒机连接在没有目标连接经其跳转后才按空闲淘汰。
+		"""
+		deadline = time.monotonic() - config_context.native_idle_timeout
+		for key in [
+			k for k, p in self._targets.items()
+			if not p.in_use and (p.last_used < deadline or not p.is_active())
+		]:
+			self._targets.pop(key).close()
+		idle = [k for k, p in self._targets.items() if not p.in_use]
+		idle.sort(key=lambda k: self._targets[k].last_used)
+		for key in idle[:max(0, len(self._targets) - config_context.native_max_sessions + 1)]:
+			self._targets.pop(key).close()
+		tunnelled = {p.bastion_key for p in self._targets.values()}
+		for key in [
+			k for k, p in self._bastions.items()
+			if not p.is_active() or (k not in tunnelled and p.last_used < deadline)
+		]:
+			self._bastions.pop(key).close()
+
+	@staticmethod
+	def _bastion_key(config_context):
+		return config_context.bastion_ip, config_context.bastion_port, config_context.bastion_user
+
+	def _get_bastion(self, config_context) -> paramiko.Transport:
+		key = self._bastion_key(config_context)
+		with self._lock:
+			pooled = self._bastions.get(key)
+			if pooled and pooled.is_active():
+				pooled.last_used = time.monotonic()
+				return pooled.client.get_transport()
+
+		client = paramiko.SSHClient()
+		client.set_missing_host_key_policy(paramiko.AutoAddPolicy())  # 与 fetch_bastion_key 一致，自动接受主机密钥
+		try:
+			client.connect(
+				hostname=config_context.bastion_ip,
+				port=config_context.bastion_port,
+				username=config_context.bastion_user,
+				key_filename=config_context.jump_private_key,
+				timeout=config_context.native_connect_timeout
+			)
+		except Exception as e:
+			if is_bastion_unreachable(e):
+				bastion_pool.report_unreachable(config_context, e)
+			raise
+		client.get_transport().set_keepalive(30)
+		with self._lock:
+			old = self._bastions.get(key)
+			if old and old.is_active():
+				# 并发请求已建立堡垒机连接，保留先到者（其上可能已有目标连接）
+				client.close()
+				old.last_used = time.monotonic()
+				return old.client.get_transport()
+			self._bastions[key] = _PooledClient(client)
+		if old:
+			old.close()
+		return client.get_transport()
+
+	def _connect_target(self, user_context, config_context) -> _PooledClient:
+		sock = bastion_key = None
+		if user_context.is_use_bastion():
+			bastion_key = self._bastion_key(config_context)
+			transport = self._get_bastion(config_context)
+			sock = transport.open_channel(
+				"direct-tcpip",
+				(user_context.ip, user_context.get_port()),
+				("127.0.0.1", 0),
+				timeout=config_context.native_connect_timeout
+			)
+
+		auth = {}
+		if user_context.is_password_auth():
+			auth["password"] = user_context.password
+			auth["look_for_keys"] = False
+			auth["allow_agent"] = False
+		elif user_context.is_use_bastion():
+			auth["key_filename"] = config_context.bastion_temp_private_key_with_user
+
+		client = paramiko.SSHClient()
+		client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+		client.connect(
+			hostname=user_context.ip,
+			port=user_context.get_port(),
+			username=user_context.username,
+			sock=sock,
+			timeout=config_context.native_connect_timeout,
+			**auth
+		)
+		return _PooledClient(client, sock, bastion_key)
+
+
+@contextmanager
+def _open_channel(user_context, config_context):
+	"""
+	获取到目标主机的连接并打开 session 通道，退出时归还连接（期间连接计为使用中，不被空闲淘汰）。
+	复用的连接可能已被对端关闭，打开通道失败时命令尚未发送，丢弃连接后重连一次；
+	命令发送之后的异常不再重试，避免重复执行非幂等命令。
+	"""
+	timeout = config_context.native_connect_timeout
+	with stage("connect"):
+		client = native_ssh_pool.get_client(user_context, config_context)
+		try:
+			chan = _open_session(client, timeout)
+		except (paramiko.SSHException, EOFError, ConnectionError):
+			native_ssh_pool.discard(user_context)
+			chan = None
+		except BaseException:
+			native_ssh_pool.release(user_context, client)
+			raise
+		if chan is None:
+			client = native_ssh_pool.get_client(user_context, config_context)
+			try:
+				chan = _open_session(client, timeout)
+			except BaseException:
+				native_ssh_pool.release(user_context, client)
+				raise
+	try:
+		yield chan
+	finally:
+		native_ssh_pool.release(user_context, client)
+
+
+def _open_session(client, timeout) -> paramiko.Channel:
+	transport = client.get_transport()
+	if transport is None or not transport.is_active():
+		raise paramiko.SSHException("SSH session not active")
+	return transport.open_session(timeout=timeout)
+
+
+def _run_channel(chan, command, timeout, on_stdout, on_stderr, cancel_event=None) -> int:
+	"""
+	在 session 通道上执行命令，stdout/stderr 交替读取并交给回调（任一输出写满通道窗口都不会阻塞另一方），
+	返回退出码；结束后关闭通道。cancel_event 被 set（调度器 cancel）时关闭通道并抛出 ExecutionCanceled。
+	"""
+	try:
+		chan.settimeout(timeout)
+		chan.exec_command(command)
+		chan.shutdown_write()
+		deadline = time.monotonic() + timeout
+		while True:
+			if cancel_event is not None and cancel_event.is_set():
+				raise ExecutionCanceled("执行已取消")
+			received = False
+			if chan.recv_ready():
+				on_stdout(chan.recv(32768))
+				received = True
+			if chan.recv_stderr_ready():
+				on_stderr(chan.recv_stderr(32768))
+				received = True
+			if received:
+				continue
+			if chan.exit_status_ready():
+				break
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				raise TimeoutError(f"command timed out after {timeout}s")
+			select.select([chan], [], [], min(remaining, 1.0))
+		return chan.recv_exit_status()
+	finally:
+		chan.close()
+
+
+def _exec(chan, command, timeout, cancel_event=None):
+	"""
+	执行命令并返回 (stdout, stderr, rc)。
+	"""
+	out, err = [], []
+	rc = _run_channel(chan, command, timeout, out.append, err.append, cancel_event)
+	return b"".join(out).decode("utf-8", errors="replace"), b"".join(err).decode("utf-8", errors="replace"), rc
+
+
+# 流式执行时结果中保留的输出尾部大小（字节），完整输出已逐行推送给调用方
+STREAM_TAIL_BYTES = 64 * 1024
+
+
+class _LineCollector:
+	"""
+	将通道输出按行切分并推送给 event_handler，自身只保留有限大小的尾部。
+	"""
+
+	def __init__(self, stream, host, event_handler):
+		self.stream = stream
+		self.host = host
+		self.event_handler = event_handler
+		self._buffer = b""
+		self._tail = deque()
+		self._tail_size = 0
+
+	def feed(self, data: bytes):
+		self._buffer += data
+		*lines, self._buffer = self._buffer.split(b"\n")
+		for line in lines:
+			self._emit(line)
+
+	def close(self):
+		if self._buffer:
+			self._emit(self._buffer)
+			self._buffer = b""
+
+	def text(self) -> str:
+		return "\n".join(self._tail)
+
+	def _emit(self, raw: bytes):
+		line = raw.decode("utf-8", errors="replace")
+		self.event_handler({
+			"event": "native_output",
+			"stream": self.stream,
+			"stdout": line,
+			"event_data": {"host": self.host},
+		})
+		self._tail.append(line)
+		self._tail_size += len(raw) + 1
+		while self._tail_size > STREAM_TAIL_BYTES and len(self._tail) > 1:
+			self._tail_size -= len(self._tail.popleft().encode("utf-8")) + 1
+
+
+def _exec_streaming(chan, command, timeout, host, event_handler, cancel_event=None):
+	"""
+	流式执行命令：输出到达即按行回调 event_handler，返回 (stdout 尾部, stderr 尾部, rc)。
+	"""
+	out = _LineCollector("stdout", host, event_handler)
+	err = _LineCollector("stderr", host, event_handler)
+	rc = _run_channel(chan, command, timeout, out.feed, err.feed, cancel_event)
+	out.close()
+	err.close()
+	return out.text(), err.text(), rc
+
+
+def run_native_with_context(user_context, config_context, task_context, event_handler=None):
+	"""
+	通过原生 SSH 引擎执行 Linux 命令，返回与 run_ansible_with_context 相同的统一结构。
+	:param user_context: RemoteCallContext 用户上下文
+	:param config_context: ansible 配置上下文
+	:param task_context: AnsibleTaskContext 任务上下文（仅使用其推断出的 module/args）
+	:param event_handler: 输出事件回调（可选），提供时逐行推送输出，结果中仅保留输出尾部
+	:return: dict 统一结构 {status, data, error, all_results, target, raw, scheduler}
+	"""
+	command = task_context.module_args
+	timeout = user_context.timeout or config_context.native_command_timeout
+
+	key_cleanup = None
+	try:
+		if user_context.is_use_bastion() and not user_context.is_password_auth():
+			# 目标主机密钥认证需先准备堡垒机私钥（启用缓存时为共享副本，否则为本次请求的临时文件）
+			with stage("key_fetch"):
+				key_cleanup = fetch_bastion_key(user_context, config_context)
+
+		# 与 ansible 引擎共用调度器的并发上限（direct-tcpip 通道同样占用堡垒机会话）
+		with execution_scheduler.slot(
+			config_context,
+			[user_context.get_target_addr()],
+			user_context.get_erp(),
+			execution_id=user_context.get_uuid(),
+			bastion=config_context.bastion_ip if user_context.is_use_bastion() else None
+		) as slot:
+			start = datetime.now()
+			with _open_channel(user_context, config_context) as chan, stage("remote_exec"):
+				if event_handler:
+					out, err, rc = _exec_streaming(
+						chan, command, timeout, user_context.ip, event_handler, slot.cancel_event
+					)
+				else:
+					out, err, rc = _exec(chan, command, timeout, slot.cancel_event)
+			end = datetime.now()
+	except SchedulerTimeout as e:
+		return {"status": "error", "data": None, "error": str(e), "raw": None, "scheduler": e.info}
+	except Exception as e:
+		logger.error(f"Native SSH execution failed: {e}")
+		native_ssh_pool.discard(user_context)
+		return {"status": "error", "data": None, "error": str(e), "raw": None}
+	finally:
+		if key_cleanup:
+			# 未启用私钥缓存时删除本次请求的临时私钥（连接已建立，池中连接不再需要私钥文件）
+			key_cleanup()
+
+	res = {
+		"cmd": command,
+		"stdout": out.rstrip("\n"),
+		"stderr": err.rstrip("\n"),
+		"rc": rc,
+		"start": str(start),
+		"end": str(end),
+		"delta": str(end - start),
+		"changed": True,
+		"msg": "" if rc == 0 else "non-zero return code",
+	}
+	result_item = {
+		"host": user_context.ip,
+		"stdout": res["stdout"],
+		"stderr": res["stderr"],
+		"rc": rc,
+		"msg": res["msg"],
+	}
+	if rc == 0:
+		result_item["changed"] = True
+		error = None
+	else:
+		result_item["failed"] = True
+		error = res
+	return {
+		"status": "error" if error else "success",
+		"data": result_item,
+		"error": error,
+		"all_results": [{
+			"task": f"{task_context.module}:{command}",
+			"focus": True,
+			"result": [result_item]
+		}],
+		"target": {"host": user_context.ip, "task_action": task_context.module, "engine": "native", "res": res},
+		"raw": None,
+		"scheduler": slot.info()
+	}
+
+
+def run_native_commands(user_context, config_context):
+	"""
+	在同一条复用的 SSH 连接上顺序执行多条命令（user_context.command 为列表）。
+	:return: (results, error)
+		results: 每条命令的结果 [{command, host, stdout, stderr, rc, start, end, duration, failed/skipped}]
+		error: 整体执行异常信息（如连接失败），无则为 None
+	"""
+	timeout = user_context.timeout or config_context.native_command_timeout
+	results = []
+	key_cleanup = None
+	try:
+		if user_context.is_use_bastion() and not user_context.is_password_auth():
+			with stage("key_fetch"):
+				key_cleanup = fetch_bastion_key(user_context, config_context)
+
+		with execution_scheduler.slot(
+			config_context,
+			[user_context.get_target_addr()],
+			user_context.get_erp(),
+			execution_id=user_context.get_uuid(),
+			bastion=config_context.bastion_ip if user_context.is_use_bastion() else None
+		) as slot:
+			stop = False
+			for command in user_context.command:
+				if stop:
+					results.append({"command": command, "host": user_context.ip, "skipped": True})
+					continue
+				start = datetime.now()
+				with _open_channel(user_context, config_context) as chan, stage("remote_exec"):
+					out, err, rc = _exec(chan, command, timeout, slot.cancel_event)
+				end = datetime.now()
+				item = {
+					"command": command,
+					"host": user_context.ip,
+					"stdout": out.rstrip("\n"),
+					"stderr": err.rstrip("\n"),
+					"rc": rc,
+					"start": str(start),
+					"end": str(end),
+					"duration": (end - start).total_seconds(),
+				}
+				if rc != 0:
+					item["failed"] = True
+					stop = not user_context.continue_on_error
+				results.append(item)
+	except Exception as e:
+		logger.error(f"Native SSH execution failed: {e}")
+		native_ssh_pool.discard(user_context)
+		return results, str(e)
+	finally:
+		if key_cleanup:
+			key_cleanup()
+	return results, None
+
+
+def use_native_engine(user_context, config_context) -> bool:
+	"""
+	判断当前请求是否走原生 SSH 引擎：请求参数 engine 优先，其次为配置 EXECUTION_ENGINE。
+	仅 Linux 命令模式支持原生引擎，其余场景回退到 ansible。
+	"""
+	engine = user_context.engine or config_context.execution_engine
+	return engine == "native" and user_context.is_linux() and user_context.is_command_mode()
+
+
+# 进程级单例
+native_ssh_pool = NativeSSHPool()
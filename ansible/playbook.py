@@ -6,7 +6,7 @@
 from typing import Tuple, Callable, List
 from remote_call.context import RemoteCallContext
 from ansible.config import AnsibleConfig
-from remote_call.utils import write_temp_file
+from remote_call.utils import write_cached_file, redact_text
 import logging
 import yaml
 
@@ -19,6 +19,9 @@ def generate_playbook(
 ) -> Tuple[str, Callable]:
     """
     动态生成 ansible playbook 内容并写入临时文件。
+    - H3C：命令封装为 raw 任务
+    - Windows 脚本：拷贝、执行、清理三步合并为一个 playbook
+    - 多命令（Linux/Windows/H3C）：每条命令一个任务，同一次运行内顺序执行
 
     Args:
         group_name (str): 主机分组名，对应 inventory 的 group。
@@ -33,23 +36,129 @@ def generate_playbook(
     # 获取主机分组名
     group_name = user_ctx.get_group_name()
 
+    if user_ctx.is_windows() and user_ctx.is_script_mode():
+        play = _windows_script_play(group_name, user_ctx.file_path)
+        return _write_playbook([play], ansible_cfg)
+
+    if user_ctx.is_multi_command():
+        play = _commands_play(group_name, user_ctx)
+        return _write_playbook([play], ansible_cfg)
+
     play = {
         'hosts': group_name,
         'gather_facts': False,
         'tasks': [
             {
                 'name': '执行 H3C 命令（raw）',
-                'raw': (
-                    user_ctx.command if isinstance(user_ctx.command, str)
-                    else ' && '.join(user_ctx.command) if hasattr(user_ctx, 'command') and isinstance(user_ctx.command, (list, tuple))
-                    else ''
-                )
+                'raw': user_ctx.command or '',
+                'failed_when': H3C_FAILED_WHEN
+            }
+        ]
+    }
+    return _write_playbook([play], ansible_cfg)
+
+
+# H3C 设备 raw 执行的退出码不反映命令结果，以输出中的 Comware 错误提示（"% " 开头的行）判定失败
+H3C_FAILED_WHEN = "stdout is search('^ *% [^ ]', multiline=True)"
+
+
+def get_commands_module(user_ctx: 'RemoteCallContext') -> str:
+    """
+    多命令模式下每条命令使用的模块：Windows 为 win_shell，H3C 为 raw，其余为 shell。
+    """
+    if user_ctx.is_windows():
+        return "win_shell"
+    if user_ctx.is_h3c():
+        return "raw"
+    return "shell"
+
+
+# Windows 脚本在目标机上的临时路径
+WINDOWS_SCRIPT_REMOTE_PATH = "C:\\Windows\\Temp\\script.ps1"
+
+
+def get_windows_script_steps(file_path: str) -> List[dict]:
+    """
+    Windows 脚本执行的三个步骤：拷贝脚本、执行、清理。
+    任务名即步骤描述（module:args），用于从 playbook 事件中拆分出各步骤结果。
+
+    Returns:
+        list[dict]: [{"task", "module", "args", "focus"}]
+    """
+    steps = [
+        ("win_copy", f"src={file_path} dest={WINDOWS_SCRIPT_REMOTE_PATH}", False),
+        ("win_shell", WINDOWS_SCRIPT_REMOTE_PATH, True),
+        ("win_file", f"path={WINDOWS_SCRIPT_REMOTE_PATH} state=absent", False),
+    ]
+    return [
+        {"task": f"{module}:{args}", "module": module, "args": args, "focus": focus}
+        for module, args, focus in steps
+    ]
+
+
+def _windows_script_play(group_name: str, file_path: str) -> dict:
+    """
+    将 Windows 脚本三步任务编排为单个 play，在同一次运行、同一个 WinRM 连接中完成；
+    清理步骤放在 always 中，脚本执行失败时同样会删除远程脚本。
+    """
+    copy_step, shell_step, cleanup_step = [
+        {'name': step['task'], step['module']: step['args']}
+        for step in get_windows_script_steps(file_path)
+    ]
+    return {
+        'hosts': group_name,
+        'gather_facts': False,
+        'tasks': [
+            {
+                'block': [copy_step, shell_step],
+                'always': [cleanup_step]
             }
         ]
     }
-    playbook = [play]
+
+
+def get_command_steps(module: str, commands: List[str]) -> List[dict]:
+    """
+    多命令模式的步骤列表，每条命令一个步骤。
+    任务名带序号以保证唯一（相同命令可重复出现），task 为 all_results 中的步骤描述。
+
+    Returns:
+        list[dict]: [{"task", "name", "module", "command", "focus"}]
+    """
+    return [
+        {
+            "task": f"{module}:{command}",
+            "name": f"[{index}] {module}:{command}",
+            "module": module,
+            "command": command,
+            "focus": False,
+        }
+        for index, command in enumerate(commands)
+    ]
+
+
+def _commands_play(group_name: str, user_ctx: 'RemoteCallContext') -> dict:
+    """
+    多命令 play：每条命令一个任务，continue_on_error 时失败不中断后续命令。
+    """
+    module = get_commands_module(user_ctx)
+    tasks = []
+    for step in get_command_steps(module, user_ctx.command):
+        task = {'name': step['name'], module: step['command']}
+        if user_ctx.is_h3c():
+            task['failed_when'] = H3C_FAILED_WHEN
+        if user_ctx.continue_on_error:
+            task['ignore_errors'] = True
+        tasks.append(task)
+    return {
+        'hosts': group_name,
+        'gather_facts': False,
+        'tasks': tasks
+    }
+
+
+def _write_playbook(playbook: list, ansible_cfg: 'AnsibleConfig') -> Tuple[str, Callable]:
     content = yaml.dump(playbook, allow_unicode=True, sort_keys=False)
-    logger.info("[Playbook Content]:\n%s", content)
-    file_path, close_func, cleanup_func = write_temp_file(content, suffix=".yml")
-    close_func()
-    return file_path, cleanup_func
\ No newline at end of file
+    logger.info("[Playbook Content]:\n%s", redact_text(content))
+    # 按内容哈希写入运行时缓存目录，相同 playbook 直接复用
+    return write_cached_file(content, suffix=".yml", dir=ansible_cfg.runtime_dir, ttl=ansible_cfg.runtime_cache_ttl)
\ No newline at end of file
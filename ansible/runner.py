@@ -3,8 +3,14 @@ ansible_runner 相关的上下文模型与执行封装。
 本模块主要负责根据用户上下文和配置上下文，推断 Ansible 执行类型、模块、参数，并封装任务链的生成与执行。
 """
 
-import ansible_runner
+import time
 from ansible.utils import fetch_bastion_key,extract_ansible_events
+from ansible.scheduler import execution_scheduler, run_with_cancel, SchedulerTimeout
+from ansible.artifacts import artifact_manager
+from ansible.multiplex import get_ssh_env_args
+from ansible.warm_pool import warm_ansible_pool
+from ansible.playbook import get_windows_script_steps, get_command_steps, get_commands_module
+from remote_call.metrics import stage
 
 class AnsibleTaskContext:
     """
@@ -99,18 +105,36 @@ class AnsibleTaskContext:
         判断当前上下文是否存在错误。
         """
         return self.error is not None
+
+    def needs_playbook(self):
+        """
+        判断任务链是否需要 playbook：仅 H3C 与 Windows 脚本模式使用 playbook，其余为 ad-hoc 模块调用。
+        """
+        return self.user_context.is_h3c() or self.user_context.is_multi_command() or (
+            self.user_context.is_windows() and self.user_context.is_script_mode()
+        )
     
     def get_task_chain(self, inventory_path,playbook_path=None):
         """
         根据上下文生成 ansible 任务链：
         - Linux 命令/脚本：单步任务
         - Windows 命令：单步任务
-        - Windows 脚本：三步任务链（win_copy, win_shell, win_file）
+        - Windows 脚本：单个 playbook，内含 win_copy, win_shell, win_file 三步
+        - 多命令（Linux/Windows/H3C）：单个 playbook，每条命令一步
         :param inventory_path: ansible inventory 路径
         :param playbook_path: ansible playbook 路径
         :return: list[dict] 任务链
         """
-        if self.user_context.is_linux():
+        if self.user_context.is_multi_command():
+            # 多命令：每条命令一个 playbook 任务，一次运行、一个连接内顺序执行，按任务拆分各命令结果
+            return [{
+                "inventory": inventory_path,
+                "host_pattern": self.host_pattern,
+                "playbook": playbook_path,
+                "steps": get_command_steps(get_commands_module(self.user_context), self.module_args),
+                "focus": False
+            }]
+        elif self.user_context.is_linux():
             # Linux 命令或脚本均为单步
             return [{
                 "inventory": inventory_path,
@@ -130,31 +154,15 @@ class AnsibleTaskContext:
                     "focus": True
                 }]
             elif self.user_context.is_script_mode():
-                # Windows 脚本为三步：先拷贝脚本，再执行，最后清理
-                remote_path = "C:\\Windows\\Temp\\script.ps1"
-                return [
-                    {
-                        "inventory": inventory_path,
-                        "host_pattern": self.host_pattern,
-                        "module": "win_copy",
-                        "args": f"src={self.module_args} dest={remote_path}",
-                        "focus": False
-                    },
-                    {
-                        "inventory": inventory_path,
-                        "host_pattern": self.host_pattern,
-                        "module": "win_shell",
-                        "args": remote_path,
-                        "focus": True
-                    },
-                    {
-                        "inventory": inventory_path,
-                        "host_pattern": self.host_pattern,
-                        "module": "win_file",
-                        "args": f"path={remote_path} state=absent",
-                        "focus": False
-                    }
-                ]
+                # Windows 脚本：拷贝、执行、清理三步合并为一个 playbook，单次运行、单个 WinRM 连接完成，
+                # steps 用于将 playbook 事件拆回各步骤结果，all_results 结构与分步执行时一致
+                return [{
+                    "inventory": inventory_path,
+                    "host_pattern": self.host_pattern,
+                    "playbook": playbook_path,
+                    "steps": get_windows_script_steps(self.module_args),
+                    "focus": True
+                }]
         elif self.user_context.is_h3c():
             # H3C 设备，返回 playbook 模式任务描述
             return [{
@@ -174,82 +182,150 @@ class AnsibleTaskContext:
         }]
 
 
-def run_ansible_with_context(user_context, config_context, task_context, inventory_path, playbook_path):
+def get_task_label(task):
+    """
+    任务链步骤的描述文本：模块任务为 module:args，playbook 任务为 playbook:路径。
+    """
+    if task.get("playbook"):
+        return f"playbook:{task['playbook']}"
+    return f"{task['module']}:{task['args']}"
+
+
+def run_ansible_with_context(user_context, config_context, task_context, inventory_path, playbook_path, forks=None, progress_callback=None, event_handler=None, targets=None):
     """
     执行 ansible_runner.run 并处理结果，返回统一结构。
     :param user_context: RemoteCallContext 用户上下文
     :param config_context: ansible 配置上下文
     :param task_context: AnsibleTaskContext 任务上下文
     :param inventory_path: inventory 文件路径
-    :return: dict 统一结构 {status, data, error, all_results, target, raw}
+    :param forks: 多主机 inventory 时的并行数（可选，默认取 ansible 配置）
+    :param progress_callback: 进度回调 (index, total, task, state)，每步开始/结束时调用（可选）
+    :param event_handler: ansible_runner 事件回调（可选），事件产生时即被调用，用于流式输出
+    :param targets: 调度器按目标限流使用的主机标识列表（可选，默认为当前目标 ip:port）
+    :return: dict 统一结构 {status, data, error, all_results, target, raw, scheduler}，scheduler 为排队信息 {queue_depth, wait_time}
     """
 
-    if user_context.is_use_bastion():
-        # 若使用堡垒机，先准备密钥，返回 cleanup 回调
-        cleanup = fetch_bastion_key(user_context, config_context)
-
+    cleanup = None
     task_chain = task_context.get_task_chain(inventory_path,playbook_path)
     all_results = []  # 所有任务的结果
     focus_result = None  # 主任务的结果
     error = None
     target = None  # event_data
+    timeout = user_context.timeout or config_context.default_timeout
+    deadline = time.monotonic() + timeout
     try:
-        for task in task_chain:
-            # 执行每个任务（支持多步任务链）
-            if user_context.is_h3c():
-                r = ansible_runner.run(
-                    private_data_dir=config_context.working_dir,
-                    inventory=task["inventory"],
-                    playbook=task['playbook'],
-                    quiet=True,
-                    envvars={
-                        "ANSIBLE_SSH_ARGS": "-o ControlMaster=no -o ControlPath=none",
-                        "ANSIBLE_HOST_KEY_CHECKING": "False"
-                    }
-                )
-            else:
-                r = ansible_runner.run(
-                    private_data_dir=config_context.working_dir,
-                    inventory=task["inventory"],
-                    host_pattern=task["host_pattern"],
-                    module=task["module"],
-                    module_args=task["args"],
-                    quiet=True,
-                    envvars={
-                        "ANSIBLE_SSH_ARGS": "-o ControlMaster=no -o ControlPath=none"
-                    }
-                )
-            # 解析 ansible 执行事件，提取结果、错误、事件数据
-            results, task_error, event_data = extract_ansible_events(r)
-            all_results.append({
-                "task": f"{task['module']}:{task['args']}",
-                "focus": task.get("focus", False),
-                "result": results
-            })
-            # 聚焦主任务输出和 event_data
-            if task.get("focus", False):
-                # 只聚焦第一个主机的结果（字典），无论单主机还是多主机
-                if isinstance(results, list) and results:
-                    focus_result = results[0]
+        if user_context.is_use_bastion():
+            # 若使用堡垒机，先准备密钥，返回 cleanup 回调；拉取失败作为错误结果返回，由服务层判断是否切换堡垒机
+            with stage("key_fetch"):
+                cleanup = fetch_bastion_key(user_context, config_context)
+
+        # 先在调度器中获取执行槽位（全局/堡垒机/目标/用户并发上限），整条任务链共用一个槽位；
+        # 每次执行使用独立的 private_data_dir，产物由 artifact_manager 统一回收
+        with execution_scheduler.slot(
+            config_context,
+            targets or [user_context.get_target_addr()],
+            user_context.get_erp(),
+            execution_id=user_context.get_uuid(),
+            bastion=config_context.bastion_ip if user_context.is_use_bastion() else None,
+            forks=forks
+        ) as slot, artifact_manager.job_dir(config_context, user_context.get_uuid()) as private_data_dir:
+            cancel_event = slot.cancel_event
+            warm_envvars = warm_ansible_pool.envvars(config_context)
+            # 进度按步骤计：playbook 内含多个步骤时逐一计数
+            step_total = sum(len(task.get("steps") or [task]) for task in task_chain)
+            step_index = 0
+            for task in task_chain:
+                # 执行每个任务（支持多步任务链）
+                if progress_callback:
+                    progress_callback(step_index, step_total, get_task_label(task), "running")
+                if task.get("playbook"):
+                    if user_context.is_h3c():
+                        envvars = {
+                            "ANSIBLE_SSH_ARGS": "-o ControlMaster=no -o ControlPath=none",
+                            "ANSIBLE_HOST_KEY_CHECKING": "False"
+                        }
+                    else:
+                        envvars = {"ANSIBLE_SSH_ARGS": get_ssh_env_args(config_context)}
+                    # 启用预热进程池时经 shim 交由常驻 ansible 进程执行
+                    envvars.update(warm_envvars)
+                    with stage("runner_run"):
+                        r = run_with_cancel(
+                            cancel_event,
+                            deadline - time.monotonic(),
+                            private_data_dir=private_data_dir,
+                            inventory=task["inventory"],
+                            playbook=task['playbook'],
+                            forks=forks,
+                            event_handler=event_handler,
+                            quiet=True,
+                            envvars=envvars
+                        )
                 else:
-                    focus_result = results
-                target = event_data
-            # 只保留第一个错误
-            if task_error and not error:
-                error = task_error
-        status = "error" if error else "success"
-        return {
-            "status": status,
-            "data": focus_result,
-            "error": error,
-            "all_results": all_results,
-            "target": target,
-            "raw": None
-        }
+                    with stage("runner_run"):
+                        r = run_with_cancel(
+                            cancel_event,
+                            deadline - time.monotonic(),
+                            private_data_dir=private_data_dir,
+                            inventory=task["inventory"],
+                            host_pattern=task["host_pattern"],
+                            module=task["module"],
+                            module_args=task["args"],
+                            forks=forks,
+                            event_handler=event_handler,
+                            quiet=True,
+                            envvars={
+                                "ANSIBLE_SSH_ARGS": get_ssh_env_args(config_context),
+                                **warm_envvars
+                            }
+                        )
+                if r.status == "canceled":
+                    # 被取消或超时：终止剩余任务链，释放槽位
+                    reason = "执行已取消" if cancel_event.is_set() else f"执行超时（{timeout}s），已终止"
+                    return {"status": "error", "data": focus_result, "error": reason, "all_results": all_results, "target": target, "raw": None, "scheduler": slot.info()}
+
+                # playbook 内含多个步骤时按任务名拆分事件，否则整个运行即为一个步骤
+                steps = task.get("steps") or [{"task": get_task_label(task), "focus": task.get("focus", False)}]
+                for step in steps:
+                    # 解析 ansible 执行事件，提取结果、错误、事件数据
+                    with stage("extract_events"):
+                        results, task_error, event_data = extract_ansible_events(
+                            r, task_name=step.get("name", step["task"]) if task.get("steps") else None
+                        )
+                    all_results.append({
+                        "task": step["task"],
+                        "focus": step.get("focus", False),
+                        "result": results
+                    })
+                    if progress_callback:
+                        progress_callback(step_index, step_total, step["task"], "error" if task_error else "success")
+                    step_index += 1
+                    # 聚焦主任务输出和 event_data
+                    if step.get("focus", False):
+                        # 只聚焦第一个主机的结果（字典），无论单主机还是多主机
+                        if isinstance(results, list) and results:
+                            focus_result = results[0]
+                        else:
+                            focus_result = results
+                        target = event_data
+                    # 只保留第一个错误
+                    if task_error and not error:
+                        error = task_error
+            status = "error" if error else "success"
+            return {
+                "status": status,
+                "data": focus_result,
+                "error": error,
+                "all_results": all_results,
+                "target": target,
+                "raw": None,
+                "scheduler": slot.info()
+            }
+    except SchedulerTimeout as e:
+        return {"status": "error", "data": None, "error": str(e), "raw": None, "scheduler": e.info}
     except Exception as e:
         # 捕获所有异常，返回 error 状态
         return {"status": "error", "data": None, "error": str(e), "raw": None}
     finally:
-        if user_context.is_use_bastion():
+        if cleanup:
             # 清理堡垒机密钥
             cleanup()
\ No newline at end of file
@@ -0,0 +1,338 @@
+"""
+ansible 执行调度器。
+所有 ansible_runner 执行都需先在调度器中获取执行槽位：全局并发上限 + 每堡垒机会话上限 + 每目标主机上限
++ 每 ERP 用户上限，同一堡垒机/目标/用户的等待者按到达顺序排队。堡垒机 sshd 的 MaxStartups/MaxSessions
+是实际瓶颈，超出上限的请求在本地排队而不是让堡垒机拒绝连接；排队深度与等待时间随结果返回。执行基于 ansible_runner.run_async，
+通过 cancel_callback 支持主动取消与单请求超时，挂起的目标不会无限占用槽位；排队中的请求被取消时直接出队。
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import ansible_runner
+
+from remote_call.metrics import observe_stage
+
+logger = logging.getLogger('django')
+
+
+class SchedulerTimeout(Exception):
+	"""
+	排队等待执行槽位超时。info 为排队信息 {queue_depth, wait_time}。
+	"""
+
+	def __init__(self, message, info=None):
+		super().__init__(message)
+		self.info = info or {}
+
+
+class ExecutionCanceled(Exception):
+	"""
+	请求在排队等待执行槽位期间被 cancel() 取消。
+	"""
+
+
+class _Ticket:
+	"""
+	排队中的执行请求。
+	"""
+
+	def __init__(self, seq, targets, user, bastion=None, bastion_sessions=0):
+		self.seq = seq
+		self.targets = targets
+		self.user = user
+		self.bastion = bastion
+		self.bastion_sessions = bastion_sessions
+		self.waker = None  # 异步等待者的唤醒回调（线程安全）
+
+
+class Slot:
+	"""
+	已获得的执行槽位。
+	- cancel_event: 被 set 时表示执行已被取消
+	- queue_depth: 入队时排在前面的等待者数量
+	- wait_time: 排队等待时长（秒）
+	"""
+
+	def __init__(self, cancel_event, queue_depth, wait_time):
+		self.cancel_event = cancel_event
+		self.queue_depth = queue_depth
+		self.wait_time = wait_time
+
+	def info(self) -> dict:
+		return {"queue_depth": self.queue_depth, "wait_time": round(self.wait_time, 3)}
+
+
+class ExecutionScheduler:
+	"""
+	执行槽位调度器。
+	- 槽位可用条件：全局、所经堡垒机、每个目标主机、所属用户均未达上限；
+	- 堡垒机按会话数计：单目标请求占 1 个会话，批量请求占 min(主机数, forks) 个会话（不超过堡垒机上限）；
+	- 等待队列按到达顺序扫描，第一个满足条件的请求获得槽位（目标/用户维度天然 FIFO，
+	  且繁忙目标不会阻塞其他目标的请求）；
+	- 请求按 execution_id 登记取消事件，cancel() 后排队中的请求抛出 ExecutionCanceled 出队，
+	  执行中的请求由 cancel_callback 终止 ansible 进程（原生引擎在读取输出时检查并关闭通道）；
+	- cancel_scope() 可在获取槽位之前登记取消事件（如异步任务的整个执行过程），范围内的 slot() 共用该事件。
+	"""
+
+	def __init__(self):
+		self._cond = threading.Condition()
+		self._seq = itertools.count()
+		self._waiting = []  # 按到达顺序排列的 _Ticket
+		self._running = 0
+		self._by_target = {}
+		self._by_user = {}
+		self._by_bastion = {}  # 堡垒机 -> 占用的会话数
+		self._cancel_events = {}  # execution_id -> threading.Event
+
+	@contextmanager
+	def slot(self, config_context, targets, user, execution_id=None, bastion=None, forks=None):
+		"""
+		获取执行槽位的上下文管理器，退出时释放。
+		:param config_context: AnsibleConfig，提供各级并发上限与排队超时
+		:param targets: 本次执行涉及的目标主机标识列表（如 ip:port）
+		:param user: ERP 用户
+		:param execution_id: 执行标识（可选），用于 cancel()
+		:param bastion: 经由的堡垒机标识（可选，直连目标时为 None，不占堡垒机会话）
+		:param forks: 批量执行的并行数（可选），用于估算占用的堡垒机会话数
+		:return: Slot，包含取消事件与排队信息
+		"""
+		ticket = self._new_ticket(config_context, targets, user, bastion, forks)
+		start = time.monotonic()
+		deadline = start + config_context.scheduler_queue_timeout
+		with self._cond:
+			cancel_event, owned = self._register_cancel(execution_id)
+			queue_depth = len(self._waiting)
+			self._waiting.append(ticket)
+			try:
+				while not self._is_next(ticket, config_context):
+					if cancel_event.is_set():
+						raise ExecutionCanceled("执行已取消")
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						observe_stage("queue_wait", time.monotonic() - start)
+						raise SchedulerTimeout(
+							f"执行队列等待超时（{config_context.scheduler_queue_timeout}s），请稍后重试",
+							info={"queue_depth": queue_depth, "wait_time": round(time.monotonic() - start, 3)}
+						)
+					self._cond.wait(remaining)
+			except BaseException:
+				self._unregister_cancel(execution_id, owned)
+				raise
+			finally:
+				self._waiting.remove(ticket)
+				# 队列变化后唤醒其他等待者重新判断
+				self._notify_all()
+			self._acquire(ticket)
+
+		try:
+			slot = Slot(cancel_event, queue_depth, time.monotonic() - start)
+			observe_stage("queue_wait", slot.wait_time)
+			yield slot
+		finally:
+			with self._cond:
+				self._release(ticket)
+				self._unregister_cancel(execution_id, owned)
+				self._notify_all()
+
+	@asynccontextmanager
+	async def aslot(self, config_context, targets, user, execution_id=None, bastion=None, forks=None):
+		"""
+		slot() 的异步版本，供 ASGI 异步视图使用：排队期间在事件循环中等待，不占用线程。
+		与同步请求共用同一套计数与等待队列，参数与返回值同 slot()。
+		"""
+		loop = asyncio.get_running_loop()
+		ticket = self._new_ticket(config_context, targets, user, bastion, forks)
+		start = time.monotonic()
+		deadline = start + config_context.scheduler_queue_timeout
+		with self._cond:
+			cancel_event, owned = self._register_cancel(execution_id)
+			queue_depth = len(self._waiting)
+			self._waiting.append(ticket)
+		try:
+			while True:
+				with self._cond:
+					if self._is_next(ticket, config_context):
+						self._waiting.remove(ticket)
+						self._notify_all()
+						self._acquire(ticket)
+						break
+					if cancel_event.is_set():
+						raise ExecutionCanceled("执行已取消")
+					woken = loop.create_future()
+					ticket.waker = lambda: loop.call_soon_threadsafe(_resolve, woken)
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					observe_stage("queue_wait", time.monotonic() - start)
+					raise SchedulerTimeout(
+						f"执行队列等待超时（{config_context.scheduler_queue_timeout}s），请稍后重试",
+						info={"queue_depth": queue_depth, "wait_time": round(time.monotonic() - start, 3)}
+					)
+				try:
+					await asyncio.wait_for(woken, remaining)
+				except asyncio.TimeoutError:
+					pass
+		except BaseException:
+			with self._cond:
+				self._unregister_cancel(execution_id, owned)
+				if ticket in self._waiting:
+					self._waiting.remove(ticket)
+					self._notify_all()
+			raise
+
+		try:
+			slot = Slot(cancel_event, queue_depth, time.monotonic() - start)
+			observe_stage("queue_wait", slot.wait_time)
+			yield slot
+		finally:
+			with self._cond:
+				self._release(ticket)
+				self._unregister_cancel(execution_id, owned)
+				self._notify_all()
+
+	@contextmanager
+	def cancel_scope(self, execution_id):
+		"""
+		在获取槽位之前登记 execution_id 的取消事件，范围内以该 execution_id 获取的槽位共用此事件。
+		:return: 取消事件
+		"""
+		with self._cond:
+			cancel_event, owned = self._register_cancel(execution_id)
+		try:
+			yield cancel_event
+		finally:
+			with self._cond:
+				self._unregister_cancel(execution_id, owned)
+
+	def cancel(self, execution_id) -> bool:
+		"""
+		取消排队中或执行中的请求。
+		:return: 找到并标记取消返回 True，否则 False
+		"""
+		with self._cond:
+			cancel_event = self._cancel_events.get(execution_id)
+			if cancel_event is None:
+				return False
+			cancel_event.set()
+			# 唤醒排队中的请求，使其立即出队
+			self._notify_all()
+		return True
+
+	def stats(self) -> dict:
+		with self._cond:
+			return {
+				"running": self._running,
+				"waiting": len(self._waiting),
+				"bastion_sessions": dict(self._by_bastion),
+			}
+
+	def _register_cancel(self, execution_id):
+		"""
+		取得 execution_id 的取消事件，尚未登记时新建并登记（调用方需持有锁）。
+		:return: (取消事件, 是否由本次调用登记)
+		"""
+		if not execution_id:
+			return threading.Event(), False
+		cancel_event = self._cancel_events.get(execution_id)
+		if cancel_event is not None:
+			return cancel_event, False
+		cancel_event = self._cancel_events[execution_id] = threading.Event()
+		return cancel_event, True
+
+	def _unregister_cancel(self, execution_id, owned):
+		if owned:
+			self._cancel_events.pop(execution_id, None)
+
+	def _new_ticket(self, config_context, targets, user, bastion, forks):
+		targets = list(targets)
+		sessions = 0
+		if bastion:
+			sessions = max(1, min(len(targets), forks or len(targets), config_context.scheduler_max_per_bastion))
+		return _Ticket(next(self._seq), targets, user, bastion, sessions)
+
+	def _notify_all(self):
+		"""
+		唤醒所有同步与异步等待者重新判断（调用方需持有锁）。
+		"""
+		self._cond.notify_all()
+		for waiting in self._waiting:
+			if waiting.waker is not None:
+				waiting.waker()
+				waiting.waker = None
+
+	def _fits(self, ticket, config_context) -> bool:
+		if self._running >= config_context.scheduler_max_concurrent:
+			return False
+		if self._by_user.get(ticket.user, 0) >= config_context.scheduler_max_per_user:
+			return False
+		if ticket.bastion and (
+			self._by_bastion.get(ticket.bastion, 0) + ticket.bastion_sessions > config_context.scheduler_max_per_bastion
+		):
+			return False
+		return all(
+			self._by_target.get(t, 0) < config_context.scheduler_max_per_target for t in ticket.targets
+		)
+
+	def _is_next(self, ticket, config_context) -> bool:
+		"""
+		ticket 是否为等待队列中第一个可以获得槽位的请求（调用方需持有锁）。
+		"""
+		for waiting in self._waiting:
+			if self._fits(waiting, config_context):
+				return waiting is ticket
+			if waiting is ticket:
+				return False
+		return False
+
+	def _acquire(self, ticket):
+		self._running += 1
+		self._by_user[ticket.user] = self._by_user.get(ticket.user, 0) + 1
+		if ticket.bastion:
+			self._by_bastion[ticket.bastion] = self._by_bastion.get(ticket.bastion, 0) + ticket.bastion_sessions
+		for t in ticket.targets:
+			self._by_target[t] = self._by_target.get(t, 0) + 1
+
+	def _release(self, ticket):
+		self._running -= 1
+		_decrement(self._by_user, ticket.user)
+		if ticket.bastion:
+			_decrement(self._by_bastion, ticket.bastion, ticket.bastion_sessions)
+		for t in ticket.targets:
+			_decrement(self._by_target, t)
+
+
+def _resolve(future):
+	if not future.done():
+		future.set_result(None)
+
+
+def _decrement(counter, key, amount=1):
+	counter[key] -= amount
+	if counter[key] <= 0:
+		counter.pop(key, None)
+
+
+def run_with_cancel(cancel_event, timeout, **runner_kwargs):
+	"""
+	以 ansible_runner.run_async 执行，并通过 cancel_callback 实现取消与超时。
+	:param cancel_event: 调度器槽位返回的取消事件
+	:param timeout: 本次执行超时（秒）
+	:param runner_kwargs: 透传给 ansible_runner.run_async 的参数
+	:return: ansible_runner.Runner，status 为 canceled 时可通过 cancel_event 区分取消与超时
+	"""
+	deadline = time.monotonic() + timeout
+
+	def cancel_callback():
+		return cancel_event.is_set() or time.monotonic() > deadline
+
+	thread, r = ansible_runner.run_async(cancel_callback=cancel_callback, **runner_kwargs)
+	thread.join()
+	return r
+
+
+# 进程级单例
+execution_scheduler = ExecutionScheduler()
@@ -1,6 +1,8 @@
 import paramiko
 import os
 import logging
+from ansible.key_cache import bastion_key_cache
+from ansible.bastion import bastion_pool, is_bastion_unreachable
 
 logger = logging.getLogger('django')
 
@@ -18,7 +20,13 @@ def fetch_bastion_key(user_context, config_context):
 		2. 通过 SFTP 拉取堡垒机上的目标私钥到本地临时路径
 		3. 修改本地密钥权限为 600
 		4. 返回一个 cleanup 回调用于后续清理本地密钥
+	启用私钥缓存（key_cache_ttl > 0）时改由 bastion_key_cache 统一管理本地副本，
+	cleanup 为空操作，副本在请求间共享。
 	"""
+	if config_context.key_cache_ttl > 0:
+		bastion_key_cache.get(config_context)
+		return lambda: None
+
 	ssh = paramiko.SSHClient()
 	ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())  # 自动接受未知主机密钥
 	
@@ -26,11 +34,14 @@ def fetch_bastion_key(user_context, config_context):
 	try:
 		ssh.connect(
 			hostname=config_context.bastion_ip,
+			port=config_context.bastion_port,
             username=config_context.bastion_user,
             key_filename=config_context.jump_private_key
         )
 	except Exception as e:
 		logger.error(f"Failed to connect to bastion: {e}")
+		if is_bastion_unreachable(e):
+			bastion_pool.report_unreachable(config_context, e)
 		raise
 
     # 从堡垒机拉取目标私钥到本地临时路径
@@ -63,14 +74,15 @@ def fetch_bastion_key(user_context, config_context):
 	return cleanup
 
 
-def extract_ansible_events(r):
+def extract_ansible_events(r, task_name=None):
 	"""
 	提取 ansible_runner 事件，按主机聚合输出和错误信息。
     
 	参数：
 		r: ansible_runner 的结果对象，需包含 events 属性（事件列表）
+		task_name: 仅聚合指定 playbook 任务名的事件（可选，用于将单个 playbook 拆分为多个步骤结果）
 	返回：
-		results: 按主机聚合的输出结果列表，每项包含主机、stdout、stderr、rc、msg、changed/failed 等
+		results: 按主机聚合的输出结果列表，每项包含主机、stdout、stderr、rc、msg、changed/failed 及 start/end/duration 等
 		error: 首个失败/不可达事件的 res 字典（如有）
 		focus_event_data: 第一个 runner_on_ok 事件的 event_data（主任务目标）
 	说明：
@@ -82,6 +94,8 @@ def extract_ansible_events(r):
 	error = None
 	focus_event_data = None
 	for event in getattr(r, 'events', []):
+		if task_name is not None and event.get("event_data", {}).get("task") != task_name:
+			continue
 		# 处理成功事件
 		if event.get("event") == "runner_on_ok":
 			host = event["event_data"].get("host")
@@ -94,6 +108,7 @@ def extract_ansible_events(r):
 				"msg": res.get("msg", ""),  # 附加消息
 				"changed": res.get("changed", False),  # 是否有变更
 			}
+			result_item.update(_event_timing(event["event_data"]))
 			results.append(result_item)
 			# 只保留第一个 runner_on_ok 的 event_data 作为主任务目标
 			if not focus_event_data:
@@ -110,9 +125,21 @@ def extract_ansible_events(r):
 				"msg": res.get("msg", ""),
 				"failed": True,  # 标记为失败
 			}
+			result_item.update(_event_timing(event["event_data"]))
 			results.append(result_item)
 			error = res  # 只保留第一个失败的错误信息
 		else:
 			# 其他事件类型忽略
 			continue
-	return results, error, focus_event_data
\ No newline at end of file
+	return results, error, focus_event_data
+
+
+def _event_timing(event_data):
+	"""
+	提取主机结果事件的耗时信息（ansible_runner 在 runner_on_* 事件中记录 start/end/duration）。
+	"""
+	return {
+		"start": event_data.get("start"),  # 任务开始时间
+		"end": event_data.get("end"),  # 任务结束时间
+		"duration": event_data.get("duration"),  # 耗时（秒）
+	}
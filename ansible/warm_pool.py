@@ -0,0 +1,164 @@
+"""
+预热 ansible 工作进程池。
+每次 ansible_runner.run 都会启动新的 ansible / ansible-playbook 进程，重新导入 ansible、扫描 collections、加载插件，
+仅启动就需要数百毫秒。启用后（WARM_POOL_SIZE > 0）：
+- 本进程创建一个 unix 监听套接字，启动 WARM_POOL_SIZE 个常驻工作进程（warm_worker.py）共同 accept，
+  监听队列即本地 IPC 任务队列，空闲的工作进程依次取走请求；
+- shim 目录中的 ansible / ansible-playbook 替身命令（warm_shim.py）经 PATH 被 ansible_runner 调用，
+  把命令行与标准输入输出交给工作进程执行，ansible_runner 的事件、产物、取消逻辑保持不变；
+- 工作进程处理 WARM_POOL_MAX_JOBS 次后退出，由后台线程重新拉起，异常退出的同样自动补齐。
+工作进程预先导入 ansible 的 CLI、执行器与常用插件，每次执行只按请求的环境变量重置配置与插件加载器（见 warm_worker.py）。
+服务进程退出时关闭进程池；服务进程被强制杀死时工作进程检测到后自行退出。
+"""
+
+import atexit
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+logger = logging.getLogger('django')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_worker.py")
+SHIM_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_shim.py")
+SHIM_TOOLS = ("ansible", "ansible-playbook")
+# 检查工作进程存活的间隔（秒）
+SUPERVISE_INTERVAL = 1.0
+
+
+class WarmAnsiblePool:
+	"""
+	预热工作进程池（每个服务进程一个）。
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._pid = None
+		self._listener = None
+		self._workers = []
+		self._socket_path = None
+		self._shim_dir = None
+		self._size = 0
+		self._max_jobs = 0
+		self._stop = threading.Event()
+		self._atexit = False
+
+	def envvars(self, config_context) -> dict:
+		"""
+		返回使执行经由预热进程池的环境变量（PATH 前置 shim 目录 + RC_WARM_SOCKET），未启用时返回空字典。
+		首次调用时启动进程池。
+		"""
+		if config_context.warm_pool_size <= 0:
+			return {}
+		try:
+			self._ensure_started(config_context)
+		except OSError as e:
+			logger.warning("Warm ansible pool unavailable, falling back to cold starts: %s", e)
+			return {}
+		return {
+			"PATH": self._shim_dir + os.pathsep + os.environ.get("PATH", ""),
+			"RC_WARM_SOCKET": self._socket_path,
+		}
+
+	def shim(self, tool):
+		"""
+		进程池运行中时返回替身命令路径，否则返回 None。
+		"""
+		if self._listener is None or self._pid != os.getpid():
+			return None
+		return os.path.join(self._shim_dir, tool)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"workers": sum(1 for p in self._workers if p.poll() is None), "size": self._size}
+
+	def close(self):
+		with self._lock:
+			self._stop.set()
+			workers, self._workers = self._workers, []
+			if self._listener is not None:
+				self._listener.close()
+				self._listener = None
+		for proc in workers:
+			proc.terminate()
+		if self._socket_path:
+			try:
+				os.remove(self._socket_path)
+			except OSError:
+				pass
+
+	def _ensure_started(self, config_context):
+		if self._listener is not None and self._pid == os.getpid():
+			return
+		with self._lock:
+			if self._listener is not None and self._pid == os.getpid():
+				return
+			# 服务进程 fork 后（如 gunicorn preload）需在子进程中重新创建自己的进程池
+			os.makedirs(config_context.warm_pool_dir, mode=0o700, exist_ok=True)
+			self._shim_dir = self._install_shims(config_context.warm_pool_dir)
+			self._socket_path = os.path.join(config_context.warm_pool_dir, f"ansible-{os.getpid()}.sock")
+			try:
+				os.remove(self._socket_path)
+			except FileNotFoundError:
+				pass
+			listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			listener.bind(self._socket_path)
+			os.chmod(self._socket_path, 0o600)
+			listener.listen(128)
+			self._listener = listener
+			self._pid = os.getpid()
+			self._size = config_context.warm_pool_size
+			self._max_jobs = config_context.warm_pool_max_jobs
+			self._workers = [self._spawn() for _ in range(self._size)]
+			self._stop.clear()
+			threading.Thread(target=self._supervise, name="warm-ansible-pool", daemon=True).start()
+			if not self._atexit:
+				atexit.register(self.close)
+				self._atexit = True
+			logger.info("Warm ansible pool started: %d workers on %s", self._size, self._socket_path)
+
+	def _spawn(self):
+		return subprocess.Popen(
+			[sys.executable, "-I", WORKER_SCRIPT, str(self._listener.fileno()), str(self._max_jobs)],
+			pass_fds=(self._listener.fileno(),),
+			stdin=subprocess.DEVNULL,
+			close_fds=True,
+		)
+
+	def _supervise(self):
+		"""
+		补齐已退出（达到执行次数上限回收或异常退出）的工作进程。
+		"""
+		while not self._stop.wait(SUPERVISE_INTERVAL):
+			with self._lock:
+				if self._listener is None:
+					return
+				for index, proc in enumerate(self._workers):
+					if proc.poll() is not None:
+						if proc.returncode != 0:
+							logger.warning("Warm ansible worker %d exited with %s", proc.pid, proc.returncode)
+						self._workers[index] = self._spawn()
+
+	@staticmethod
+	def _install_shims(base_dir) -> str:
+		"""
+		在 shim 目录中写入 ansible / ansible-playbook 替身命令（以当前解释器 -IS 运行）。
+		"""
+		shim_dir = os.path.join(base_dir, "bin")
+		os.makedirs(shim_dir, mode=0o700, exist_ok=True)
+		with open(SHIM_SCRIPT, "r", encoding="utf-8") as f:
+			content = f"#!{sys.executable} -IS\n" + f.read()
+		for tool in SHIM_TOOLS:
+			path = os.path.join(shim_dir, tool)
+			tmp_path = f"{path}.{os.getpid()}.tmp"
+			with open(tmp_path, "w", encoding="utf-8") as f:
+				f.write(content)
+			os.chmod(tmp_path, 0o700)
+			os.replace(tmp_path, path)  # 原子替换，并发启动的服务进程不会执行到半个文件
+		return shim_dir
+
+
+# 进程级单例
+warm_ansible_pool = WarmAnsiblePool()
@@ -0,0 +1,66 @@
+"""
+ansible / ansible-playbook 的替身命令（由 warm_pool 复制到 shim 目录并以命令名命名）。
+
+ansible_runner 按 PATH 启动 ansible 时实际执行的是本脚本：连接 RC_WARM_SOCKET 指向的预热进程池，
+把自身的 stdin/stdout/stderr 与命令行、环境变量、工作目录交给预热进程执行，并以其退出码退出。
+被终止时连接随之断开，预热进程终止对应的执行。进程池不可用时回退为直接执行真实的 ansible 命令。
+本脚本以 `python -IS` 运行，只依赖标准库，启动开销仅为解释器本身。
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+
+
+def _fallback(tool, shim_dir):
+	"""
+	从 PATH 中去掉 shim 目录后执行真实命令。
+	"""
+	path = os.pathsep.join(
+		p for p in os.environ.get("PATH", "").split(os.pathsep) if os.path.abspath(p or ".") != shim_dir
+	)
+	os.environ["PATH"] = path
+	os.environ.pop("RC_WARM_SOCKET", None)
+	os.execvp(tool, [tool] + sys.argv[1:])
+
+
+def main():
+	tool = os.path.basename(sys.argv[0])
+	shim_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+	sock_path = os.environ.get("RC_WARM_SOCKET")
+	if not sock_path:
+		_fallback(tool, shim_dir)
+	conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		conn.connect(sock_path)
+		connected = True
+	except OSError:
+		conn.close()
+		connected = False
+	if not connected:
+		_fallback(tool, shim_dir)
+
+	env = dict(os.environ)
+	env.pop("RC_WARM_SOCKET", None)
+	env["PATH"] = os.pathsep.join(
+		p for p in env.get("PATH", "").split(os.pathsep) if os.path.abspath(p or ".") != shim_dir
+	)
+	body = json.dumps({"tool": tool, "argv": [tool] + sys.argv[1:], "env": env, "cwd": os.getcwd()}).encode()
+	socket.send_fds(conn, [struct.pack("!I", len(body))], [0, 1, 2])
+	conn.sendall(body)
+
+	reply = b""
+	while not reply.endswith(b"\n"):
+		chunk = conn.recv(4096)
+		if not chunk:
+			# 预热进程异常退出
+			sys.stderr.write("warm ansible worker exited unexpectedly\n")
+			sys.exit(255)
+		reply += chunk
+	sys.exit(json.loads(reply).get("rc", 255))
+
+
+if __name__ == "__main__":
+	main()
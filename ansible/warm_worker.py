@@ -0,0 +1,283 @@
+"""
+预热 ansible 工作进程（独立脚本，由 warm_pool 以 `python -I warm_worker.py <监听fd> <最大执行次数>` 启动）。
+
+以 -I 启动，sys.path 不含项目目录，import ansible 得到的是真正的 ansible 包而不是本项目的 ansible 目录。
+启动时预先导入 ansible 的 CLI、执行器、插件加载器与常用插件，然后在继承的 unix 套接字上 accept：
+- 请求：shim 经 SCM_RIGHTS 传入自身的 stdin/stdout/stderr，随后发送 {tool, argv, env, cwd}；
+- 执行：每个请求 fork 一个子进程（继承已导入的模块，写时复制），子进程应用请求的环境变量与工作目录后，
+  只重置依赖环境的部分（见 _reset_ansible）：重新求值 ansible.constants 与配置管理器、按新配置重建插件加载器的
+  搜索路径并清空其缓存，然后调用 ansible / ansible-playbook 的 CLI 入口，输出直接写入 shim 的标准输出；
+- 取消：shim 退出（ansible_runner 终止执行）后连接断开，子进程组被终止；
+- 回收：处理 max_jobs 个请求后退出，由 warm_pool 重新拉起；服务进程退出（包括被强制杀死）后同样退出。
+"""
+
+import ast
+import importlib
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+
+# 预先导入的模块：CLI、执行器、模板与常用插件（导入失败的忽略，如未安装 pywinrm 时的 winrm）。
+# ansible.constants 与插件加载器在导入时按环境变量求值，每次执行前由 _reset_ansible 按请求的环境重置。
+PRELOAD_MODULES = (
+	"ansible.constants",
+	"ansible.cli.adhoc",
+	"ansible.cli.playbook",
+	"ansible.executor.task_queue_manager",
+	"ansible.executor.playbook_executor",
+	"ansible.executor.module_common",
+	"ansible.executor.process.worker",
+	"ansible.inventory.manager",
+	"ansible.vars.manager",
+	"ansible.parsing.dataloader",
+	"ansible.template",
+	"ansible.plugins.loader",
+	"ansible.plugins.connection.ssh",
+	"ansible.plugins.connection.local",
+	"ansible.plugins.connection.winrm",
+	"ansible.plugins.action.command",
+	"ansible.plugins.action.shell",
+	"ansible.plugins.action.script",
+	"ansible.plugins.action.raw",
+	"ansible.plugins.action.normal",
+	"ansible.plugins.callback.default",
+	"ansible.plugins.callback.minimal",
+	"ansible.plugins.inventory.ini",
+	"ansible.plugins.shell.sh",
+	"ansible.plugins.shell.powershell",
+	"ansible.plugins.strategy.linear",
+	"ansible.plugins.become.sudo",
+)
+
+CLI_MODULES = {
+	"ansible": "ansible.cli.adhoc",
+	"ansible-playbook": "ansible.cli.playbook",
+}
+
+# 取消后等待子进程组退出的时间（秒），超时则 SIGKILL
+TERMINATE_GRACE = 5
+# accept 等待超时后检查服务进程是否仍存活的间隔（秒），服务进程退出后工作进程随之退出
+PARENT_CHECK_INTERVAL = 1.0
+
+
+# 插件加载器变量名 -> 其搜索路径配置项（ansible.constants 中的名称），预加载后由 _loader_config_names 解析
+LOADER_CONFIG = {}
+
+
+def _preload():
+	for name in PRELOAD_MODULES:
+		try:
+			importlib.import_module(name)
+		except BaseException:
+			# ansible.cli 导入时检查标准输入输出与 locale，失败时（SystemExit）留给子进程按请求环境导入
+			pass
+	loader = sys.modules.get("ansible.plugins.loader")
+	if loader is not None:
+		LOADER_CONFIG.update(_loader_config_names(loader))
+
+
+def _loader_config_names(loader) -> dict:
+	"""
+	从 ansible.plugins.loader 源码中解析模块级插件加载器的搜索路径配置项：
+	形如 `action_loader = PluginLoader('ActionModule', 'ansible.plugins.action', C.DEFAULT_ACTION_PLUGIN_PATH, ...)`，
+	第三个参数为 C.<配置项> 的加载器需在每次执行时按新配置重建搜索路径。
+	"""
+	with open(loader.__file__, "r", encoding="utf-8") as f:
+		tree = ast.parse(f.read())
+	names = {}
+	for node in tree.body:
+		if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)):
+			continue
+		call = node.value
+		if not (isinstance(call, ast.Call) and len(call.args) >= 3):
+			continue
+		config = call.args[2]
+		if isinstance(config, ast.Attribute) and isinstance(config.value, ast.Name) and config.value.id == "C":
+			names[node.targets[0].id] = config.attr
+	return names
+
+
+def _reset_ansible():
+	"""
+	子进程应用请求环境后，重置预加载的 ansible 中按导入时环境求值的状态：
+	- 重新执行 ansible.constants（新建 ConfigManager 并重新求值全部常量），
+	  以 `from ansible.constants import config` 持有旧 ConfigManager 的模块改为引用新的；
+	- 插件加载器的搜索路径按新常量重建（如 ansible_runner 设置的 ANSIBLE_CALLBACK_PLUGINS），并清空查找缓存；
+	- 重新执行 ansible.cli 导入时对标准输入输出（已替换为 shim 的）与 locale 的检查。
+	"""
+	constants = sys.modules.get("ansible.constants")
+	if constants is None:
+		return
+	old_config = constants.config
+	importlib.reload(constants)
+	for module in list(sys.modules.values()):
+		try:
+			if getattr(module, "config", None) is old_config:
+				module.config = constants.config
+		except Exception:
+			pass
+
+	loader = sys.modules.get("ansible.plugins.loader")
+	if loader is not None:
+		for name, setting in LOADER_CONFIG.items():
+			plugin_loader = getattr(loader, name, None)
+			if not isinstance(plugin_loader, loader.PluginLoader):
+				continue
+			paths = getattr(constants, setting, None)
+			if paths and not isinstance(paths, list):
+				paths = [paths]
+			plugin_loader.config = list(paths or [])
+			plugin_loader._extra_dirs = []
+			plugin_loader._clear_caches()
+
+	cli = sys.modules.get("ansible.cli")
+	if cli is not None:
+		cli.check_blocking_io()
+		cli.initialize_locale()
+
+
+def _recv_exact(conn, size):
+	data = b""
+	while len(data) < size:
+		chunk = conn.recv(size - len(data))
+		if not chunk:
+			raise EOFError("connection closed")
+		data += chunk
+	return data
+
+
+def _read_request(conn):
+	"""
+	读取请求：4 字节长度头（随附 stdin/stdout/stderr 三个 fd）+ JSON 正文。
+	"""
+	header, fds, _, _ = socket.recv_fds(conn, 4, 3)
+	if len(header) < 4:
+		header += _recv_exact(conn, 4 - len(header))
+	if len(fds) != 3:
+		for fd in fds:
+			os.close(fd)
+		raise ValueError("expected stdio file descriptors")
+	(length,) = struct.unpack("!I", header)
+	return json.loads(_recv_exact(conn, length)), fds
+
+
+def _run_cli(request):
+	"""
+	子进程内执行 ansible CLI，返回退出码。
+	"""
+	os.chdir(request["cwd"])
+	os.environ.clear()
+	os.environ.update(request["env"])
+	sys.argv = list(request["argv"])
+	# 预加载的配置与插件加载器按本次请求的环境（回调插件、ssh 参数等）重置
+	_reset_ansible()
+	module = importlib.import_module(CLI_MODULES[request["tool"]])
+	try:
+		module.main()
+	except SystemExit as e:
+		return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+	return 0
+
+
+def _child(listener, conn, request, fds):
+	code = 250
+	try:
+		listener.close()
+		conn.close()
+		os.setsid()  # 独立进程组，取消时连同 ansible 派生的 worker 一并终止
+		for target, fd in enumerate(fds):
+			os.dup2(fd, target)
+			os.close(fd)
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		code = _run_cli(request)
+	except BaseException:
+		traceback.print_exc()
+	finally:
+		try:
+			sys.stdout.flush()
+			sys.stderr.flush()
+		except Exception:
+			pass
+		os._exit(code)
+
+
+def _wait(pid, conn):
+	"""
+	等待子进程结束；期间 shim 断开连接视为取消，终止子进程组。
+	:return: 退出码（被信号终止时为 128 + 信号值）
+	"""
+	killed_at = None
+	while True:
+		wpid, status = os.waitpid(pid, os.WNOHANG)
+		if wpid:
+			code = os.waitstatus_to_exitcode(status)
+			return 128 - code if code < 0 else code
+		if killed_at is None:
+			readable, _, _ = select.select([conn], [], [], 0.2)
+			if readable and not conn.recv(1):
+				_killpg(pid, signal.SIGTERM)
+				killed_at = time.monotonic()
+		else:
+			time.sleep(0.1)
+			if time.monotonic() - killed_at > TERMINATE_GRACE:
+				_killpg(pid, signal.SIGKILL)
+
+
+def _killpg(pid, sig):
+	try:
+		os.killpg(pid, sig)
+	except OSError:
+		pass
+
+
+def _serve(listener, conn):
+	request, fds = _read_request(conn)
+	if request.get("tool") not in CLI_MODULES:
+		for fd in fds:
+			os.close(fd)
+		conn.sendall(json.dumps({"rc": 2, "error": "unsupported tool"}).encode() + b"\n")
+		return
+	pid = os.fork()
+	if pid == 0:
+		_child(listener, conn, request, fds)
+	for fd in fds:
+		os.close(fd)
+	rc = _wait(pid, conn)
+	try:
+		conn.sendall(json.dumps({"rc": rc}).encode() + b"\n")
+	except OSError:
+		pass
+
+
+def main():
+	listener = socket.socket(fileno=int(sys.argv[1]))
+	max_jobs = int(sys.argv[2])
+	parent = os.getppid()
+	listener.settimeout(PARENT_CHECK_INTERVAL)
+	_preload()
+	served = 0
+	while max_jobs <= 0 or served < max_jobs:
+		try:
+			conn, _ = listener.accept()
+		except socket.timeout:
+			if os.getppid() != parent:
+				return
+			continue
+		conn.setblocking(True)
+		try:
+			_serve(listener, conn)
+		except Exception:
+			traceback.print_exc()
+		finally:
+			conn.close()
+		served += 1
+
+
+if __name__ == "__main__":
+	main()
@@ -1,3 +1,19 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ExecutionRecord, Host
+
+
+@admin.register(ExecutionRecord)
+class ExecutionRecordAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "erp", "ip", "os_type", "exec_type", "status", "rc", "duration_ms")
+    list_filter = ("status", "os_type", "exec_type", "kind")
+    search_fields = ("execution_id", "erp", "ip")
+    date_hierarchy = "created_at"
+
+
+@admin.register(Host)
+class HostAdmin(admin.ModelAdmin):
+    list_display = ("host_id", "ip", "port", "os_type", "username", "credential_ref", "use_bastion", "bastion", "tags", "enabled")
+    list_filter = ("os_type", "enabled", "use_bastion")
+    search_fields = ("host_id", "ip")
+    readonly_fields = ("profile", "updated_at")
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from remote_call.registry import host_registry
+        from .models import Host
+
+        # 本进程内登记表变更立即生效
+        post_save.connect(host_registry.invalidate, sender=Host, dispatch_uid="host_registry_save")
+        post_delete.connect(host_registry.invalidate, sender=Host, dispatch_uid="host_registry_delete")
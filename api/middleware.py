@@ -0,0 +1,88 @@
+"""
+响应压缩中间件：按 Accept-Encoding 协商 zstd / gzip。
+
+- 安装了 zstandard 时优先使用 zstd（压缩率与速度均优于 gzip），否则使用 gzip；
+- 流式响应（SSE）、已编码的响应以及小于 COMPRESS_MIN_BYTES 的响应不压缩；
+- 同步与异步（ASGI）视图均适用。
+"""
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖
+    zstandard = None
+
+
+def _accepted_encodings(header: str) -> dict:
+    """
+    解析 Accept-Encoding，返回 {编码: q 值}。
+    """
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(header: str):
+    """
+    选择响应编码：q 值高者优先，相同时 zstd 优先于 gzip；均不可接受时返回 None。
+    """
+    accepted = _accepted_encodings(header or "")
+    candidates = []
+    if zstandard is not None:
+        candidates.append("zstd")
+    candidates.append("gzip")
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    按客户端 Accept-Encoding 压缩响应体。
+    """
+
+    def process_response(self, request, response):
+        cfg = getattr(settings, "RESPONSE_CONFIG", {})
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if len(response.content) < int(cfg.get("COMPRESS_MIN_BYTES", 1024)):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding == "zstd":
+            compressed = zstandard.ZstdCompressor(level=int(cfg.get("ZSTD_LEVEL", 3))).compress(response.content)
+        elif encoding == "gzip":
+            compressed = gzip.compress(response.content, compresslevel=int(cfg.get("GZIP_LEVEL", 6)))
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        # 压缩后内容变化，弱化 ETag 以符合 RFC 7232
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ExecutionRecord",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("execution_id", models.CharField(db_index=True, max_length=64)),
+                ("kind", models.CharField(max_length=16)),
+                ("erp", models.CharField(max_length=64)),
+                ("ip", models.CharField(max_length=255)),
+                ("port", models.IntegerField(null=True)),
+                ("username", models.CharField(blank=True, default="", max_length=128)),
+                ("os_type", models.CharField(max_length=16)),
+                ("exec_type", models.CharField(max_length=16)),
+                ("engine", models.CharField(blank=True, default="", max_length=16)),
+                ("command", models.TextField(blank=True, default="")),
+                ("request", models.JSONField(default=dict)),
+                ("status", models.CharField(max_length=16)),
+                ("rc", models.IntegerField(null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("stdout", models.TextField(blank=True, default="")),
+                ("stderr", models.TextField(blank=True, default="")),
+                ("stdout_bytes", models.IntegerField(default=0)),
+                ("stderr_bytes", models.IntegerField(default=0)),
+                ("timings", models.JSONField(default=dict)),
+                ("duration_ms", models.FloatField(null=True)),
+                ("created_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "ordering": ["-created_at", "-id"],
+                "indexes": [
+                    models.Index(fields=["erp", "ip", "created_at"], name="exec_erp_ip_created_idx"),
+                    models.Index(fields=["ip", "created_at"], name="exec_ip_created_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Host",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("host_id", models.CharField(max_length=128, unique=True)),
+                ("ip", models.CharField(db_index=True, max_length=255)),
+                ("port", models.IntegerField(blank=True, null=True)),
+                ("os_type", models.CharField(choices=[("linux", "linux"), ("windows", "windows"), ("h3c", "h3c")], max_length=16)),
+                ("username", models.CharField(blank=True, default="", max_length=128)),
+                ("credential_ref", models.CharField(blank=True, default="", max_length=128)),
+                ("use_bastion", models.BooleanField(default=True)),
+                ("bastion", models.CharField(blank=True, default="", max_length=128)),
+                ("tags", models.JSONField(blank=True, default=list)),
+                ("enabled", models.BooleanField(default=True)),
+                ("profile", models.JSONField(default=dict, editable=False)),
+                ("updated_at", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                "ordering": ["host_id"],
+            },
+        ),
+    ]
@@ -1,3 +1,99 @@
 from django.db import models
 
-# Create your models here.
+
+class ExecutionRecord(models.Model):
+    """
+    远程执行历史记录，由 remote_call.history 在后台批量写入。
+    请求参数中的密码等敏感字段写入前已脱敏；stdout/stderr 只保留首尾片段，原始字节数单独记录。
+    """
+    execution_id = models.CharField(max_length=64, db_index=True)
+    kind = models.CharField(max_length=16)  # single / aio / batch / commands
+    erp = models.CharField(max_length=64)
+    ip = models.CharField(max_length=255)
+    port = models.IntegerField(null=True)
+    username = models.CharField(max_length=128, blank=True, default="")
+    os_type = models.CharField(max_length=16)
+    exec_type = models.CharField(max_length=16)
+    engine = models.CharField(max_length=16, blank=True, default="")
+    command = models.TextField(blank=True, default="")
+    request = models.JSONField(default=dict)
+    status = models.CharField(max_length=16)
+    rc = models.IntegerField(null=True)
+    error = models.TextField(blank=True, default="")
+    stdout = models.TextField(blank=True, default="")
+    stderr = models.TextField(blank=True, default="")
+    stdout_bytes = models.IntegerField(default=0)
+    stderr_bytes = models.IntegerField(default=0)
+    timings = models.JSONField(default=dict)
+    duration_ms = models.FloatField(null=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["erp", "ip", "created_at"], name="exec_erp_ip_created_idx"),
+            models.Index(fields=["ip", "created_at"], name="exec_ip_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.execution_id} {self.erp}@{self.ip} {self.status}"
+
+
+class Host(models.Model):
+    """
+    主机登记表：请求可只传 host_id（单台）或 tag（批量），连接参数取自登记信息。
+    密码不落库，credential_ref 引用 HOST_REGISTRY["CREDENTIALS"] 中的凭据；
+    profile 为保存时预编译的连接参数（分组名、端口、inventory 主机变量），请求时不再重新推断。
+    进程内缓存见 remote_call.registry。
+    """
+    host_id = models.CharField(max_length=128, unique=True)
+    ip = models.CharField(max_length=255, db_index=True)
+    port = models.IntegerField(null=True, blank=True)
+    os_type = models.CharField(max_length=16, choices=[("linux", "linux"), ("windows", "windows"), ("h3c", "h3c")])
+    username = models.CharField(max_length=128, blank=True, default="")
+    credential_ref = models.CharField(max_length=128, blank=True, default="")
+    use_bastion = models.BooleanField(default=True)
+    bastion = models.CharField(max_length=128, blank=True, default="")  # 指定堡垒机（BASTIONS 中的 name），留空按网段路由
+    tags = models.JSONField(default=list, blank=True)
+    enabled = models.BooleanField(default=True)
+    profile = models.JSONField(default=dict, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ["host_id"]
+
+    def __str__(self):
+        return f"{self.host_id} ({self.os_type} {self.ip})"
+
+    def save(self, *args, **kwargs):
+        self.profile = self.compile_profile()
+        super().save(*args, **kwargs)
+
+    def compile_profile(self) -> dict:
+        """
+        预编译与请求无关的连接参数。
+        """
+        from remote_call.context import RemoteCallContext
+
+        ctx = RemoteCallContext(
+            os_type=self.os_type,
+            ip=self.ip,
+            username=self.username,
+            erp="",
+            port=self.port,
+            password="" if self.credential_ref else None,
+        )
+        if ctx.is_linux():
+            connection = ctx.get_linux_inventory()
+        elif ctx.is_windows():
+            connection = ctx.get_windows_inventory()
+        else:
+            connection = ctx.get_h3c_inventory()
+        # 未指定端口的 Windows 主机，端口取决于请求时是否带密码（5985/5986），不预编译，由请求时计算
+        port = ctx.get_port() if self.port or not ctx.is_windows() else None
+        return {
+            "group_name": ctx.get_group_name(),
+            "port": port,
+            "target_addr": ctx.get_target_addr(),
+            "host_vars": f"ansible_port={port} {connection}" if port else connection,
+        }
@@ -1,23 +1,29 @@
 from rest_framework import serializers
 
+from .models import ExecutionRecord
+
 class RemoteCallSerializer(serializers.Serializer):
     """
     只负责接口层参数校验，不做任何业务逻辑。
     """
+    host_id = serializers.CharField(required=False, allow_blank=False)
     os_type = serializers.ChoiceField(
-        choices=["linux", "windows"],
+        choices=["linux", "windows", "h3c"],
+        required=False,
         error_messages={
             "required": "OS type is required",
-            "invalid_choice": "OS type must be one of [linux | windows]"
+            "invalid_choice": "OS type must be one of [linux | windows | h3c]"
         }
     )
     ip = serializers.IPAddressField(
+        required=False,
         error_messages={
             "required": "IP address is required",
             "invalid": "Please enter a valid IP address"
         }
     )
     username = serializers.CharField(
+        required=False,
         error_messages={
             "required": "Username is required",
             "blank": "Username cannot be blank"
@@ -43,3 +49,120 @@ class RemoteCallSerializer(serializers.Serializer):
     command = serializers.CharField(required=False, allow_blank=True)
     file_path = serializers.CharField(required=False, allow_blank=True)
     use_bastion = serializers.BooleanField(required=False, default=True)
+    engine = serializers.ChoiceField(
+        choices=["ansible", "native"],
+        required=False,
+        error_messages={
+            "invalid_choice": "Engine must be one of [ansible | native]"
+        }
+    )
+    timeout = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=3600,
+        error_messages={
+            "min_value": "Timeout cannot be less than 1 second",
+            "max_value": "Timeout cannot be greater than 3600 seconds"
+        }
+    )
+    cache = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        # 传入 host_id 时连接参数取自主机登记表，否则需提供
+        if not attrs.get("host_id"):
+            self.require_fields(attrs, ("os_type", "ip", "username"))
+        return attrs
+
+    def require_fields(self, attrs, names):
+        missing = {
+            name: self.fields[name].error_messages["required"]
+            for name in names if attrs.get(name) in (None, "")
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+
+
+
+class RemoteCallBatchSerializer(RemoteCallSerializer):
+    """
+    批量执行接口参数校验：以 targets（IP 列表）、group（预定义分组）或 tag（登记表主机标签）替代单个 ip。
+    """
+    ip = None
+    host_id = None
+    tag = serializers.CharField(required=False, allow_blank=False)
+    targets = serializers.ListField(
+        child=serializers.IPAddressField(),
+        required=False,
+        allow_empty=False,
+        max_length=1000,
+        error_messages={
+            "empty": "Targets cannot be empty",
+            "max_length": "Targets cannot exceed 1000 hosts"
+        }
+    )
+    group = serializers.CharField(required=False, allow_blank=False)
+    forks = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=200,
+        error_messages={
+            "min_value": "Forks cannot be less than 1",
+            "max_value": "Forks cannot be greater than 200"
+        }
+    )
+
+    def validate(self, attrs):
+        if not attrs.get("targets") and not attrs.get("group") and not attrs.get("tag"):
+            raise serializers.ValidationError("Either targets, group or tag is required")
+        # 按 IP 下发时需提供连接参数，tag 下的主机取自主机登记表
+        if attrs.get("targets") or attrs.get("group"):
+            self.require_fields(attrs, ("os_type", "username"))
+        return attrs
+
+
+
+class RemoteCallCommandsSerializer(RemoteCallSerializer):
+    """
+    多命令接口参数校验：以 commands（命令列表）替代 command/file_path。
+    """
+    command = None
+    file_path = None
+    commands = serializers.ListField(
+        child=serializers.CharField(allow_blank=False),
+        allow_empty=False,
+        max_length=100,
+        error_messages={
+            "required": "Commands is required",
+            "empty": "Commands cannot be empty",
+            "max_length": "Commands cannot exceed 100 items"
+        }
+    )
+    continue_on_error = serializers.BooleanField(required=False, default=True)
+
+
+
+class ExecutionQuerySerializer(serializers.Serializer):
+    """
+    执行历史查询参数校验：按主机/用户/状态/时间范围过滤，within 为最近 N 秒（如 3600 即最近一小时）。
+    """
+    ip = serializers.CharField(required=False, allow_blank=False)
+    erp = serializers.CharField(required=False, allow_blank=False)
+    status = serializers.CharField(required=False, allow_blank=False)
+    os_type = serializers.CharField(required=False, allow_blank=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    within = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=90 * 86400,
+        error_messages={
+            "min_value": "Within cannot be less than 1 second",
+            "max_value": "Within cannot be greater than 90 days"
+        }
+    )
+
+
+class ExecutionRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExecutionRecord
+        exclude = ["id"]
@@ -1,3 +1,1529 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import paramiko
+import yaml
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve
+
+from ansible.artifacts import ArtifactManager
+from ansible.bastion import bastion_pool
+from ansible.config import get_ansible_config
+from ansible.inventory import build_host_line, generate_inventory
+from ansible.key_cache import BastionKeyCache
+from ansible.warm_pool import WarmAnsiblePool
+from ansible.multiplex import control_socket_pool
+from ansible.playbook import H3C_FAILED_WHEN as h3c_failed_when, generate_playbook, get_windows_script_steps
+from ansible.runner import AnsibleTaskContext, run_ansible_with_context
+from ansible import h3c, native
+from ansible.scheduler import ExecutionScheduler, ExecutionCanceled, SchedulerTimeout
+from api.middleware import CompressionMiddleware, choose_encoding
+from api.models import ExecutionRecord, Host
+from bench.sshd import BenchSSHServer
+from remote_call.context import RemoteCallContext
+from remote_call.history import ExecutionRecorder, execution_recorder
+from remote_call import metrics
+from remote_call.registry import HostNotFound, HostRegistry, host_registry
+from remote_call.jobs import JobManager, JOB_ERROR, JOB_RUNNING, JOB_SUCCESS
+from remote_call import utils as remote_utils
+from remote_call.result_cache import ResultCache
+from remote_call.services import RemoteCallBatchService
+from utils import limits
+
+
+def make_context(**kwargs) -> RemoteCallContext:
+    params = {"os_type": "linux", "ip": "10.0.0.1", "username": "root", "erp": "alice", "command": "hostname"}
+    params.update(kwargs)
+    return RemoteCallContext(**params)
+
+
+def bastion_config(**kwargs) -> dict:
+    """
+    在 settings.BASTION_CONFIG 基础上覆盖部分配置，配合 override_settings 使用。
+    """
+    return dict(settings.BASTION_CONFIG, **kwargs)
+
+
+class ApiTestCase(TestCase):
+    """
+    接口测试基类：不写入执行历史（后台线程写库与测试事务互不可见）。
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(execution_recorder, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class RemoteCallCommandsViewTests(ApiTestCase):
+    url = "/api/remote_call/commands"
+    payload = {
+        "os_type": "linux",
+        "ip": "10.0.0.1",
+        "username": "root",
+        "erp": "alice",
+        "engine": "native",
+        "commands": ["hostname", "false", "uptime"],
+    }
+
+    def test_invalid_request(self):
+        response = self.client.post(self.url, {"os_type": "linux", "ip": "10.0.0.1"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("commands", response.json()["error"])
+
+    def test_per_command_results(self):
+        items = [
+            {"command": "hostname", "stdout": "web-1", "stderr": "", "rc": 0, "duration": 0.01},
+            {"command": "false", "stdout": "", "stderr": "", "rc": 1, "duration": 0.02, "failed": True},
+            {"command": "uptime", "skipped": True},
+        ]
+        with mock.patch("remote_call.services.run_native_commands", return_value=(items, None)) as runner:
+            response = self.client.post(
+                self.url, dict(self.payload, continue_on_error=False), content_type="application/json"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        user_context = runner.call_args.args[0]
+        self.assertEqual(user_context.command, self.payload["commands"])
+        self.assertFalse(user_context.continue_on_error)
+        body = response.json()
+        self.assertEqual(body["status"], "error")
+        self.assertEqual([item["status"] for item in body["data"]], ["success", "failed", "skipped"])
+        self.assertEqual(body["data"][0]["stdout"], "web-1")
+        self.assertEqual(body["data"][1]["exit_code"], 1)
+        self.assertEqual(body["data"][1]["duration_ms"], 20)
+
+
+class RemoteCallBatchViewTests(ApiTestCase):
+    url = "/api/remote_call/batch"
+    payload = {"os_type": "linux", "username": "root", "erp": "alice", "command": "hostname"}
+
+    @override_settings(BASTION_CONFIG=bastion_config(HOST_GROUPS={"empty": []}))
+    def test_no_targets_resolved(self):
+        response = self.client.post(self.url, dict(self.payload, group="empty"), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["status"], "error")
+        self.assertEqual(body["error"], "没有可执行的目标主机")
+
+    def test_unknown_group(self):
+        response = self.client.post(self.url, dict(self.payload, group="missing"), content_type="application/json")
+        self.assertEqual(response.json()["error"], "未知的主机分组: missing")
+
+    @override_settings(BASTION_CONFIG=bastion_config(HOST_GROUPS={"web": ["10.0.0.3", "10.0.0.1"]}))
+    def test_fan_out_aggregates_focus_results(self):
+        result = {
+            "status": "error",
+            "all_results": [
+                {"task": "setup", "focus": False, "result": [{"host": "10.0.0.1", "rc": 0}]},
+                {"task": "shell:hostname", "focus": True, "result": [
+                    {"host": "10.0.0.2", "stdout": "web-2", "rc": 0},
+                    {"host": "10.0.0.1", "stdout": "", "rc": 1, "failed": True},
+                ]},
+            ],
+            "scheduler": {"queue_depth": 0, "wait_time": 0.0},
+        }
+        with mock.patch("remote_call.services.run_ansible_with_context", return_value=result) as runner:
+            response = self.client.post(
+                self.url, dict(self.payload, targets=["10.0.0.1", "10.0.0.2"], group="web", forks=7),
+                content_type="application/json",
+            )
+
+        self.assertEqual(runner.call_count, 1)
+        self.assertEqual(runner.call_args.kwargs["forks"], 7)
+        self.assertEqual(len(runner.call_args.kwargs["targets"]), 3)
+        body = response.json()
+        self.assertEqual([item["host"] for item in body["data"]], ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+        self.assertEqual(body["data"][1]["stdout"], "web-2")
+        self.assertTrue(body["data"][0]["failed"])
+        # 没有结果的主机（被跳过或前序步骤失败）以失败占位
+        self.assertEqual(body["data"][2]["msg"], "no result (host skipped or earlier step failed)")
+        self.assertEqual(body["summary"], {"total": 3, "ok": 1, "failed": 2})
+        self.assertEqual(body["status"], "error")
+
+    def test_direct_runner_respects_forks(self):
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def run_native(user_context, config_context, task_context, event_handler=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            if user_context.ip == "10.0.0.4":
+                return {"status": "error", "data": None, "error": "connect timeout"}
+            return {"status": "success", "data": {"host": user_context.ip, "stdout": "ok", "rc": 0}}
+
+        targets = [f"10.0.0.{i}" for i in range(1, 7)]
+        with mock.patch("remote_call.services.run_native_with_context", side_effect=run_native):
+            response = self.client.post(
+                self.url, dict(self.payload, engine="native", targets=targets, forks=2),
+                content_type="application/json",
+            )
+
+        body = response.json()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual([item["host"] for item in body["data"]], targets)
+        self.assertEqual(body["data"][3], {"host": "10.0.0.4", "failed": True, "msg": "connect timeout"})
+        self.assertEqual(body["summary"], {"total": 6, "ok": 5, "failed": 1})
+
+
+@override_settings(RESPONSE_CONFIG=dict(settings.RESPONSE_CONFIG, OUTPUT_HEAD_BYTES=8, OUTPUT_TAIL_BYTES=8))
+class ResponseShapingTests(ApiTestCase):
+    url = "/api/remote_call"
+    payload = {"os_type": "linux", "ip": "10.0.0.1", "username": "root", "erp": "alice", "command": "journalctl"}
+
+    def setUp(self):
+        super().setUp()
+        output = "x" * 100
+        data = {"host": "10.0.0.1", "stdout": output, "stderr": "", "rc": 0}
+        service = {
+            "status": "success",
+            "data": data,
+            "target": {"res": {"rc": 0, "stdout": output}},
+            "all_results": [{"task": "shell:journalctl", "focus": True, "result": [dict(data)]}],
+        }
+        patcher = mock.patch("api.views.RemoteCallService", return_value=service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_default_keeps_response_shape(self):
+        body = self.client.post(self.url, self.payload, content_type="application/json").json()
+        self.assertEqual(body["data"]["stdout"], "x" * 100)
+        self.assertNotIn("truncated", body["data"])
+        self.assertEqual(body["target"]["res"]["stdout"], "x" * 100)
+        self.assertEqual(body["all_results"][0]["result"][0]["stdout"], "x" * 100)
+
+    def test_truncate_and_dedup_opt_in(self):
+        body = self.client.post(
+            self.url + "?truncate=1&dedup=1", self.payload, content_type="application/json"
+        ).json()
+        self.assertTrue(body["data"]["truncated"])
+        self.assertEqual(body["data"]["stdout_bytes"], 100)
+        self.assertTrue(body["data"]["stdout"].startswith("x" * 8 + "\n... [truncated 84 bytes]"))
+        self.assertNotIn("stdout", body["target"]["res"])
+        self.assertEqual(body["all_results"][0]["result"][0]["output_ref"], "data")
+
+
+@mock.patch("api.middleware.zstandard", None)
+@override_settings(RESPONSE_CONFIG=dict(settings.RESPONSE_CONFIG, COMPRESS_MIN_BYTES=1024))
+class CompressionMiddlewareTests(TestCase):
+
+    def process(self, response, accept="gzip"):
+        request = RequestFactory().get("/api/remote_call", HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def test_choose_encoding_by_q_value(self):
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(choose_encoding("*;q=0.3"), "gzip")
+        self.assertIsNone(choose_encoding("gzip;q=0, *;q=0.5"))
+        self.assertIsNone(choose_encoding("gzip;q=abc"))
+        self.assertIsNone(choose_encoding("identity"))
+        self.assertIsNone(choose_encoding(""))
+        with mock.patch("api.middleware.zstandard", object()):
+            # q 值相同时 zstd 优先，否则按 q 值
+            self.assertEqual(choose_encoding("gzip, zstd"), "zstd")
+            self.assertEqual(choose_encoding("gzip;q=1.0, zstd;q=0.5"), "gzip")
+
+    def test_gzip_large_response(self):
+        body = json.dumps({"data": {"stdout": "line\n" * 1000}}).encode()
+        response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = '"abc"'
+
+        response = self.process(response, accept="br;q=1.0, gzip;q=0.8")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_skips_small_streaming_and_encoded_responses(self):
+        small = self.process(HttpResponse(b"x" * 1023))
+        self.assertFalse(small.has_header("Content-Encoding"))
+        self.assertEqual(small.content, b"x" * 1023)
+
+        stream = StreamingHttpResponse(iter([b"data: x\n\n"] * 500), content_type="text/event-stream")
+        stream = self.process(stream)
+        self.assertFalse(stream.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(stream.streaming_content), b"data: x\n\n" * 500)
+
+        encoded = HttpResponse(b"x" * 4096)
+        encoded["Content-Encoding"] = "br"
+        self.assertEqual(self.process(encoded).content, b"x" * 4096)
+
+        # 客户端不接受任何支持的编码
+        self.assertEqual(self.process(HttpResponse(b"x" * 4096), accept="br").content, b"x" * 4096)
+
+
+class RemoteCallStreamViewTests(ApiTestCase):
+    url = "/api/remote_call/stream"
+    payload = {"os_type": "linux", "ip": "10.0.0.1", "username": "root", "erp": "alice", "command": "tail -n 2 app.log"}
+
+    def test_streams_output_then_done(self):
+        def service(data, event_handler=None):
+            for line in ("line 1", "line 2"):
+                event_handler({"event": "native_output", "stream": "stdout", "stdout": line,
+                               "event_data": {"host": "10.0.0.1"}})
+            event_handler({"event": "runner_on_start", "event_data": {"host": "10.0.0.1"}})
+            return {"status": "success", "data": {"stdout": "line 1\nline 2", "rc": 0}, "error": None}
+
+        with mock.patch("remote_call.streaming.RemoteCallService", side_effect=service):
+            response = self.client.post(self.url, self.payload, content_type="application/json")
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            body = b"".join(response.streaming_content).decode()
+
+        events = [
+            (chunk.split("\n")[0][len("event: "):], json.loads(chunk.split("\n")[1][len("data: "):]))
+            for chunk in body.strip().split("\n\n")
+        ]
+        self.assertEqual([name for name, _ in events], ["output", "output", "done"])
+        self.assertEqual(events[1][1], {"host": "10.0.0.1", "stream": "stdout", "line": "line 2"})
+        self.assertEqual(events[2][1]["rc"], 0)
+        self.assertNotIn("stdout", events[2][1])
+
+    def test_invalid_request(self):
+        response = self.client.post(self.url, {"os_type": "linux"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(TestCase):
+
+    def test_stage_timings_and_exposition(self):
+        with metrics.request_timer("Linux", "unittest") as timer:
+            with metrics.stage("inventory_write"):
+                pass
+            metrics.observe_stage("queue_wait", 0.5)
+            # 嵌套调用复用外层计时
+            with metrics.request_timer("linux", "command") as inner:
+                self.assertIs(inner, timer)
+            timer.status = "success"
+        timings = timer.as_dict()
+        self.assertEqual(timings["queue_wait"], 500.0)
+        self.assertIn("inventory_write", timings)
+        self.assertIn("total", timings)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("version=0.0.4", response["Content-Type"])
+        lines = response.content.decode().splitlines()
+        labels = 'os_type="linux",exec_type="unittest"'
+        self.assertIn(f'remote_call_requests_total{{{labels},status="success"}} 1', lines)
+        self.assertIn(f'remote_call_in_flight{{{labels}}} 0', lines)
+        self.assertIn(f'remote_call_stage_seconds_bucket{{stage="queue_wait",{labels},le="0.25"}} 0', lines)
+        self.assertIn(f'remote_call_stage_seconds_bucket{{stage="queue_wait",{labels},le="0.5"}} 1', lines)
+        self.assertIn(f'remote_call_stage_seconds_count{{stage="queue_wait",{labels}}} 1', lines)
+
+
+class RemoteCallAsyncViewTests(ApiTestCase):
+    url = "/api/remote_call/aio"
+    payload = {
+        "os_type": "linux",
+        "ip": "10.0.0.1",
+        "username": "root",
+        "password": "secret",
+        "erp": "alice",
+        "engine": "native",
+        "use_bastion": False,
+        "command": "hostname",
+    }
+
+    def test_invalid_json(self):
+        response = self.client.post(self.url, "{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Invalid JSON body")
+
+    def test_invalid_request(self):
+        response = self.client.post(self.url, {"os_type": "linux"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("erp", response.json()["error"])
+
+    def test_execute(self):
+        result = {
+            "status": "success",
+            "data": {"host": "10.0.0.1", "stdout": "web-1", "stderr": "", "rc": 0},
+            "error": None,
+            "target": {"host": "10.0.0.1", "engine": "native"},
+        }
+        with mock.patch("remote_call.services.run_native_with_context", return_value=result) as runner:
+            response = self.client.post(self.url, self.payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(runner.call_args.args[0].command, "hostname")
+        body = response.json()
+        self.assertEqual(body["status"], "success")
+        self.assertEqual(body["data"]["stdout"], "web-1")
+        self.assertIn("total", body["timings"])
+
+
+def scheduler_config(**kwargs):
+    params = {
+        "scheduler_max_concurrent": 10,
+        "scheduler_max_per_target": 1,
+        "scheduler_max_per_user": 2,
+        "scheduler_max_per_bastion": 10,
+        "scheduler_queue_timeout": 0.3,
+    }
+    params.update(kwargs)
+    return SimpleNamespace(**params)
+
+
+class ExecutionSchedulerTests(TestCase):
+
+    def setUp(self):
+        self.scheduler = ExecutionScheduler()
+        self.config = scheduler_config()
+
+    def test_per_target_and_user_caps(self):
+        with self.scheduler.slot(self.config, ["10.0.0.1:22"], "alice"):
+            with self.assertRaises(SchedulerTimeout):
+                with self.scheduler.slot(self.config, ["10.0.0.1:22"], "bob"):
+                    pass
+            with self.scheduler.slot(self.config, ["10.0.0.2:22"], "alice"):
+                with self.assertRaises(SchedulerTimeout):
+                    with self.scheduler.slot(self.config, ["10.0.0.3:22"], "alice"):
+                        pass
+                self.assertEqual(self.scheduler.stats()["running"], 2)
+        self.assertEqual(self.scheduler.stats(), {"running": 0, "waiting": 0, "bastion_sessions": {}})
+
+    def test_per_bastion_session_cap(self):
+        config = scheduler_config(scheduler_max_per_target=10, scheduler_max_per_user=10, scheduler_max_per_bastion=3)
+        targets = ["10.0.0.1:22", "10.0.0.2:22", "10.0.0.3:22", "10.0.0.4:22"]
+        # 多主机执行按 forks 计算占用的堡垒机会话数
+        with self.scheduler.slot(config, targets, "alice", bastion="b1", forks=2):
+            self.assertEqual(self.scheduler.stats()["bastion_sessions"], {"b1": 2})
+            with self.scheduler.slot(config, ["10.0.0.5:22"], "bob", bastion="b1"):
+                with self.assertRaises(SchedulerTimeout):
+                    with self.scheduler.slot(config, ["10.0.0.6:22"], "carol", bastion="b1"):
+                        pass
+                # 其他堡垒机与直连目标不受影响
+                with self.scheduler.slot(config, ["10.0.0.6:22"], "carol", bastion="b2"):
+                    pass
+                with self.scheduler.slot(config, ["10.0.0.6:22"], "carol"):
+                    pass
+        self.assertEqual(self.scheduler.stats()["bastion_sessions"], {})
+
+    def test_cancel_queued(self):
+        config = scheduler_config(scheduler_queue_timeout=10)
+        errors = []
+
+        def queued():
+            try:
+                with self.scheduler.slot(config, ["10.0.0.1:22"], "bob", execution_id="queued"):
+                    pass
+            except ExecutionCanceled as e:
+                errors.append(e)
+
+        with self.scheduler.slot(config, ["10.0.0.1:22"], "alice"):
+            waiter = threading.Thread(target=queued)
+            waiter.start()
+            while not self.scheduler.stats()["waiting"]:
+                time.sleep(0.01)
+            self.assertTrue(self.scheduler.cancel("queued"))
+            waiter.join(2)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(self.scheduler.cancel("queued"))
+
+
+class AsyncJobViewTests(ApiTestCase):
+    payload = {"os_type": "linux", "ip": "10.0.0.1", "username": "root", "erp": "alice", "command": "hostname"}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("api.views.job_manager", JobManager())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.step_done = threading.Event()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def service(self, data, progress_callback=None):
+        progress_callback(0, 2, "shell:hostname", JOB_SUCCESS)
+        progress_callback(1, 2, "shell:uptime", JOB_RUNNING)
+        self.step_done.set()
+        self.release.wait(10)
+        return {"status": "success", "data": {"stdout": "web-1"}, "error": None}
+
+    def test_submit_poll_and_fetch_result(self):
+        with mock.patch("api.views.RemoteCallService", self.service):
+            response = self.client.post("/api/remote_call?async=1", self.payload, content_type="application/json")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["data"]["job_id"]
+
+        self.assertTrue(self.step_done.wait(5))
+        progress = self.client.get(f"/api/jobs/{job_id}").json()["data"]["progress"]
+        self.assertEqual((progress["done"], progress["total"]), (1, 2))
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}/result").status_code, 202)
+
+        self.release.set()
+        deadline = time.monotonic() + 5
+        while self.client.get(f"/api/jobs/{job_id}").json()["data"]["status"] != JOB_SUCCESS:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        response = self.client.get(f"/api/jobs/{job_id}/result")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["stdout"], "web-1")
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get("/api/jobs/missing").status_code, 404)
+        self.assertEqual(self.client.get("/api/jobs/missing/result").status_code, 404)
+
+
+class JobCancelViewTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manager = JobManager()
+        self.manager.max_workers = 1
+        patcher = mock.patch("api.views.job_manager", self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def blocking_service(self, data, progress_callback=None):
+        self.release.wait(10)
+        return {"status": "success", "data": None}
+
+    def cancel(self, job):
+        return self.client.post(f"/api/jobs/{job.id}/cancel")
+
+    def test_cancel_pending_and_running(self):
+        running = self.manager.submit(self.blocking_service, {})
+        pending = self.manager.submit(self.blocking_service, {})
+        while running.status != JOB_RUNNING:
+            time.sleep(0.01)
+
+        response = self.cancel(pending)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(pending.status, JOB_ERROR)
+        self.assertEqual(pending.result["error"], "执行已取消")
+
+        # 执行中的任务已登记取消事件（获取执行槽位前也可取消）
+        self.assertEqual(self.cancel(running).status_code, 202)
+        self.release.set()
+        while not running.is_finished():
+            time.sleep(0.01)
+        self.assertEqual(self.cancel(running).status_code, 409)
+        self.assertIsNone(pending.started_at)
+
+    def test_cancel_unknown_job(self):
+        self.assertEqual(self.client.post("/api/jobs/missing/cancel").status_code, 404)
+
+
+class FakeH3CSession:
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def run(self, command, timeout, cancel_event=None):
+        output = self.outputs[command]
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+
+class H3CSessionTests(TestCase):
+
+    def test_prompt_and_errors(self):
+        for prompt, sysname in (("<H3C>", "H3C"), ("[SW01]", "SW01"), ("[H3C-GigabitEthernet1/0/1]", "H3C")):
+            self.assertEqual(h3c.PROMPT_RE.fullmatch(prompt).group(1), sysname)
+        self.assertIsNone(h3c.PROMPT_RE.fullmatch("Interface <GE1/0/1> up"))
+        output = "%Oct 18 10:00:00:000 2026 H3C SHELL/5/SHELL_LOGIN: logged in\n  % Unrecognized command found at '^' position."
+        self.assertEqual(h3c.comware_errors(output), ["% Unrecognized command found at '^' position."])
+        self.assertEqual(h3c.split_commands("display version\n\n display clock \n"), ["display version", "display clock"])
+
+    def test_session_key_includes_credentials(self):
+        key = h3c.H3CSessionPool._key
+        right = make_context(os_type="h3c", password="right")
+        self.assertEqual(key(right), key(make_context(os_type="h3c", password="right")))
+        self.assertNotEqual(key(right), key(make_context(os_type="h3c", password="wrong")))
+        self.assertNotEqual(key(right), key(make_context(os_type="h3c")))
+
+    def test_concurrent_login_registers_before_unlocking(self):
+        # 先到者登录完成后，后到的请求必须复用其会话，而不是再次登录并关闭先到者的会话
+        pool = h3c.H3CSessionPool()
+        config_context = get_ansible_config(make_context(os_type="h3c", password="x", use_bastion=False))
+        user_context = make_context(os_type="h3c", password="x", use_bastion=False)
+        key = pool._key(user_context)
+        sessions, late = [], []
+
+        def connect(user_context, config_context):
+            session = mock.Mock(lock=threading.Lock(), last_used=time.monotonic())
+            session.is_active.return_value = True
+            sessions.append(session)
+            return session
+
+        class ObservedLock:
+            """
+            每次释放池锁后检查：登录已完成但会话尚未登记、登录锁已移除时，让一个请求在此间隙到达。
+            """
+
+            def __init__(self):
+                self.lock = threading.Lock()
+
+            def __enter__(self):
+                self.lock.acquire()
+
+            def __exit__(self, *exc):
+                self.lock.release()
+                if sessions and not late and key not in pool._connecting and key not in pool._sessions:
+                    late.append(threading.Thread(target=pool._get, args=(key, user_context, config_context)))
+                    late[0].start()
+                    late[0].join()
+
+        pool._lock = ObservedLock()
+        with mock.patch.object(h3c.H3CSessionPool, "_connect", side_effect=connect):
+            session = pool._get(key, user_context, config_context)
+            pool._get(key, user_context, config_context)
+
+        self.assertEqual(sessions, [session])
+        session.close.assert_not_called()
+
+    def test_commands_partial_results(self):
+        user_context = make_context(
+            os_type="h3c", password="x", use_bastion=False, command=["display clock", "display version", "display cpu"]
+        )
+        session = FakeH3CSession({
+            "display clock": "10:00:00 UTC Sun 10/18/2026",
+            "display version": h3c.H3CSessionError("session closed by device"),
+        })
+        with mock.patch.object(h3c.h3c_session_pool, "acquire", return_value=session), \
+                mock.patch.object(h3c.h3c_session_pool, "release") as release:
+            items, error = h3c.run_h3c_commands(user_context, get_ansible_config(user_context))
+        self.assertEqual(error, "session closed by device")
+        self.assertEqual([item["command"] for item in items], ["display clock"])
+        self.assertEqual(items[0]["rc"], 0)
+        self.assertTrue(release.call_args.kwargs["discard"])
+
+    def test_per_command_results_stop_on_error(self):
+        user_context = make_context(
+            os_type="h3c", password="x", use_bastion=False, continue_on_error=False,
+            command="display clock\ndisplay foo\ndisplay version",
+        )
+        session = FakeH3CSession({
+            "display clock": "10:00:00 UTC Sun 10/18/2026",
+            "display foo": "          ^\n % Unrecognized command found at '^' position.",
+        })
+        task_context = SimpleNamespace(module="raw")
+        with mock.patch.object(h3c.h3c_session_pool, "acquire", return_value=session), \
+                mock.patch.object(h3c.h3c_session_pool, "release") as release:
+            result = h3c.run_h3c_with_context(user_context, get_ansible_config(user_context), task_context)
+
+        # 命令级失败不影响会话复用
+        self.assertFalse(release.call_args.kwargs["discard"])
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["error"], "display foo: % Unrecognized command found at '^' position.")
+        steps = [step["result"][0] for step in result["all_results"]]
+        self.assertEqual([step["command"] for step in steps], ["display clock", "display foo", "display version"])
+        self.assertEqual(steps[0]["rc"], 0)
+        self.assertEqual(steps[1]["rc"], 1)
+        self.assertTrue(steps[2]["skipped"])
+
+    def test_ansible_fallback_one_raw_task_per_command(self):
+        user_context = make_context(os_type="h3c", password="x", use_bastion=False,
+                                    command=["display clock", "display version"])
+        runtime_dir = tempfile.mkdtemp(prefix="rc-runtime-test-")
+        self.addCleanup(shutil.rmtree, runtime_dir, ignore_errors=True)
+        with override_settings(BASTION_CONFIG=bastion_config(RUNTIME_DIR=runtime_dir)):
+            path, _ = generate_playbook(user_context, get_ansible_config(user_context))
+        with open(path) as f:
+            tasks = yaml.safe_load(f)[0]["tasks"]
+        self.assertEqual([task["raw"] for task in tasks], ["display clock", "display version"])
+        self.assertTrue(all(task["failed_when"] == h3c_failed_when and task["ignore_errors"] for task in tasks))
+
+
+class BastionKeyCacheTests(TestCase):
+
+    def setUp(self):
+        key_dir = tempfile.mkdtemp(prefix="rc-key-test-")
+        self.addCleanup(shutil.rmtree, key_dir, ignore_errors=True)
+        self.config = SimpleNamespace(
+            bastion_temp_private_key_with_user=os.path.join(key_dir, "alice", "id_rsa"), key_cache_ttl=300,
+            key_cache_retry_interval=30, bastion_name=None,
+        )
+        self.cache = BastionKeyCache()
+
+    def test_concurrent_requests_share_one_fetch(self):
+        def slow_read(config_context):
+            time.sleep(0.2)
+            return b"KEY"
+
+        with mock.patch("ansible.key_cache._read_bastion_key", side_effect=slow_read) as read:
+            threads = [threading.Thread(target=self.cache.get, args=(self.config,)) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            path = self.cache.get(self.config)
+
+        self.assertEqual(read.call_count, 1)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"KEY")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def test_expired_entry_serves_cached_copy_when_bastion_down(self):
+        with mock.patch("ansible.key_cache._read_bastion_key", return_value=b"KEY"):
+            path = self.cache.get(self.config)
+        self.config.key_cache_ttl = 0
+        with mock.patch("ansible.key_cache._read_bastion_key", side_effect=OSError("refused")) as read:
+            self.assertEqual(self.cache.get(self.config), path)
+            # 回源失败后的重试间隔内不再回源
+            self.assertEqual(self.cache.get(self.config), path)
+        read.assert_called_once()
+        later = time.monotonic() + 31
+        with mock.patch("ansible.key_cache._read_bastion_key", return_value=b"KEY2") as read, \
+                mock.patch("ansible.key_cache.time.monotonic", return_value=later):
+            self.cache.get(self.config)
+        read.assert_called_once()
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"KEY2")
+        self.cache.invalidate()
+        os.remove(path)
+        with mock.patch("ansible.key_cache._read_bastion_key", side_effect=OSError("refused")):
+            with self.assertRaises(OSError):
+                self.cache.get(self.config)
+
+
+class ControlSocketTests(TestCase):
+
+    def setUp(self):
+        self.control_dir = tempfile.mkdtemp(prefix="rc-mux-test-")
+        self.addCleanup(shutil.rmtree, self.control_dir, ignore_errors=True)
+        patcher = override_settings(BASTION_CONFIG=bastion_config(SSH_CONTROL_DIR=self.control_dir, SSH_MUX_ENABLED=True))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def ssh_args(self, user_context):
+        config_context = get_ansible_config(user_context)
+        control_socket_pool.acquire(user_context, config_context)
+        return user_context.get_ssh_args(config_context)
+
+    def test_key_auth_control_path_per_erp(self):
+        alice = self.ssh_args(make_context(erp="alice"))
+        bob = self.ssh_args(make_context(erp="bob"))
+        self.assertIn(f"ControlPath={self.control_dir}/", alice)
+        self.assertNotEqual(alice.rsplit("ControlPath=", 1)[1], bob.rsplit("ControlPath=", 1)[1])
+
+    def test_password_auth_disables_mux(self):
+        user_context = make_context(password="secret")
+        config_context = get_ansible_config(user_context)
+        control_socket_pool.acquire(user_context, config_context)
+        self.assertIsNone(config_context.target_control_path)
+        self.assertIn("-o ControlPath=none", user_context.get_ssh_args(config_context))
+
+    def test_h3c_disables_mux(self):
+        args = self.ssh_args(make_context(os_type="h3c", command="display version"))
+        self.assertIn("KexAlgorithms=+diffie-hellman-group1-sha1", args)
+        self.assertIn("-o ControlPath=none", args)
+
+
+class BastionPoolTests(TestCase):
+
+    def setUp(self):
+        patcher = override_settings(BASTION_CONFIG=bastion_config(
+            BASTIONS=[{"name": "a", "ip": "10.1.0.1"}, {"name": "b", "ip": "10.2.0.1"}],
+            BASTION_ROUTES=[
+                {"cidr": "10.0.0.0/8", "bastions": ["a"]},
+                {"cidr": "10.2.0.0/16", "bastions": ["b"]},
+                {"cidr": "172.16.0.0/12", "bastions": ["a", "b"]},
+            ],
+            BASTION_PORT=22,
+            BASTION_HEALTH_INTERVAL=0,
+        ))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        pool_patcher = mock.patch.object(bastion_pool, "_bastions", None)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+
+    def config(self, ip):
+        return get_ansible_config(make_context(ip=ip))
+
+    def test_longest_prefix_route(self):
+        self.assertEqual(self.config("10.2.3.4").bastion_name, "b")
+        self.assertEqual(self.config("10.9.9.9").bastion_name, "a")
+        self.assertEqual(self.config("10.2.3.4").bastion_ip, "10.2.0.1")
+
+    def test_failover_on_connect_refused(self):
+        config_context = self.config("172.16.0.5")
+        used = config_context.bastion_ip
+        error = {
+            "msg": f"Failed to connect to the host via ssh: ssh: connect to host {used} port 22: Connection refused",
+            "unreachable": True,
+        }
+        self.assertTrue(bastion_pool.check_failover(make_context(ip="172.16.0.5"), config_context, {"status": "error", "error": error}))
+        self.assertEqual(bastion_pool.stats()[config_context.bastion_name], 0)
+        self.assertNotEqual(self.config("172.16.0.5").bastion_ip, used)
+
+    def test_failover_on_reported_connect_error(self):
+        config_context = self.config("172.16.0.5")
+        bastion_pool.report_unreachable(config_context, ConnectionRefusedError(111, "Connection refused"))
+        response = {"status": "error", "error": str(config_context.bastion_error)}
+        self.assertTrue(bastion_pool.check_failover(make_context(ip="172.16.0.5"), config_context, response))
+
+    def test_no_failover_after_stale_key_fallback(self):
+        # 私钥回源失败但沿用旧副本时请求已到达目标，命令失败不能触发切换重试
+        user_context = make_context(ip="172.16.0.5")
+        config_context = self.config("172.16.0.5")
+        key_dir = tempfile.mkdtemp(prefix="rc-key-test-")
+        self.addCleanup(shutil.rmtree, key_dir, ignore_errors=True)
+        config_context.bastion_temp_private_key_with_user = os.path.join(key_dir, "id_rsa")
+        cache = BastionKeyCache()
+        with mock.patch("ansible.key_cache._read_bastion_key", return_value=b"KEY"):
+            path = cache.get(config_context)
+        config_context.key_cache_ttl = 0
+        refused = ConnectionRefusedError(111, "Connection refused")
+        with mock.patch("ansible.key_cache._read_bastion_key", side_effect=refused):
+            self.assertEqual(cache.get(config_context), path)
+        self.assertIsNone(config_context.bastion_error)
+        response = {"status": "error", "error": {"msg": "non-zero return code", "rc": 1}}
+        self.assertFalse(bastion_pool.check_failover(user_context, config_context, response))
+        self.assertEqual(bastion_pool.stats(), {"a": 1, "b": 1})
+
+        # 没有可用副本时拉取失败即未到达目标，可以切换
+        cache.invalidate()
+        os.remove(path)
+        with mock.patch("ansible.key_cache._read_bastion_key", side_effect=refused):
+            with self.assertRaises(ConnectionRefusedError):
+                cache.get(config_context)
+        self.assertTrue(bastion_pool.check_failover(user_context, config_context, response))
+
+    def test_no_failover_after_connect(self):
+        user_context = make_context(ip="172.16.0.5")
+        config_context = self.config("172.16.0.5")
+        ip = config_context.bastion_ip
+        for response in (
+            {"status": "error", "error": {"msg": f"Shared connection to 172.16.0.5 closed. Connection closed by {ip} port 22"}},
+            {"status": "error", "error": {"msg": f"Connection reset by {ip} port 22"}},
+            {"status": "error", "error": {"msg": "non-zero return code"},
+             "data": {"stdout": f"ssh: connect to host {ip} port 22: Connection refused"}},
+        ):
+            self.assertFalse(bastion_pool.check_failover(user_context, config_context, response))
+        self.assertEqual(bastion_pool.stats(), {"a": 1, "b": 1})
+
+
+class BatchBastionRouteTests(ApiTestCase):
+    """
+    批量执行按各主机路由到的堡垒机分组，每组单独生成 inventory 并执行。
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = override_settings(BASTION_CONFIG=bastion_config(
+            BASTIONS=[{"name": "a", "ip": "10.1.0.1"}, {"name": "b", "ip": "10.2.0.1"}],
+            BASTION_ROUTES=[
+                {"cidr": "10.1.0.0/16", "bastions": ["a"]},
+                {"cidr": "10.2.0.0/16", "bastions": ["b"]},
+            ],
+            BASTION_PORT=22,
+            BASTION_HEALTH_INTERVAL=0,
+        ))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        pool_patcher = mock.patch.object(bastion_pool, "_bastions", None)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+        self.runs = []
+
+    def fake_run(self, unreachable=()):
+        def run(user_context, config_context, task_context, inventory_path, playbook_path, forks=None, targets=None):
+            self.runs.append((config_context.bastion_name, inventory_path))
+            items = []
+            for ctx in inventory_path:
+                if (config_context.bastion_name, ctx.ip) in unreachable:
+                    items.append({"host": ctx.ip, "unreachable": True, "msg": (
+                        "Failed to connect to the host via ssh: "
+                        f"ssh: connect to host {config_context.bastion_ip} port 22: Connection refused"
+                    )})
+                else:
+                    items.append({"host": ctx.ip, "stdout": config_context.bastion_name, "rc": 0})
+            return {"status": "success", "all_results": [{"task": "shell:hostname", "focus": True, "result": items}]}
+        return run
+
+    def run_batch(self, targets, run):
+        # inventory 路径替换为该组的用户上下文，便于断言分组
+        with mock.patch("remote_call.services.generate_batch_inventory", side_effect=lambda ctxs, cfg: (ctxs, lambda: None)), \
+                mock.patch("remote_call.services.run_ansible_with_context", side_effect=run):
+            return RemoteCallBatchService({
+                "os_type": "linux", "username": "root", "erp": "alice", "command": "hostname", "targets": targets
+            })
+
+    def test_one_run_per_bastion(self):
+        response = self.run_batch(["10.1.0.5", "10.2.0.5", "10.1.0.6"], self.fake_run())
+
+        groups = {name: [ctx.ip for ctx in ctxs] for name, ctxs in self.runs}
+        self.assertEqual(groups, {"a": ["10.1.0.5", "10.1.0.6"], "b": ["10.2.0.5"]})
+        self.assertEqual([item["stdout"] for item in response["data"]], ["a", "b", "a"])
+        self.assertEqual(response["summary"], {"total": 3, "ok": 3, "failed": 0})
+        self.assertEqual(len(response["all_results"]), 1)
+        self.assertEqual(len(response["all_results"][0]["result"]), 3)
+
+    def test_failover_retries_only_unreached_hosts(self):
+        routes = [{"cidr": "10.1.0.0/16", "bastions": ["a"]}, {"cidr": "10.2.0.0/16", "bastions": ["b", "a"]}]
+        # 候选并列时固定取第一台：10.2.0.5 先经 b
+        with override_settings(BASTION_CONFIG=bastion_config(BASTION_ROUTES=routes)), \
+                mock.patch.object(bastion_pool, "_rr", itertools.repeat(0)):
+            response = self.run_batch(["10.1.0.5", "10.2.0.5"], self.fake_run(unreachable={("b", "10.2.0.5")}))
+
+        self.assertEqual([(name, [ctx.ip for ctx in ctxs]) for name, ctxs in self.runs][-1], ("a", ["10.2.0.5"]))
+        self.assertEqual(bastion_pool.stats(), {"a": 1, "b": 0})
+        self.assertEqual([item["stdout"] for item in response["data"]], ["a", "a"])
+        self.assertEqual(response["status"], "success")
+        self.assertEqual([item["host"] for item in response["all_results"][0]["result"]], ["10.1.0.5", "10.2.0.5"])
+
+
+class RuntimeFileTests(TestCase):
+
+    def setUp(self):
+        self.runtime_dir = tempfile.mkdtemp(prefix="rc-runtime-test-")
+        self.addCleanup(shutil.rmtree, self.runtime_dir, ignore_errors=True)
+        patcher = override_settings(BASTION_CONFIG=bastion_config(RUNTIME_DIR=self.runtime_dir, RUNTIME_CACHE_TTL=600))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def inventory(self, user_context):
+        return generate_inventory(user_context, get_ansible_config(user_context))
+
+    def test_key_auth_inventory_is_cached(self):
+        path, cleanup = self.inventory(make_context())
+        cleanup()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.inventory(make_context())[0], path)
+
+    def test_password_inventory_removed_after_run(self):
+        path, cleanup = self.inventory(make_context(password="secret", use_bastion=False))
+        with open(path) as f:
+            self.assertIn("ansible_password=secret", f.read())
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        cleanup()
+        self.assertFalse(os.path.exists(path))
+
+    def test_prune_uses_files_on_disk(self):
+        # 其他（或已重启的）进程遗留的闲置文件
+        stale = os.path.join(self.runtime_dir, "stale.ini")
+        reused = os.path.join(self.runtime_dir, hashlib.sha256(b"x").hexdigest() + ".ini")
+        for path in (stale, reused):
+            with open(path, "w") as f:
+                f.write("x")
+            os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+        remote_utils._pruned_at.pop(self.runtime_dir, None)
+        path, _ = remote_utils.write_cached_file("x", suffix=".ini", dir=self.runtime_dir, ttl=600)
+
+        self.assertEqual(path, reused)
+        self.assertTrue(os.path.exists(reused))
+        self.assertFalse(os.path.exists(stale))
+
+
+class WindowsScriptPlaybookTests(TestCase):
+
+    def setUp(self):
+        runtime_dir = tempfile.mkdtemp(prefix="rc-runtime-test-")
+        self.addCleanup(shutil.rmtree, runtime_dir, ignore_errors=True)
+        patcher = override_settings(BASTION_CONFIG=bastion_config(
+            RUNTIME_DIR=runtime_dir, ARTIFACTS_DIR=os.path.join(runtime_dir, "artifacts")
+        ))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.user_context = make_context(
+            os_type="windows", command=None, file_path="/scripts/check.ps1", password="secret", use_bastion=False
+        )
+        self.config_context = get_ansible_config(self.user_context)
+
+    def test_single_play_with_cleanup_in_always(self):
+        path, cleanup = generate_playbook(self.user_context, self.config_context)
+        self.addCleanup(cleanup)
+        with open(path) as f:
+            plays = yaml.safe_load(f)
+        self.assertEqual(len(plays), 1)
+        block = plays[0]["tasks"][0]
+        self.assertEqual([list(task)[1] for task in block["block"]], ["win_copy", "win_shell"])
+        self.assertEqual(list(block["always"][0])[1], "win_file")
+
+    def test_steps_split_from_one_run(self):
+        steps = get_windows_script_steps("/scripts/check.ps1")
+        events = [
+            {"event": "runner_on_ok", "event_data": {"task": step["task"], "host": "10.0.0.1",
+                                                      "res": {"stdout": f"out-{step['module']}", "rc": 0}}}
+            for step in steps
+        ]
+        task_context = AnsibleTaskContext(self.user_context, self.config_context)
+        with mock.patch(
+            "ansible.runner.run_with_cancel", return_value=SimpleNamespace(status="successful", events=events)
+        ) as run:
+            result = run_ansible_with_context(
+                self.user_context, self.config_context, task_context, "inventory.ini", "playbook.yml"
+            )
+
+        run.assert_called_once()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual([step["task"] for step in result["all_results"]], [step["task"] for step in steps])
+        self.assertEqual(result["data"]["stdout"], "out-win_shell")
+
+
+class ArtifactManagerTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix="rc-artifacts-test-")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.config = SimpleNamespace(
+            artifacts_mode="disk", artifacts_dir=os.path.join(root, "artifacts"), runtime_dir=os.path.join(root, "run"),
+            artifacts_max_age=3600, artifacts_retention=3, artifacts_max_bytes=250, artifacts_gc_interval=3600,
+        )
+
+    def make_dir(self, name, age, size=0):
+        path = os.path.join(self.config.artifacts_dir, name)
+        os.makedirs(path)
+        with open(os.path.join(path, "stdout"), "w") as f:
+            f.write("x" * size)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_gc_applies_age_count_and_size_limits(self):
+        self.make_dir("expired", age=7200)
+        self.make_dir("oldest", age=400, size=100)
+        self.make_dir("older", age=300, size=100)
+        self.make_dir("old", age=200, size=100)
+        self.make_dir("new", age=100, size=100)
+
+        ArtifactManager().gc(self.config)
+
+        # 过期与超出保留数量的先删除，余下 300 字节超过上限，再删最旧的一个
+        self.assertEqual(sorted(os.listdir(self.config.artifacts_dir)), ["new", "old"])
+
+    def test_gc_skips_running_jobs(self):
+        manager = ArtifactManager()
+        with manager.job_dir(self.config, "running") as path:
+            os.utime(path, (time.time() - 7200, time.time() - 7200))
+            with open(os.path.join(path, "stdout"), "w") as f:
+                f.write("x" * 300)
+            self.make_dir("done", age=100, size=10)
+
+            manager.gc(self.config)
+
+            # 执行中的目录既已过期又超过大小上限，仍保留；已结束的目录因总大小超限被删除
+            self.assertEqual(os.listdir(self.config.artifacts_dir), ["running"])
+        manager.gc(self.config)
+        self.assertEqual(os.listdir(self.config.artifacts_dir), [])
+
+    def test_memory_mode_removes_dir_on_exit(self):
+        self.config.artifacts_mode = "memory"
+        with ArtifactManager().job_dir(self.config, "job-1") as path:
+            self.assertTrue(path.startswith(self.config.runtime_dir))
+            self.assertTrue(os.path.isdir(path))
+        self.assertFalse(os.path.exists(path))
+
+
+class BenchSSHServerTests(TestCase):
+
+    def setUp(self):
+        self.server = BenchSSHServer().start()
+        self.addCleanup(self.server.close)
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect(
+            "127.0.0.1", self.server.port, username="bench", password="x", look_for_keys=False, allow_agent=False
+        )
+        self.addCleanup(self.client.close)
+
+    def test_concurrent_short_execs_on_one_connection(self):
+        # 命令很快结束时，通道关闭不能先于 exec 请求的应答，会话通道也不能被提前回收
+        results = []
+
+        def run():
+            for _ in range(10):
+                _, stdout, _ = self.client.exec_command("echo bench", timeout=10)
+                results.append((stdout.read(), stdout.channel.recv_exit_status()))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [(b"bench\n", 0)] * 40)
+
+
+class NativeEngineTests(ApiTestCase):
+    """
+    原生引擎对本机 bench sshd 执行真实命令（sshd 同时充当堡垒机与目标主机）。
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = BenchSSHServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.work_dir = tempfile.mkdtemp(prefix="rc-native-test-")
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        key_file = os.path.join(self.work_dir, "id_rsa")
+        paramiko.RSAKey.generate(2048).write_private_key_file(key_file)
+        patcher = override_settings(BASTION_CONFIG=bastion_config(
+            BASTION_IP="127.0.0.1",
+            BASTION_PORT=self.server.port,
+            BASTION_USER="bench",
+            BASTION_PRIVATE_KEY=key_file,
+            JUMP_PRIVATE_KEY=key_file,
+            BASTION_TEMP_PRIVATE_KEY=os.path.join(self.work_dir, "tmp_key"),
+            BASTIONS=[],
+            KEY_CACHE_TTL=0,
+        ))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        # 堡垒机池在首次选择时加载配置，测试内重新加载
+        pool_patcher = mock.patch.object(bastion_pool, "_bastions", None)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+        self.addCleanup(native.native_ssh_pool.close_all)
+
+    def context(self, command, **kwargs):
+        return make_context(**dict({"ip": "127.0.0.1", "port": self.server.port, "command": command}, **kwargs))
+
+    def run_native(self, user_context):
+        task_context = SimpleNamespace(module="shell", module_args=user_context.command)
+        return native.run_native_with_context(user_context, get_ansible_config(user_context), task_context)
+
+    def test_large_stderr_does_not_block(self):
+        result = self.run_native(self.context("head -c 3000000 /dev/zero | tr '\\0' x >&2; echo done"))
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["data"]["stdout"], "done")
+        self.assertEqual(len(result["data"]["stderr"]), 3000000)
+
+    def test_per_request_key_removed(self):
+        result = self.run_native(self.context("echo ok"))
+        self.assertEqual(result["data"]["stdout"], "ok")
+        self.assertEqual(os.listdir(self.work_dir), ["id_rsa"])
+
+    def test_reconnect_before_exec(self):
+        open_session, clients = native._open_session, []
+
+        def stale_once(client, timeout):
+            clients.append(client)
+            if len(clients) == 1:
+                raise paramiko.SSHException("SSH session not active")
+            return open_session(client, timeout)
+
+        user_context = self.context("echo ok", use_bastion=False, password="x")
+        with mock.patch.object(native, "_open_session", side_effect=stale_once):
+            result = self.run_native(user_context)
+        self.assertEqual(result["data"]["stdout"], "ok")
+        self.assertEqual(len(clients), 2)
+        self.assertIsNot(clients[0], clients[1])
+
+    def test_cancel_running_command(self):
+        scheduler = native.execution_scheduler
+        user_context = self.context("sleep 30", use_bastion=False, password="x")
+        threading.Timer(0.5, scheduler.cancel, [user_context.get_uuid()]).start()
+        start = time.monotonic()
+        result = self.run_native(user_context)
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["error"], "执行已取消")
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_idle_eviction_spares_running_command(self):
+        # 命令执行时间超过空闲超时：其他请求触发淘汰时不能关闭执行中的目标连接及其经过的堡垒机连接
+        with override_settings(BASTION_CONFIG=bastion_config(NATIVE_IDLE_TIMEOUT=1)):
+            results = []
+            user_context = self.context("sleep 2.5; echo done")
+            worker = threading.Thread(target=lambda: results.append(self.run_native(user_context)))
+            worker.start()
+            time.sleep(1.5)
+            other = self.run_native(self.context("echo other", username="other"))
+            worker.join()
+
+        self.assertEqual(other["data"]["stdout"], "other")
+        self.assertEqual(results[0]["status"], "success")
+        self.assertEqual(results[0]["data"]["stdout"], "done")
+        self.assertEqual(native.native_ssh_pool.stats(), {"bastion": 1, "target": 2})
+
+    def test_no_retry_after_exec(self):
+        marker = os.path.join(self.work_dir, "runs")
+        run_channel = native._run_channel
+
+        def run_then_drop(*args):
+            run_channel(*args)
+            raise EOFError("connection lost")
+
+        user_context = self.context(f"echo run >> {marker}", use_bastion=False, password="x")
+        with mock.patch.object(native, "_run_channel", side_effect=run_then_drop):
+            result = self.run_native(user_context)
+        self.assertEqual(result["status"], "error")
+        with open(marker) as f:
+            self.assertEqual(f.read(), "run\n")
+
+
+# 集成测试需要真实的 ansible-core（ansible 命令）与 ansible_runner
+HAS_ANSIBLE = bool(shutil.which("ansible") and importlib.util.find_spec("ansible_runner"))
+
+
+@skipUnless(HAS_ANSIBLE, "ansible-core and ansible-runner are required")
+class WarmAnsiblePoolIntegrationTests(TestCase):
+    """
+    经预热进程池执行真实的 ansible_runner.run（本机 local 连接），验证回调插件与事件解析可用。
+    """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="rc-warm-test-")
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        self.pool = WarmAnsiblePool()
+        self.addCleanup(self.pool.close)
+        # 每个工作进程只处理一次执行，执行后进程号变化即证明请求经由预热进程完成
+        self.config = SimpleNamespace(
+            warm_pool_size=1, warm_pool_max_jobs=1, warm_pool_dir=os.path.join(self.work_dir, "pool")
+        )
+        self.inventory = os.path.join(self.work_dir, "hosts.ini")
+        with open(self.inventory, "w") as f:
+            f.write(f"[t]\nlocalhost ansible_connection=local ansible_python_interpreter={sys.executable}\n")
+
+    def run_warm(self, **kwargs):
+        import ansible_runner
+
+        envvars = self.pool.envvars(self.config)
+        self.assertIn("RC_WARM_SOCKET", envvars)
+        worker = self.pool._workers[0].pid
+        r = ansible_runner.run(
+            private_data_dir=tempfile.mkdtemp(dir=self.work_dir),
+            inventory=self.inventory,
+            quiet=True,
+            envvars=envvars,
+            **kwargs
+        )
+        deadline = time.monotonic() + 10
+        while self.pool._workers[0].pid == worker and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.assertNotEqual(self.pool._workers[0].pid, worker)
+        return r
+
+    def test_adhoc_events(self):
+        r = self.run_warm(host_pattern="t", module="command", module_args="echo warm")
+        self.assertEqual(r.status, "successful")
+        ok = [e for e in r.events if e["event"] == "runner_on_ok"]
+        self.assertEqual([e["event_data"]["res"]["stdout"] for e in ok], ["warm"])
+
+    def test_playbook_events(self):
+        playbook = os.path.join(self.work_dir, "play.yml")
+        with open(playbook, "w") as f:
+            f.write("- hosts: t\n  gather_facts: false\n  tasks:\n    - name: step\n      command: echo step\n")
+        r = self.run_warm(playbook=playbook)
+        self.assertEqual(r.status, "successful")
+        ok = [e for e in r.events if e["event"] == "runner_on_ok"]
+        self.assertEqual([(e["event_data"]["task"], e["event_data"]["res"]["stdout"]) for e in ok], [("step", "step")])
+
+
+class FakeRedisScripts:
+    """
+    按 Lua 脚本返回预设结果的 Redis 客户端替身，记录脚本调用与 BLPOP 等待。
+    """
+
+    def __init__(self, results):
+        self.results = {lua: list(values) for lua, values in results.items()}
+        self.calls = []
+        self.blpops = []
+
+    def register_script(self, lua):
+        def run(keys, args):
+            self.calls.append(lua)
+            return self.results[lua].pop(0)
+        return run
+
+    def blpop(self, keys, timeout):
+        self.blpops.append(timeout)
+        return (keys[0], b"1")
+
+
+class RedisLimiterTests(TestCase):
+
+    def fake_redis(self, results):
+        client = FakeRedisScripts(results)
+        patcher = mock.patch("utils.limits._get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+    def test_token_bucket_sleeps_once_for_reserved_wait(self):
+        self.fake_redis({limits.TOKEN_BUCKET_LUA: [[1, "0.25"], [0, "2.5"]]})
+        view = limits.redis_token_bucket_limit("test", capacity=1, wait_timeout=1)(lambda self, request: "ok")
+
+        with mock.patch("utils.limits.time.sleep") as sleep:
+            self.assertEqual(view(None, None), "ok")
+            sleep.assert_called_once_with(0.25)
+            response = view(None, None)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "3")
+
+    def test_semaphore_waits_on_handoff_instead_of_polling(self):
+        client = self.fake_redis({
+            # 首次未获得槽位（最早租约 5 秒后到期），被唤醒后确认持有
+            limits.SEMAPHORE_ACQUIRE_LUA: [[0, 5000], [1, 0]],
+            limits.SEMAPHORE_RELEASE_LUA: [1],
+        })
+        view = limits.redis_concurrency_limit("test", max_concurrent=1, wait_timeout=30)(lambda self, request: "ok")
+
+        self.assertEqual(view(None, None), "ok")
+        self.assertEqual(len(client.blpops), 1)
+        self.assertAlmostEqual(client.blpops[0], 5.01, places=2)
+        self.assertEqual(client.calls[-1], limits.SEMAPHORE_RELEASE_LUA)
+
+
+@override_settings(HISTORY_CONFIG=dict(settings.HISTORY_CONFIG, OUTPUT_HEAD_BYTES=8, OUTPUT_TAIL_BYTES=8))
+class ExecutionHistoryTests(TestCase):
+
+    def setUp(self):
+        self.recorder = ExecutionRecorder()
+        # 同步写库，代替后台批量写入线程
+        patcher = mock.patch.object(
+            self.recorder, "_enqueue", side_effect=lambda rows: ExecutionRecord.objects.bulk_create(rows)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_record_is_redacted_and_queryable(self):
+        user_context = make_context(
+            command="mysql --password=hunter2 -e 'select 1'", password="secret", extra={"api_token": "t0k"}
+        )
+        self.recorder.record(user_context, {
+            "status": "error",
+            "data": {"stdout": "x" * 100, "stderr": "", "rc": 1},
+            "error": "login failed: ansible_password=secret",
+            "timings": {"total": 12.5},
+        })
+        self.recorder.record(make_context(ip="10.0.0.2"), {"status": "success", "data": {"stdout": "ok", "rc": 0}})
+
+        record = ExecutionRecord.objects.get(execution_id=user_context.get_uuid())
+        self.assertEqual(record.command, "mysql --password=****** -e 'select 1'")
+        self.assertEqual(record.request["password"], "******")
+        self.assertEqual(record.request["extra"]["api_token"], "******")
+        self.assertEqual(record.error, "login failed: ansible_password=******")
+        self.assertEqual((record.stdout_bytes, record.rc), (100, 1))
+        self.assertIn("[truncated 84 bytes]", record.stdout)
+
+        body = self.client.get("/api/executions", {"ip": "10.0.0.1", "status": "error"}).json()
+        self.assertEqual([r["execution_id"] for r in body["data"]["results"]], [user_context.get_uuid()])
+        self.assertEqual(len(self.client.get("/api/executions", {"within": 3600}).json()["data"]["results"]), 2)
+        detail = self.client.get(f"/api/executions/{user_context.get_uuid()}")
+        self.assertEqual(detail.json()["data"][0]["request"]["password"], "******")
+        self.assertEqual(self.client.get("/api/executions/missing").status_code, 404)
+
+
+@override_settings(RESULT_CACHE={"ENABLED": True, "BACKEND": "memory", "COMMANDS": {"uptime": 60}})
+class ResultCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache = ResultCache()
+
+    def context(self, **kwargs):
+        return make_context(**dict({"command": "uptime", "cache": True}, **kwargs))
+
+    def store(self, user_context):
+        result = {"status": "success", "data": {"stdout": "up 1 day"}, "scheduler": {"queue_depth": 3, "wait_time": 1.5}}
+        self.cache.set(user_context, result)
+        return result
+
+    def test_hit_strips_scheduler(self):
+        self.assertEqual(self.store(self.context())["cache"]["hit"], False)
+        cached = self.cache.get(self.context(port=22))
+        self.assertTrue(cached["cache"]["hit"])
+        self.assertEqual(cached["data"]["stdout"], "up 1 day")
+        self.assertNotIn("scheduler", cached)
+
+    def test_key_isolation(self):
+        self.store(self.context(password="right"))
+        self.assertIsNotNone(self.cache.get(self.context(password="right")))
+        for other in (
+            self.context(password="wrong"),
+            self.context(),
+            self.context(password="right", erp="bob"),
+            self.context(password="right", use_bastion=False),
+            self.context(password="right", port=2222),
+        ):
+            self.assertIsNone(self.cache.get(other))
+
+    def test_not_cacheable(self):
+        self.store(make_context(command="uptime"))
+        self.assertIsNone(self.cache.get(make_context(command="uptime")))
+        self.store(self.context(command="uptime; rm -rf /tmp/x"))
+        self.assertIsNone(self.cache.get(self.context(command="uptime; rm -rf /tmp/x")))
+
+
+@skipUnless(importlib.util.find_spec("fastmcp"), "fastmcp 未安装")
+class McpUpstreamUrlTests(TestCase):
+
+    def test_urls_resolve_to_api_views(self):
+        from mcp import server as mcp_server
+
+        expected = {
+            mcp_server.REMOTE_URL: "remote_call",
+            mcp_server.REMOTE_STREAM_URL: "remote_call_stream",
+            mcp_server.REMOTE_COMMANDS_URL: "remote_call_commands",
+        }
+        for url, name in expected.items():
+            self.assertTrue(url.startswith(mcp_server.REMOTE_API_BASE + "/"))
+            self.assertEqual(resolve(urlsplit(url).path).url_name, name)
+
+
+@skipUnless(importlib.util.find_spec("fastmcp"), "fastmcp 未安装")
+class McpHttpClientTests(TestCase):
+
+    def setUp(self):
+        import httpx
+        from mcp import server as mcp_server
+
+        self.mcp_server = mcp_server
+        self.requests = []
+        self.failures = 0
+        self.body = {"status": "success", "data": {"stdout": "ok"}}
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+        self.addCleanup(asyncio.run, self.client.aclose())
+        for name, value in (("_http_client", self.client), ("HTTP_RETRY_BACKOFF", 0)):
+            patcher = mock.patch.object(mcp_server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def handle(self, request):
+        import httpx
+
+        self.requests.append(request)
+        if len(self.requests) <= self.failures:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json=self.body)
+
+    def test_connect_errors_retried_on_shared_client(self):
+        self.failures = 2
+        response = asyncio.run(self.mcp_server.post_with_retry(self.mcp_server.REMOTE_URL, {"CMD": "uptime"}, 5))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.requests), 3)
+        self.assertIs(self.mcp_server.get_http_client(), self.client)
+
+    def test_gives_up_after_retries(self):
+        import httpx
+
+        self.failures = self.mcp_server.HTTP_CONNECT_RETRIES + 1
+        with self.assertRaises(httpx.ConnectError):
+            asyncio.run(self.mcp_server.post_with_retry(self.mcp_server.REMOTE_URL, {"CMD": "uptime"}, 5))
+        self.assertEqual(len(self.requests), self.mcp_server.HTTP_CONNECT_RETRIES + 1)
+
+    def test_batch_tool_posts_commands_once(self):
+        self.body = {
+            "status": "error",
+            "data": [
+                {"command": "uptime", "status": "success", "stdout": "up 3 days", "exit_code": 0},
+                {"command": "false", "status": "failed", "stdout": "", "exit_code": 1},
+            ],
+            "error": "1 条命令执行失败",
+        }
+        # fastmcp 装饰后的工具对象以 fn 保留原函数
+        tool = getattr(self.mcp_server.remote_call_batch, "fn", self.mcp_server.remote_call_batch)
+        result = asyncio.run(tool(
+            ip="10.0.0.1", os_type="linux", username="root", erp="alice",
+            commands=["uptime", "false"], continue_on_error=False,
+        ))
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(str(self.requests[0].url), self.mcp_server.REMOTE_COMMANDS_URL)
+        payload = json.loads(self.requests[0].content)
+        self.assertEqual(payload["commands"], ["uptime", "false"])
+        self.assertFalse(payload["continue_on_error"])
+        self.assertEqual([item["exit_code"] for item in result["results"]], [0, 1])
+        self.assertEqual(result["error"], "1 条命令执行失败")
+
+
+@override_settings(HOST_REGISTRY={"REFRESH_INTERVAL": 30, "CREDENTIALS": {
+    "ops": {"username": "ops", "password": "s3cret"},
+    "win-key": {"username": "svc"},
+}})
+class HostRegistryTests(TestCase):
+
+    def setUp(self):
+        self.registry = HostRegistry()
+        Host.objects.create(
+            host_id="web-1", ip="10.0.1.1", os_type="linux", credential_ref="ops",
+            bastion="bj", tags=["web"],
+        )
+        Host.objects.create(host_id="win-1", ip="10.0.2.1", os_type="windows", username="admin", tags=["web"])
+        Host.objects.create(host_id="win-2", ip="10.0.2.2", os_type="windows", credential_ref="win-key")
+        Host.objects.create(host_id="old-1", ip="10.0.3.1", os_type="linux", enabled=False, tags=["web"])
+
+    def test_resolve_applies_registered_host(self):
+        data = self.registry.resolve({
+            "host_id": "web-1", "tag": "web", "ip": "1.2.3.4", "port": 2222, "os_type": "windows",
+            "username": "root", "password": "wrong", "erp": "alice", "command": "hostname",
+            "extra": {"trace": "t1"},
+        })
+
+        self.assertNotIn("host_id", data)
+        self.assertNotIn("tag", data)
+        self.assertEqual((data["ip"], data["port"], data["os_type"]), ("10.0.1.1", 22, "linux"))
+        self.assertEqual((data["username"], data["password"]), ("ops", "s3cret"))
+        self.assertEqual(data["extra"]["trace"], "t1")
+        self.assertEqual((data["extra"]["host_id"], data["extra"]["bastion"]), ("web-1", "bj"))
+        self.assertEqual(data["extra"]["profile"]["host_vars"].split()[0], "ansible_port=22")
+        RemoteCallContext(**data)
+
+    def test_resolve_keeps_request_credentials_without_ref(self):
+        data = self.registry.resolve({"host_id": "win-1", "password": "p", "erp": "alice", "command": "hostname"})
+
+        self.assertEqual((data["username"], data["password"]), ("admin", "p"))
+        # 未指定端口的 Windows 主机不预编译端口，按请求是否带密码计算
+        self.assertIsNone(data["port"])
+        self.assertEqual(RemoteCallContext(**data).get_port(), 5985)
+
+    def test_windows_port_follows_credential_without_password(self):
+        data = self.registry.resolve({"host_id": "win-2", "erp": "alice", "command": "hostname"})
+        user_context = RemoteCallContext(**data)
+
+        self.assertEqual(data["username"], "svc")
+        self.assertIsNone(data["extra"]["profile"]["port"])
+        self.assertEqual(user_context.get_port(), 5986)
+        self.assertIn("ansible_port=5986", build_host_line(user_context, get_ansible_config(user_context)).split())
+
+    def test_unknown_or_disabled_host(self):
+        with self.assertRaises(HostNotFound):
+            self.registry.resolve({"host_id": "nope"})
+        with self.assertRaises(HostNotFound):
+            self.registry.get("old-1")
+        self.assertEqual(self.registry.resolve({"ip": "1.2.3.4", "tag": "web"}), {"ip": "1.2.3.4"})
+
+    def test_by_tag(self):
+        self.assertEqual([host.host_id for host in self.registry.by_tag("web")], ["web-1", "win-1"])
+        with self.assertRaises(HostNotFound):
+            self.registry.by_tag("db")
+
+    def test_signals_invalidate_process_cache(self):
+        host_registry.invalidate()
+        self.addCleanup(host_registry.invalidate)
+        self.assertEqual(host_registry.get("web-1").ip, "10.0.1.1")
+
+        host = Host.objects.get(host_id="web-1")
+        host.ip = "10.0.1.2"
+        host.save()
+        self.assertEqual(host_registry.get("web-1").ip, "10.0.1.2")
+
+        host.delete()
+        with self.assertRaises(HostNotFound):
+            host_registry.get("web-1")
@@ -1,6 +1,15 @@
 from django.urls import path
-from .views import RemoteCallView
+from .views import RemoteCallView, RemoteCallAsyncView, RemoteCallBatchView, RemoteCallCommandsView, RemoteCallStreamView, JobStatusView, JobResultView, JobCancelView, ExecutionListView, ExecutionDetailView
 
 urlpatterns = [
     path("remote_call", RemoteCallView.as_view(), name="remote_call"),
+    path("remote_call/aio", RemoteCallAsyncView.as_view(), name="remote_call_aio"),
+    path("remote_call/batch", RemoteCallBatchView.as_view(), name="remote_call_batch"),
+    path("remote_call/commands", RemoteCallCommandsView.as_view(), name="remote_call_commands"),
+    path("remote_call/stream", RemoteCallStreamView.as_view(), name="remote_call_stream"),
+    path("jobs/<str:job_id>", JobStatusView.as_view(), name="job_status"),
+    path("jobs/<str:job_id>/result", JobResultView.as_view(), name="job_result"),
+    path("jobs/<str:job_id>/cancel", JobCancelView.as_view(), name="job_cancel"),
+    path("executions", ExecutionListView.as_view(), name="execution_list"),
+    path("executions/<str:execution_id>", ExecutionDetailView.as_view(), name="execution_detail"),
 ]
\ No newline at end of file
@@ -1,10 +1,24 @@
+import json
+from datetime import timedelta
+
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.pagination import CursorPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
 from remote_call.utils import build_response
-from remote_call.services import RemoteCallService
-from .serializers import RemoteCallSerializer
+from remote_call.shaping import shape_from_request
+from remote_call import metrics
+from remote_call.services import RemoteCallService, AsyncRemoteCallService, RemoteCallBatchService, RemoteCallCommandsService
+from remote_call.jobs import job_manager
+from remote_call.streaming import stream_remote_call
+from .models import ExecutionRecord
+from .serializers import RemoteCallSerializer, RemoteCallBatchSerializer, RemoteCallCommandsSerializer, ExecutionQuerySerializer, ExecutionRecordSerializer
 
 
 class RemoteCallView(APIView):
@@ -13,7 +27,8 @@ class RemoteCallView(APIView):
     - 校验参数，构建上下文，调用 Ansible 执行命令或脚本，返回标准结构结果。
 
     请求参数：
-        os_type: 操作系统类型 (linux/windows)
+        host_id: 主机登记表中的主机标识(可选, 提供时 os_type/ip/port/username/认证/堡垒机取自登记信息)
+        os_type: 操作系统类型 (linux/windows/h3c)
         ip: 目标主机 IP
         username: 登录用户名
         password: 登录密码(可选)
@@ -21,11 +36,22 @@ class RemoteCallView(APIView):
         command: 要执行的命令(可选)
         file_path: 要执行的脚本路径(可选)
         use_bastion: 是否使用堡垒机(可选, 默认True)
+        async: 查询参数，为 1 时提交异步任务并立即返回 job_id(可选)
+        timeout: 单次执行超时秒数(可选, 超时后终止执行并释放执行槽位)
+        engine: 执行引擎 ansible/native(可选, 默认取配置 EXECUTION_ENGINE；native 仅对 Linux 命令生效)
+        cache: 是否允许使用只读命令结果缓存(可选, 默认False；仅 RESULT_CACHE 白名单内的命令生效)
+    响应裁剪（查询参数，适用于所有结果接口）：
+        fields: 逗号分隔的返回字段，支持点号路径(如 fields=data.stdout,data.rc)
+        truncate=1: 开启截断，stdout/stderr 超过 head+tail 字节时只保留首尾并标记 truncated(默认关闭)
+        head/tail: 截断时保留的首/尾字节数
+        dedup=1: 开启 data/all_results/target 间的输出去重(默认关闭)
     返回：
         status: "success"/"error"
         data: 结果数据
         error: 错误信息
         target: ansible 运行元数据
+        cache: 结果缓存元数据 {hit, age, ttl}(仅可缓存命令)
+        timings: 分阶段耗时(毫秒)，如 context_build/key_fetch/queue_wait/runner_run/extract_events/total
     """
     def post(self, request):
         """
@@ -39,9 +65,276 @@ class RemoteCallView(APIView):
             )
 
         data = serializer.validated_data
+        if request.query_params.get("async") in ("1", "true"):
+            # 异步模式：后台线程池执行，立即返回 job_id 供轮询
+            job = job_manager.submit(RemoteCallService, data)
+            return Response(
+                build_response(data=job.to_dict()),
+                status=status.HTTP_202_ACCEPTED
+            )
+
         service = RemoteCallService(data)
 
         return Response(
-            build_response(**service),
+            shape_from_request(build_response(**service), request.query_params),
+            status=status.HTTP_200_OK
+        )
+
+
+class RemoteCallBatchView(APIView):
+    """
+    批量远程命令执行 API
+    - 同一条命令或脚本下发到多台主机，单次 ansible 运行按 forks 并行，返回按主机排列的结果。
+
+    请求参数：
+        targets: 目标主机 IP 列表(与 group 至少提供一个)
+        group: 预定义主机分组名(配置 HOST_GROUPS)
+        tag: 主机登记表标签，下发到带该标签的全部主机(连接参数取自登记信息)
+        forks: 并行数(可选, 默认取配置 BATCH_FORKS)
+        其余参数同 /api/remote_call
+    返回：
+        status: 全部主机成功为 "success"，否则为 "error"
+        data: 按主机排列的结果列表
+        summary: total/ok/failed 汇总
+        all_results: 各步骤原始聚合结果
+    """
+    def post(self, request):
+        serializer = RemoteCallBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                build_response(status="error", error=serializer.errors),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        service = RemoteCallBatchService(serializer.validated_data)
+
+        return Response(
+            shape_from_request(build_response(**service), request.query_params),
             status=status.HTTP_200_OK
         )
+
+
+class JobStatusView(APIView):
+    """
+    异步任务状态查询 API
+    返回：
+        data.status: pending/running/success/error
+        data.progress: 任务链分步进度 {done, total, steps}
+    """
+    def get(self, request, job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return Response(
+                build_response(status="error", error="Job not found"),
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(build_response(data=job.to_dict()), status=status.HTTP_200_OK)
+
+
+class JobCancelView(APIView):
+    """
+    异步任务取消 API
+    - 尚未开始的任务直接结束；排队中的请求从调度器出队，正在执行的 ansible 进程由 cancel_callback 终止，
+      原生引擎与 H3C 会话在读取输出时检查取消并关闭通道；任务已结束时返回 409。
+    """
+    def post(self, request, job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return Response(
+                build_response(status="error", error="Job not found"),
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not job_manager.cancel(job):
+            return Response(
+                build_response(status="error", error="Job is already finished", data=job.to_dict()),
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(build_response(data=job.to_dict()), status=status.HTTP_202_ACCEPTED)
+
+
+class JobResultView(APIView):
+    """
+    异步任务结果获取 API
+    - 任务未结束时返回 202 及当前状态；结束后返回与同步接口一致的结果结构。
+    """
+    def get(self, request, job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return Response(
+                build_response(status="error", error="Job not found"),
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not job.is_finished():
+            return Response(build_response(data=job.to_dict()), status=status.HTTP_202_ACCEPTED)
+        return Response(shape_from_request(build_response(**job.result), request.query_params), status=status.HTTP_200_OK)
+
+
+class RemoteCallCommandsView(APIView):
+    """
+    多命令执行 API
+    - 在同一目标主机上顺序执行多条命令，一次请求返回每条命令的输出、返回码与耗时。
+
+    请求参数：
+        commands: 命令列表
+        continue_on_error: 命令失败后是否继续执行后续命令(可选, 默认True)
+        其余参数同 /api/remote_call（不含 command/file_path）
+    返回：
+        data: [{command, status, stdout, stderr, exit_code, start_time, end_time, duration_ms}]
+    """
+    def post(self, request):
+        serializer = RemoteCallCommandsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                build_response(status="error", error=serializer.errors),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        service = RemoteCallCommandsService(serializer.validated_data)
+
+        return Response(
+            shape_from_request(build_response(**service), request.query_params),
+            status=status.HTTP_200_OK
+        )
+
+
+class RemoteCallStreamView(APIView):
+    """
+    流式远程命令执行 API（Server-Sent Events）
+    - 参数同 /api/remote_call；执行过程中逐条推送输出事件，结束时推送 done 事件。
+
+    事件类型：
+        output: native 引擎逐行输出 {host, stream, line}
+        ansible: ansible_runner 事件 {host, event, stdout}
+        done: 执行结束 {status, error, rc}
+    """
+    def post(self, request):
+        serializer = RemoteCallSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                build_response(status="error", error=serializer.errors),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response = StreamingHttpResponse(
+            stream_remote_call(serializer.validated_data),
+            content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # 关闭 nginx 缓冲，保证事件实时下发
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class RemoteCallAsyncView(View):
+    """
+    远程命令执行 API（ASGI 异步视图）
+    - 参数与返回同 /api/remote_call；需以 ASGI 方式部署（如 uvicorn server.asgi:application）。
+    - 排队与执行期间仅挂起协程，不占用线程，单进程可同时承载大量以网络等待为主的请求。
+    - DRF APIView 不支持异步处理函数，此处使用 Django 原生异步视图，参数校验复用 RemoteCallSerializer。
+    """
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse(
+                build_response(status="error", error="Invalid JSON body"),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = RemoteCallSerializer(data=payload)
+        if not serializer.is_valid():
+            return JsonResponse(
+                build_response(status="error", error=serializer.errors),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        service = await AsyncRemoteCallService(serializer.validated_data)
+
+        return JsonResponse(
+            shape_from_request(build_response(**service), request.GET),
+            status=status.HTTP_200_OK,
+            json_dumps_params={"ensure_ascii": False}
+        )
+
+
+class ExecutionCursorPagination(CursorPagination):
+    """
+    执行历史分页：按 created_at 倒序的游标分页，翻页不依赖 OFFSET/COUNT，大表上同样只扫描索引范围。
+    """
+    ordering = ("-created_at", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class ExecutionListView(APIView):
+    """
+    执行历史查询 API
+    - 按 ip / erp / status / os_type 与时间范围过滤，结果按执行时间倒序，游标分页。
+
+    查询参数：
+        ip: 目标主机 IP(可选)
+        erp: ERP 用户(可选)
+        status: 执行状态(可选)
+        os_type: 操作系统类型(可选)
+        since/until: 起止时间，ISO 8601(可选)
+        within: 最近 N 秒(可选，如 within=3600 即最近一小时)
+        page_size: 每页条数(可选，默认 50，最大 500)
+        cursor: 翻页游标(由 next/previous 链接携带)
+    返回：
+        data: {results: 执行记录列表, next: 下一页链接, previous: 上一页链接}
+    """
+    def get(self, request):
+        query = ExecutionQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                build_response(status="error", error=query.errors),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        params = query.validated_data
+        queryset = ExecutionRecord.objects.all()
+        for field in ("ip", "erp", "status", "os_type"):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        if params.get("since"):
+            queryset = queryset.filter(created_at__gte=params["since"])
+        if params.get("until"):
+            queryset = queryset.filter(created_at__lt=params["until"])
+        if params.get("within"):
+            queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(seconds=params["within"]))
+
+        paginator = ExecutionCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return Response(build_response(data={
+            "results": ExecutionRecordSerializer(page, many=True).data,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+        }), status=status.HTTP_200_OK)
+
+
+class ExecutionDetailView(APIView):
+    """
+    单次执行的历史记录（批量/多命令执行同一 execution_id 下有多条）。
+    """
+    def get(self, request, execution_id):
+        records = ExecutionRecord.objects.filter(execution_id=execution_id)
+        if not records:
+            return Response(
+                build_response(status="error", error="Execution not found"),
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            build_response(data=ExecutionRecordSerializer(records, many=True).data),
+            status=status.HTTP_200_OK
+        )
+
+
+class MetricsView(View):
+    """
+    Prometheus 指标（text exposition format 0.0.4）
+    - 分阶段耗时、请求耗时、执行中请求数、限流等待时间、调度排队与堡垒机连接数，按 os_type / exec_type 等标签区分。
+    - 指标为进程内统计，多进程部署时由 Prometheus 按实例分别抓取。
+    """
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,3 @@
+"""
+基准测试：本地 SSH 替身（sshd.py）与压测入口（run.py，python -m bench.run）。
+"""
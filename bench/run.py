@@ -0,0 +1,362 @@
+"""
+远程调用基准测试。
+
+以本地 paramiko SSH 服务（bench/sshd.py）充当堡垒机与目标主机，按指定并发驱动 RemoteCallService
+或 HTTP 接口，输出 p50/p95/p99 延迟、吞吐量，以及 service 模式下的分阶段耗时
+（堡垒机私钥拉取、inventory/playbook 写入、runner 启动、远端执行、排队等待等）。
+
+用法（仓库根目录下执行）：
+    # 进程内驱动 RemoteCallService，自动启动本地 SSH 替身
+    python -m bench.run --mode service --engine ansible -c 8 -n 200
+    python -m bench.run --mode service --engine native -c 32 -n 2000 --latency 0.02
+
+    # 驱动已部署的 HTTP 接口（服务端需自行配置为连接 bench.sshd 或真实环境）
+    python -m bench.run --mode http --url http://127.0.0.1:8000/api/remote_call \\
+        --target 127.0.0.1:2222 -c 16 -n 500
+
+    # 保存结果并与基线对比
+    python -m bench.run ... --json-out after.json --baseline before.json
+"""
+
+import argparse
+import getpass
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+_stages = threading.local()
+
+
+def _record(stage, seconds):
+	durations = getattr(_stages, "durations", None)
+	if durations is not None:
+		durations[stage] = durations.get(stage, 0.0) + seconds
+
+
+def _timed(stage, func):
+	def wrapper(*args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			_record(stage, time.perf_counter() - start)
+	return wrapper
+
+
+def _event_time(event):
+	created = event.get("created")
+	if not created:
+		return None
+	try:
+		return datetime.fromisoformat(created).replace(tzinfo=timezone.utc).timestamp()
+	except ValueError:
+		return None
+
+
+def _timed_runner(func):
+	"""
+	包装 run_with_cancel：通过事件回调记录事件时间，拆分 runner 启动（调用到首个 runner_on_start）、
+	远端执行（首个 runner_on_start 到最后一个主机结果）与收尾耗时。
+	"""
+	def wrapper(*args, **kwargs):
+		seen = {}
+		original = kwargs.get("event_handler")
+
+		def handler(event):
+			ts = _event_time(event)
+			name = event.get("event")
+			if ts is not None:
+				if name == "runner_on_start":
+					seen.setdefault("start", ts)
+				elif name in ("runner_on_ok", "runner_on_failed", "runner_on_unreachable"):
+					seen["end"] = ts
+			return original(event) if original else True
+
+		kwargs["event_handler"] = handler
+		begin_wall, begin = time.time(), time.perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			total = time.perf_counter() - begin
+			if "start" in seen and "end" in seen:
+				startup = max(0.0, seen["start"] - begin_wall)
+				remote = max(0.0, seen["end"] - seen["start"])
+				_record("runner_startup", startup)
+				_record("remote_exec", remote)
+				_record("runner_teardown", max(0.0, total - startup - remote))
+			else:
+				_record("runner_total", total)
+	return wrapper
+
+
+def instrument():
+	"""
+	在进程内为各阶段函数打点（仅基准测试进程内生效）。
+	"""
+	import ansible.runner
+	import ansible.native
+	import remote_call.services
+
+	ansible.runner.fetch_bastion_key = _timed("key_fetch", ansible.runner.fetch_bastion_key)
+	ansible.native.fetch_bastion_key = _timed("key_fetch", ansible.native.fetch_bastion_key)
+	remote_call.services.generate_inventory = _timed("inventory_write", remote_call.services.generate_inventory)
+	remote_call.services._generate_playbook_if_needed = _timed(
+		"playbook_write", remote_call.services._generate_playbook_if_needed
+	)
+	ansible.runner.run_with_cancel = _timed_runner(ansible.runner.run_with_cancel)
+	pool = ansible.native.native_ssh_pool
+	pool.get_client = _timed("connect", pool.get_client)
+	ansible.native._exec = _timed("remote_exec", ansible.native._exec)
+
+
+def setup_service_mode(args, workdir):
+	"""
+	启动本地 SSH 替身并将 BASTION_CONFIG 指向它，返回请求目标 (ip, port)。
+	配置须在 django.setup() 与任何请求之前写入：堡垒机池等进程级单例在首次使用时即缓存配置。
+	"""
+	os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+	# 替身 SSH 服务不支持 SFTP 上传，ansible 需经 stdin 传递模块
+	os.environ.setdefault("ANSIBLE_PIPELINING", "True")
+	os.environ.setdefault("ANSIBLE_HOST_KEY_CHECKING", "False")
+	# 替身每次运行生成新的主机密钥，ProxyCommand 中连接堡垒机的 ssh 不受上一项影响；
+	# 经 PATH 最前的包装脚本关闭主机密钥校验，不改动用户的 known_hosts
+	ssh_path = shutil.which("ssh")
+	if ssh_path:
+		bin_dir = os.path.join(workdir, "bin")
+		os.makedirs(bin_dir)
+		with open(os.path.join(bin_dir, "ssh"), "w") as f:
+			f.write(
+				"#!/bin/sh\n"
+				f"exec {ssh_path} -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null \"$@\"\n"
+			)
+		os.chmod(os.path.join(bin_dir, "ssh"), 0o755)
+		os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+	import paramiko
+	from django.conf import settings
+	from bench.sshd import BenchSSHServer
+
+	key_path = os.path.join(workdir, "id_rsa")
+	paramiko.RSAKey.generate(2048).write_private_key_file(key_path)
+	os.chmod(key_path, 0o600)
+
+	bastion = BenchSSHServer(port=args.bastion_port, latency=0).start()
+	target = BenchSSHServer(port=args.target_port, latency=args.latency).start()
+
+	# 只读取 settings 模块，尚未加载应用；替换整个字典，已配置的多堡垒机池与路由一并清空
+	settings.BASTION_CONFIG = dict(
+		settings.BASTION_CONFIG,
+		BASTION_IP=bastion.host,
+		BASTION_PORT=bastion.port,
+		BASTION_USER=getpass.getuser(),
+		BASTION_PRIVATE_KEY=key_path,  # 替身堡垒机即本机，SFTP 直接读取该文件
+		BASTION_TEMP_PRIVATE_KEY=os.path.join(workdir, "bastion_id_rsa"),
+		JUMP_PRIVATE_KEY=key_path,
+		BASTIONS=[],
+		BASTION_ROUTES=[],
+		KEY_CACHE_TTL=args.key_cache_ttl,
+		WARM_POOL_SIZE=args.warm_pool_size,
+		SSH_CONTROL_DIR=f"/tmp/rc-bench-{os.getpid()}",
+		EXECUTION_ENGINE=args.engine,
+		ARTIFACTS_DIR=os.path.join(workdir, "artifacts"),
+		SCHEDULER_MAX_CONCURRENT=max(args.concurrency, 1),
+		SCHEDULER_MAX_PER_TARGET=max(args.concurrency, 1),
+		SCHEDULER_MAX_PER_USER=max(args.concurrency, 1),
+		SCHEDULER_MAX_PER_BASTION=max(args.concurrency, 1),
+	)
+	# 压测不落执行历史，无需迁移数据库
+	settings.HISTORY_CONFIG = dict(settings.HISTORY_CONFIG, ENABLED=False)
+	import django
+	django.setup()
+
+	from ansible.config import get_ansible_config
+	from remote_call.context import RemoteCallContext
+	config_context = get_ansible_config(RemoteCallContext(**build_payload(args, target.host, target.port)))
+	if (config_context.bastion_ip, config_context.bastion_port) != (bastion.host, bastion.port):
+		raise SystemExit(
+			f"bastion pool resolved {config_context.bastion_ip}:{config_context.bastion_port}, "
+			f"expected stand-in {bastion.host}:{bastion.port}"
+		)
+	instrument()
+	return target.host, target.port
+
+
+def build_payload(args, ip, port):
+	return {
+		"os_type": "linux",
+		"ip": ip,
+		"port": port,
+		"username": args.username or getpass.getuser(),
+		"erp": "bench",
+		"command": args.command,
+		"engine": args.engine,
+		"use_bastion": not args.direct,
+	}
+
+
+def service_call(payload):
+	from remote_call.services import RemoteCallService
+	_stages.durations = {}
+	try:
+		result = RemoteCallService(dict(payload))
+		wait = (result.get("scheduler") or {}).get("wait_time")
+		if wait:
+			_record("queue_wait", wait)
+		return result.get("status") == "success", dict(_stages.durations)
+	finally:
+		_stages.durations = None
+
+
+def http_call(url, payload, timeout):
+	request = urllib.request.Request(
+		url, data=json.dumps(payload).encode("utf-8"),
+		headers={"Content-Type": "application/json"}, method="POST"
+	)
+	try:
+		with urllib.request.urlopen(request, timeout=timeout) as resp:
+			body = json.loads(resp.read())
+	except (urllib.error.URLError, ValueError, OSError):
+		return False, {}
+	return body.get("status") == "success", {}
+
+
+def percentile(sorted_values, pct):
+	if not sorted_values:
+		return 0.0
+	# nearest-rank
+	index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+	return sorted_values[index]
+
+
+def summarize(latencies, stage_samples, errors, elapsed, args):
+	values = sorted(latencies)
+	report = {
+		"config": {
+			"mode": args.mode, "engine": args.engine, "command": args.command,
+			"concurrency": args.concurrency, "requests": args.requests, "latency_injected": args.latency,
+		},
+		"requests": len(latencies),
+		"errors": errors,
+		"elapsed": round(elapsed, 3),
+		"throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+		"latency_ms": {
+			"p50": round(percentile(values, 50) * 1000, 2),
+			"p95": round(percentile(values, 95) * 1000, 2),
+			"p99": round(percentile(values, 99) * 1000, 2),
+			"mean": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+			"max": round(values[-1] * 1000, 2) if values else 0.0,
+		},
+		"stages_ms": {},
+	}
+	for stage, samples in sorted(stage_samples.items()):
+		samples = sorted(samples)
+		report["stages_ms"][stage] = {
+			"mean": round(sum(samples) / len(samples) * 1000, 2),
+			"p50": round(percentile(samples, 50) * 1000, 2),
+			"p95": round(percentile(samples, 95) * 1000, 2),
+		}
+	return report
+
+
+def print_report(report, baseline=None):
+	lat = report["latency_ms"]
+	print(f"requests={report['requests']} errors={report['errors']} "
+		  f"concurrency={report['config']['concurrency']} elapsed={report['elapsed']}s "
+		  f"throughput={report['throughput']}/s")
+	print(f"latency ms: p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} mean={lat['mean']} max={lat['max']}")
+	if report["stages_ms"]:
+		print(f"{'stage':<18}{'mean':>10}{'p50':>10}{'p95':>10}")
+		for stage, s in report["stages_ms"].items():
+			print(f"{stage:<18}{s['mean']:>10}{s['p50']:>10}{s['p95']:>10}")
+	if baseline:
+		print("vs baseline:")
+		for key in ("p50", "p95", "p99"):
+			print(f"  {key}: {baseline['latency_ms'][key]} -> {lat[key]} ms ({_delta(baseline['latency_ms'][key], lat[key])})")
+		print(f"  throughput: {baseline['throughput']} -> {report['throughput']}/s "
+			  f"({_delta(baseline['throughput'], report['throughput'])})")
+
+
+def _delta(before, after):
+	if not before:
+		return "n/a"
+	return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="远程调用基准测试")
+	parser.add_argument("--mode", choices=["service", "http"], default="service")
+	parser.add_argument("--engine", choices=["ansible", "native"], default="ansible")
+	parser.add_argument("--command", default="echo bench")
+	parser.add_argument("-c", "--concurrency", type=int, default=8)
+	parser.add_argument("-n", "--requests", type=int, default=100)
+	parser.add_argument("--warmup", type=int, default=5, help="预热请求数，不计入统计")
+	parser.add_argument("--latency", type=float, default=0.0, help="目标主机替身每个 exec 注入的延迟（秒）")
+	parser.add_argument("--direct", action="store_true", help="不经堡垒机直连目标主机")
+	parser.add_argument("--key-cache-ttl", type=int, default=300, help="堡垒机私钥缓存 TTL，0 表示每次拉取")
+	parser.add_argument("--warm-pool-size", type=int, default=0, help="ansible 预热工作进程数，0 表示每次冷启动")
+	parser.add_argument("--bastion-port", type=int, default=0, help="service 模式堡垒机替身端口，0 为自动分配")
+	parser.add_argument("--target-port", type=int, default=0, help="service 模式目标主机替身端口，0 为自动分配")
+	parser.add_argument("--url", default="http://127.0.0.1:8000/api/remote_call", help="http 模式接口地址")
+	parser.add_argument("--target", default="127.0.0.1:22", help="http 模式目标主机 ip:port")
+	parser.add_argument("--username", default=None)
+	parser.add_argument("--timeout", type=float, default=120.0, help="http 模式单请求超时（秒）")
+	parser.add_argument("--json-out", default=None, help="结果保存为 JSON 文件")
+	parser.add_argument("--baseline", default=None, help="与基线 JSON 结果对比")
+	args = parser.parse_args(argv)
+
+	workdir = tempfile.mkdtemp(prefix="rc-bench-")
+	if args.mode == "service":
+		ip, port = setup_service_mode(args, workdir)
+		payload = build_payload(args, ip, port)
+		call = lambda: service_call(payload)
+	else:
+		ip, _, port = args.target.partition(":")
+		payload = build_payload(args, ip, int(port or 22))
+		call = lambda: http_call(args.url, payload, args.timeout)
+
+	for _ in range(args.warmup):
+		call()
+
+	latencies = []
+	stage_samples = {}
+	errors = 0
+	lock = threading.Lock()
+
+	def one(_):
+		nonlocal errors
+		start = time.perf_counter()
+		ok, stages = call()
+		elapsed = time.perf_counter() - start
+		with lock:
+			latencies.append(elapsed)
+			errors += 0 if ok else 1
+			for stage, seconds in stages.items():
+				stage_samples.setdefault(stage, []).append(seconds)
+
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+		list(executor.map(one, range(args.requests)))
+	elapsed = time.perf_counter() - start
+
+	report = summarize(latencies, stage_samples, errors, elapsed, args)
+	baseline = None
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	print_report(report, baseline)
+	if args.json_out:
+		with open(args.json_out, "w") as f:
+			json.dump(report, f, indent=2)
+	return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+基准测试用的本地 SSH 服务（paramiko 实现），可同时充当堡垒机与目标主机。
+
+- 认证：接受任意公钥/密码，也允许 none 认证（仅供本地压测）；
+- exec：以 /bin/sh -c 在本机执行命令，双向转发 stdin/stdout/stderr 并回传退出码
+  （ansible 需开启 pipelining，模块经 stdin 传给远端 python，无需 SFTP 上传）；
+- direct-tcpip：堡垒机转发（ssh -W / paramiko direct-tcpip 通道），连接到请求的 host:port；
+- sftp：只读，供 fetch_bastion_key 从“堡垒机”读取私钥；
+- latency：可选，为每个 exec 注入固定延迟，模拟远端网络往返。
+"""
+
+import os
+import socket
+import subprocess
+import threading
+import time
+
+import paramiko
+from paramiko.sftp import SFTP_NO_SUCH_FILE, SFTP_OP_UNSUPPORTED
+
+BUFFER_SIZE = 32768
+
+
+class _ReadOnlyHandle(paramiko.SFTPHandle):
+
+	def stat(self):
+		return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _ReadOnlySFTP(paramiko.SFTPServerInterface):
+	"""
+	只读 SFTP：支持 open(读)/stat/lstat，足以让 paramiko 客户端读取堡垒机私钥。
+	"""
+
+	def open(self, path, flags, attr):
+		if flags & (os.O_WRONLY | os.O_RDWR):
+			return SFTP_OP_UNSUPPORTED
+		try:
+			f = open(path, "rb")
+		except OSError:
+			return SFTP_NO_SUCH_FILE
+		handle = _ReadOnlyHandle(flags)
+		handle.filename = path
+		handle.readfile = f
+		return handle
+
+	def stat(self, path):
+		try:
+			return paramiko.SFTPAttributes.from_stat(os.stat(path))
+		except OSError:
+			return SFTP_NO_SUCH_FILE
+
+	lstat = stat
+
+
+class _Server(paramiko.ServerInterface):
+
+	def __init__(self, owner):
+		self.owner = owner
+		self.pending_forwards = {}  # chanid -> 已连接的目标 socket
+
+	def get_allowed_auths(self, username):
+		return "none,publickey,password"
+
+	def check_auth_none(self, username):
+		return paramiko.AUTH_SUCCESSFUL
+
+	def check_auth_publickey(self, username, key):
+		return paramiko.AUTH_SUCCESSFUL
+
+	def check_auth_password(self, username, password):
+		return paramiko.AUTH_SUCCESSFUL
+
+	def check_channel_request(self, kind, chanid):
+		if kind == "session":
+			return paramiko.OPEN_SUCCEEDED
+		return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+	def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+		try:
+			sock = socket.create_connection(destination, timeout=10)
+		except OSError:
+			return paramiko.OPEN_FAILED_CONNECT_FAILED
+		self.pending_forwards[chanid] = sock
+		return paramiko.OPEN_SUCCEEDED
+
+	def check_channel_exec_request(self, channel, command):
+		threading.Thread(
+			target=self.owner.run_exec, args=(channel, command.decode("utf-8", errors="replace")), daemon=True
+		).start()
+		return True
+
+	def check_channel_pty_request(self, *args):
+		return True
+
+	def check_channel_shell_request(self, channel):
+		return False
+
+
+class BenchSSHServer:
+	"""
+	多线程 SSH 服务。
+	:param host: 监听地址
+	:param port: 监听端口，0 表示自动分配
+	:param latency: 每个 exec 注入的延迟（秒）
+	"""
+
+	def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+		self.host_key = paramiko.RSAKey.generate(2048)
+		self.latency = latency
+		self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._sock.bind((host, port))
+		self._sock.listen(512)
+		self.host, self.port = self._sock.getsockname()
+		self._closed = threading.Event()
+		self._thread = None
+		self._sync_lock = threading.Lock()  # Transport.global_request 的应答状态不支持并发等待
+		self.connections = 0
+		self.execs = 0
+
+	def start(self):
+		self._thread = threading.Thread(target=self._serve, name=f"bench-sshd-{self.port}", daemon=True)
+		self._thread.start()
+		return self
+
+	def close(self):
+		"""
+		停止监听。先 shutdown 唤醒阻塞在 accept 上的线程并等待其退出，再关闭套接字：
+		直接关闭时 accept 线程仍持有原文件描述符号，号被复用后会接管其他套接字（如 unix 套接字）上的连接。
+		"""
+		self._closed.set()
+		try:
+			self._sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+		if self._thread is not None:
+			self._thread.join(5)
+		self._sock.close()
+
+	def _serve(self):
+		while not self._closed.is_set():
+			try:
+				client, _ = self._sock.accept()
+			except OSError:
+				return
+			threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+	def _handle(self, client):
+		self.connections += 1
+		transport = paramiko.Transport(client)
+		transport.add_server_key(self.host_key)
+		transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _ReadOnlySFTP)
+		server = _Server(self)
+		try:
+			transport.start_server(server=server)
+		except (paramiko.SSHException, EOFError):
+			return
+		# transport 只弱引用通道，accept 返回的会话通道须在此持有，否则被回收时会关闭，
+		# 随后到达的 exec 请求落在已关闭的通道上
+		sessions = set()
+		while transport.is_active():
+			channel = transport.accept(timeout=1)
+			sessions = {c for c in sessions if not c.closed}
+			if channel is None:
+				continue
+			sock = server.pending_forwards.pop(channel.get_id(), None)
+			if sock is not None:
+				threading.Thread(target=_pipe_socket, args=(channel, sock), daemon=True).start()
+			else:
+				sessions.add(channel)
+
+	def run_exec(self, channel, command):
+		"""
+		在本机执行命令，转发标准输入输出并回传退出码。
+		"""
+		self.execs += 1
+		if self.latency:
+			time.sleep(self.latency)
+		proc = subprocess.Popen(
+			["/bin/sh", "-c", command],
+			stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+		)
+
+		def feed_stdin():
+			try:
+				while True:
+					data = channel.recv(BUFFER_SIZE)
+					if not data:
+						break
+					proc.stdin.write(data)
+					proc.stdin.flush()
+			except (OSError, EOFError):
+				pass
+			finally:
+				try:
+					proc.stdin.close()
+				except OSError:
+					pass
+
+		def drain(stream, send):
+			for chunk in iter(lambda: stream.read1(BUFFER_SIZE), b""):
+				send(chunk)
+
+		threads = [
+			threading.Thread(target=feed_stdin, daemon=True),
+			threading.Thread(target=drain, args=(proc.stderr, channel.sendall_stderr), daemon=True),
+		]
+		for t in threads:
+			t.start()
+		try:
+			drain(proc.stdout, channel.sendall)
+			threads[1].join()
+			channel.send_exit_status(proc.wait())
+			# 本线程在 check_channel_exec_request 内启动，命令很快结束时 CLOSE 可能先于 exec 请求的
+			# 成功应答发出，客户端 exec_command 会因此报 Channel closed。先与客户端往返一次全局请求：
+			# transport 线程按序处理报文，收到其应答时成功应答必已发出
+			with self._sync_lock:
+				channel.get_transport().global_request("keepalive@openssh.com", wait=True)
+		except (OSError, EOFError):
+			proc.kill()
+		finally:
+			channel.close()
+
+
+def _pipe_socket(channel, sock):
+	"""
+	双向转发 direct-tcpip 通道与 TCP 连接。
+	"""
+	def forward(src_recv, dst_send, on_eof):
+		try:
+			while True:
+				data = src_recv(BUFFER_SIZE)
+				if not data:
+					break
+				dst_send(data)
+		except (OSError, EOFError):
+			pass
+		finally:
+			on_eof()
+
+	t = threading.Thread(target=forward, args=(sock.recv, channel.sendall, channel.shutdown_write), daemon=True)
+	t.start()
+	forward(channel.recv, sock.sendall, lambda: _shutdown(sock))
+	t.join()
+	channel.close()
+	sock.close()
+
+
+def _shutdown(sock):
+	try:
+		sock.shutdown(socket.SHUT_WR)
+	except OSError:
+		pass
+
+
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description="本地压测用 SSH 服务（堡垒机/目标主机替身）")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=2222)
+	parser.add_argument("--latency", type=float, default=0.0, help="每个 exec 注入的延迟（秒）")
+	args = parser.parse_args()
+	server = BenchSSHServer(args.host, args.port, args.latency).start()
+	print(f"bench sshd listening on {server.host}:{server.port}")
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.close()
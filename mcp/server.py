@@ -1,3 +1,9 @@
+import asyncio
+import importlib.util
+import json
+import os
+from collections import deque
+from contextlib import asynccontextmanager
 from typing import Annotated
 
 import httpx
@@ -5,13 +11,78 @@ from fastmcp import FastMCP, Context
 from fastmcp.exceptions import ToolError
 from pydantic import Field
 
-# Streamable HTTP MCP server with a single tool that calls an upstream HTTP API.
-# Endpoint provided by user: 172.31.32.56:8000/api/v1/remote_call/
-REMOTE_URL = "http://172.31.32.56:8000/api/v1/remote_call/"
+# Streamable HTTP MCP server with tools that call the upstream remote_call HTTP API.
+# 上游接口根地址（对应 server/urls.py 中的 api/ 前缀），各接口地址均由此派生，环境变量可覆盖
+REMOTE_API_BASE = os.getenv("REMOTE_API_BASE", "http://172.31.32.56:8000/api").rstrip("/")
+# 单条命令执行接口
+REMOTE_URL = f"{REMOTE_API_BASE}/remote_call"
+# 流式执行接口（SSE），参数与 /api/remote_call 一致
+REMOTE_STREAM_URL = f"{REMOTE_API_BASE}/remote_call/stream"
+# 多命令接口：同一目标主机一次连接顺序执行多条命令
+REMOTE_COMMANDS_URL = f"{REMOTE_API_BASE}/remote_call/commands"
+# 流式工具最终返回给模型的输出尾部行数，完整输出已通过 ctx 日志实时推送
+STREAM_TAIL_LINES = 200
+
+# 上游连接池配置（环境变量可覆盖）
+HTTP_MAX_CONNECTIONS = int(os.getenv("REMOTE_HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("REMOTE_HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("REMOTE_HTTP_KEEPALIVE_EXPIRY", 30))
+# 连接失败重试次数与退避基数（秒），仅针对建立连接阶段的错误，请求未发出，重试安全
+HTTP_CONNECT_RETRIES = int(os.getenv("REMOTE_HTTP_CONNECT_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("REMOTE_HTTP_RETRY_BACKOFF", 0.2))
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    """创建长连接复用的上游客户端；安装了 h2 时启用 HTTP/2。"""
+    return httpx.AsyncClient(
+        follow_redirects=False,
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享客户端；未经 lifespan 启动（如单独导入调用）时按需创建。"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _create_http_client()
+    return _http_client
+
+
+@asynccontextmanager
+async def lifespan(server):
+    """随 MCP 服务启动创建共享客户端，退出时关闭连接池。"""
+    global _http_client
+    _http_client = _create_http_client()
+    try:
+        yield {}
+    finally:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def post_with_retry(url: str, payload: dict, timeout: float) -> httpx.Response:
+    """使用共享客户端 POST，连接失败时指数退避重试。"""
+    client = get_http_client()
+    for attempt in range(HTTP_CONNECT_RETRIES + 1):
+        try:
+            return await client.post(url, json=payload, timeout=timeout)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt >= HTTP_CONNECT_RETRIES:
+                raise
+            await asyncio.sleep(HTTP_RETRY_BACKOFF * (2 ** attempt))
+
 
 mcp = FastMCP(
     name="undev-remote-call",
     strict_input_validation=True,
+    lifespan=lifespan,
 )
 
 
@@ -45,8 +116,7 @@ async def remote_call(
         if ctx is not None:
             await ctx.debug(f"POST {REMOTE_URL}")
 
-        async with httpx.AsyncClient(timeout=timeout_secs, follow_redirects=False) as client:
-            resp = await client.post(REMOTE_URL, json=payload)
+        resp = await post_with_retry(REMOTE_URL, payload, timeout_secs)
 
         if ctx is not None:
             await ctx.report_progress(2, total=3)
@@ -93,5 +163,136 @@ async def remote_call(
         raise ToolError("网络请求失败，无法连接上游接口。") from None
 
 
+
+@mcp.tool(
+    name="remote_call_stream",
+    description=(
+        "流式调用远程执行接口：执行过程中实时推送输出，适用于长时间运行的脚本与大日志。"
+    ),
+    tags={"http", "remote", "command", "stream"},
+)
+async def remote_call_stream(
+    ip: Annotated[str, Field(min_length=1, max_length=128, description="目标主机 IP 地址")],
+    os_type: Annotated[str, Field(min_length=1, max_length=64, description="操作系统类型（linux/windows）")],
+    username: Annotated[str, Field(min_length=1, max_length=128, description="目标主机登录用户名")],
+    erp: Annotated[str, Field(min_length=1, max_length=128, description="调用方 ERP")],
+    cmd: Annotated[str, Field(min_length=1, max_length=4096, description="要执行的命令字符串 CMD")],
+    timeout_secs: Annotated[float, Field(ge=1, le=3600, description="整个执行过程的超时（秒）")] = 600.0,
+    ctx: Context | None = None,
+) -> dict:
+    """以 SSE 方式调用上游流式接口，输出逐行转发为 ctx 日志，返回执行状态与输出尾部。
+
+    - 只保留最后 STREAM_TAIL_LINES 行输出，内存占用与输出总量无关。
+    """
+
+    payload = {"ip": ip, "os_type": os_type, "username": username, "erp": erp, "command": cmd}
+    tail = deque(maxlen=STREAM_TAIL_LINES)
+    done = None
+    lines = 0
+
+    try:
+        if ctx is not None:
+            await ctx.debug(f"POST {REMOTE_STREAM_URL}")
+
+        timeout = httpx.Timeout(timeout_secs, connect=10.0)
+        client = get_http_client()
+        async with client.stream("POST", REMOTE_STREAM_URL, json=payload, timeout=timeout) as resp:
+            if resp.status_code >= 400:
+                body = await resp.aread()
+                raise ToolError(
+                    f"上游 API 错误: {resp.status_code}",
+                    extra={"upstream": body.decode("utf-8", errors="replace")},
+                )
+
+            event = None
+            async for raw in resp.aiter_lines():
+                if raw.startswith("event:"):
+                    event = raw[len("event:"):].strip()
+                elif raw.startswith("data:"):
+                    data = json.loads(raw[len("data:"):].strip())
+                    if event == "done":
+                        done = data
+                        continue
+                    text = data.get("line") if event == "output" else data.get("stdout")
+                    if text:
+                        tail.append(text)
+                        lines += 1
+                        if ctx is not None:
+                            await ctx.info(text)
+                            await ctx.report_progress(lines)
+    except httpx.RequestError as e:
+        if ctx is not None:
+            await ctx.error(f"网络异常：{str(e)}")
+        raise ToolError("网络请求失败，无法连接上游接口。") from None
+
+    if done is None:
+        raise ToolError("上游流式响应提前结束。", extra={"tail": list(tail)})
+
+    return {
+        "ok": done.get("status") == "success",
+        "status": done.get("status"),
+        "error": done.get("error"),
+        "rc": done.get("rc"),
+        "lines": lines,
+        "tail": list(tail),
+    }
+
+
+@mcp.tool(
+    name="remote_call_batch",
+    description=(
+        "在同一目标主机上一次调用顺序执行多条命令，返回每条命令的 stdout/stderr/exit_code 与耗时，"
+        "适用于诊断类的多命令巡检。"
+    ),
+    tags={"http", "remote", "command", "batch"},
+)
+async def remote_call_batch(
+    ip: Annotated[str, Field(min_length=1, max_length=128, description="目标主机 IP 地址")],
+    os_type: Annotated[str, Field(min_length=1, max_length=64, description="操作系统类型（linux/windows）")],
+    username: Annotated[str, Field(min_length=1, max_length=128, description="目标主机登录用户名")],
+    erp: Annotated[str, Field(min_length=1, max_length=128, description="调用方 ERP")],
+    commands: Annotated[list[str], Field(min_length=1, max_length=100, description="按顺序执行的命令列表")],
+    continue_on_error: Annotated[bool, Field(description="某条命令失败后是否继续执行后续命令")] = True,
+    timeout_secs: Annotated[float, Field(ge=1, le=3600, description="整个执行过程的超时（秒）")] = 120.0,
+    ctx: Context | None = None,
+) -> dict:
+    """调用上游多命令接口，返回 {"results": [{command, status, stdout, stderr, exit_code, duration_ms}], "error"?}。"""
+
+    payload = {
+        "ip": ip,
+        "os_type": os_type,
+        "username": username,
+        "erp": erp,
+        "commands": commands,
+        "continue_on_error": continue_on_error,
+        "timeout": int(timeout_secs),
+    }
+
+    try:
+        if ctx is not None:
+            await ctx.debug(f"POST {REMOTE_COMMANDS_URL}")
+        # 上游执行超时之外预留少量网络余量
+        resp = await post_with_retry(REMOTE_COMMANDS_URL, payload, timeout_secs + 10)
+    except httpx.RequestError as e:
+        if ctx is not None:
+            await ctx.error(f"网络异常：{str(e)}")
+        raise ToolError("网络请求失败，无法连接上游接口。") from None
+
+    try:
+        body = resp.json()
+    except ValueError:
+        raise ToolError(f"上游返回非 JSON 响应: {resp.status_code}") from None
+    if resp.status_code >= 400:
+        raise ToolError(f"上游 API 错误: {resp.status_code}", extra={"upstream": body})
+
+    result = {"results": body.get("data") or []}
+    if body.get("error"):
+        result["error"] = body["error"]
+    if ctx is not None:
+        failed = sum(1 for item in result["results"] if item.get("status") == "failed")
+        await ctx.info(f"执行完成：{len(result['results'])} 条命令，失败 {failed} 条。")
+    return result
+
+
 # Also expose an ASGI app for uvicorn-based deployments if desired.
 app = mcp.http_app(path="/mcp")
@@ -4,9 +4,13 @@
 用于存储和处理远程调用相关参数，仅接收已校验参数，聚焦于业务逻辑和方法封装。
 """
 from dataclasses import dataclass, field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
+import hashlib
 import uuid
 
+# 关闭 SSH 连接复用（ControlPath=none 优先于 ansible 默认添加的 ControlPath）
+NO_MUX_ARGS = "-o ControlMaster=no -o ControlPath=none"
+
 @dataclass
 class RemoteCallContext:
     os_type: str
@@ -15,9 +19,13 @@ class RemoteCallContext:
     erp: str
     password: Optional[str] = None
     port: Optional[int] = None
-    command: Optional[str] = None
+    command: Optional[Union[str, List[str]]] = None
     file_path: Optional[str] = None
     use_bastion: bool = True
+    engine: Optional[str] = None
+    timeout: Optional[int] = None
+    continue_on_error: bool = True
+    cache: bool = False
     extra: Dict[str, Any] = field(default_factory=dict)
     uuid: str = field(default_factory=lambda: str(uuid.uuid4()))
 
@@ -48,6 +56,13 @@ class RemoteCallContext:
         """
         return self.command is not None and self.file_path is None
 
+    def is_multi_command(self) -> bool:
+        """
+        判断是否为多命令模式（command 为命令列表，逐条执行并分别返回结果）。
+        :return: 多命令模式返回 True，否则返回 False。
+        """
+        return isinstance(self.command, (list, tuple))
+
     def is_script_mode(self) -> bool:
         """
         判断是否为脚本执行模式（即上传并执行脚本文件）。
@@ -106,6 +121,15 @@ class RemoteCallContext:
                 return 5985
         return 22
     
+    def get_credential_fingerprint(self) -> str:
+        """
+        认证凭据的指纹，用于区分复用的已登录连接：密码认证时为密码的 SHA-256，密钥认证时为 'key'。
+        :return: 指纹字符串
+        """
+        if self.is_password_auth():
+            return "password:" + hashlib.sha256(self.password.encode("utf-8")).hexdigest()
+        return "key"
+
     def get_target_addr(self) -> str:
         """
         获取目标主机的地址（IP:端口）。
@@ -118,6 +142,10 @@ class RemoteCallContext:
         根据操作系统类型返回合适的 ansible group_name。
         :return: Linux 返回 'linux_servers'，Windows 返回 'windows_servers'，否则返回 'target'。
         """
+        profile = self.extra.get("profile")
+        if profile:
+            # 登记表中的主机使用预编译的分组名
+            return profile["group_name"]
         if self.is_linux():
             return "linux_servers"
         elif self.is_windows():
@@ -154,21 +182,37 @@ class RemoteCallContext:
             return (
                 f"-o StrictHostKeyChecking=no "
                 f"-o KexAlgorithms=+diffie-hellman-group1-sha1 "
-                f"-o HostKeyAlgorithms=+ssh-rsa"
+                f"-o HostKeyAlgorithms=+ssh-rsa "
+                f"{NO_MUX_ARGS}"
             )
-        # 密码认证时不添加 ssh_common_args
+        # 密码认证时不复用连接：ansible 默认的 ControlPath 只按主机/端口/用户区分，
+        # 复用已认证的连接会跳过本次请求的密码校验
         if self.is_password_auth():
-            return ""
+            return NO_MUX_ARGS
+        # 目标主机控制套接字（由 ControlSocketPool 分配），存在时复用到目标的 SSH 连接
+        target_control_path = getattr(ansible_cfg, 'target_control_path', None)
+        control_args = f" -o ControlPath={target_control_path}" if target_control_path else ""
         if not self.is_use_bastion() or not ansible_cfg:
             # 直连模式，仅关闭主机密钥检查
             return (
                 f"-o StrictHostKeyChecking=no"
+                f"{control_args}"
             )
         # 跳板模式，拼接 ProxyCommand 及密钥参数
+        # 堡垒机控制套接字存在时，ProxyCommand 的 -W 转发复用到堡垒机的已有连接
+        bastion_control_path = getattr(ansible_cfg, 'bastion_control_path', None)
+        if bastion_control_path:
+            proxy_mux = (
+                f"-o ControlMaster=auto -o ControlPath={bastion_control_path} "
+                f"-o ControlPersist={ansible_cfg.ssh_control_persist}s"
+            )
+        else:
+            proxy_mux = "-o ControlMaster=no"
         return (
             # f"-o ProxyJump={ansible_cfg.bastion_user}@{ansible_cfg.bastion_ip} "
-            f"-o ProxyCommand=\"ssh -o ControlMaster=no -i {ansible_cfg.jump_private_key} -W %h:%p {ansible_cfg.bastion_user}@{ansible_cfg.bastion_ip}\" "
+            f"-o ProxyCommand=\"ssh {proxy_mux} -i {ansible_cfg.jump_private_key} -p {ansible_cfg.bastion_port} -W %h:%p {ansible_cfg.bastion_user}@{ansible_cfg.bastion_ip}\" "
             f"-o StrictHostKeyChecking=no"
+            f"{control_args}"
         )
 
     def to_dict(self) -> dict:
@@ -0,0 +1,230 @@
+"""
+执行历史记录：每次远程执行结束后写入 ExecutionRecord，供按主机/用户/时间查询。
+
+- 写入不在请求路径上：记录放入有界队列，由后台线程按批（bulk_create）写库；
+  队列已满时丢弃并记录告警，数据库变慢不会拖慢远程调用；
+- 请求参数写入前脱敏（密码、令牌等），stdout/stderr 只保留首尾片段并记录原始字节数；
+- 超过保留天数的记录由后台线程定期清理。
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from remote_call.utils import redact, redact_text
+from remote_call.shaping import truncate_text
+
+logger = logging.getLogger('django')
+
+# 清理过期记录的间隔（秒）
+PURGE_INTERVAL = 3600
+# 请求参数中不写入历史的字段（命令单独成列，uuid 即 execution_id）
+_OMIT_REQUEST_KEYS = ("command", "commands", "uuid")
+
+
+def _output(text, head_bytes, tail_bytes):
+    """
+    截取输出首尾片段，返回 (片段, 原始字节数)。
+    """
+    if not isinstance(text, str) or not text:
+        return "", 0
+    cut, size = truncate_text(text, head_bytes, tail_bytes)
+    if cut is None:
+        return text, len(text.encode("utf-8"))
+    return cut, size
+
+
+class ExecutionRecorder:
+    """
+    执行历史的异步批量写入器。
+    """
+
+    def __init__(self):
+        cfg = getattr(settings, "HISTORY_CONFIG", {})
+        self.enabled = bool(cfg.get("ENABLED", True))
+        self.batch_size = int(cfg.get("BATCH_SIZE", 200))
+        self.flush_interval = float(cfg.get("FLUSH_INTERVAL", 1.0))
+        self.head_bytes = int(cfg.get("OUTPUT_HEAD_BYTES", 4096))
+        self.tail_bytes = int(cfg.get("OUTPUT_TAIL_BYTES", 4096))
+        self.retention_days = int(cfg.get("RETENTION_DAYS", 30))
+        self._queue = queue.Queue(maxsize=int(cfg.get("QUEUE_SIZE", 10000)))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def record(self, user_context, response: dict, kind: str = "single", exec_type: str = None):
+        """
+        登记一次执行结果（非阻塞）。
+        :param user_context: RemoteCallContext 用户上下文
+        :param response: 服务层返回的结果（含 data/error/status/timings）
+        :param kind: 调用方式 single / aio / commands
+        :param exec_type: 执行类型，默认按上下文推断
+        """
+        if not self.enabled:
+            return
+        try:
+            if kind == "commands":
+                rows = [
+                    self._row(user_context, response, kind, "commands", item.get("command"), item, item.get("exit_code"))
+                    for item in response.get("data") or []
+                ]
+            else:
+                data = response.get("data") if isinstance(response.get("data"), dict) else {}
+                rows = [self._row(user_context, response, kind, exec_type, None, data, data.get("rc"))]
+        except Exception:
+            logger.exception("Failed to build execution record")
+            return
+        self._enqueue(rows)
+
+    def record_batch(self, user_contexts, response: dict):
+        """
+        登记批量执行结果，每台主机一条记录。
+        """
+        if not self.enabled:
+            return
+        by_host = {item.get("host"): item for item in response.get("data") or [] if isinstance(item, dict)}
+        rows = []
+        try:
+            for ctx in user_contexts:
+                item = by_host.get(ctx.ip) or {}
+                status = "error" if item.get("failed") or not item else "success"
+                error = item.get("msg") if item else response.get("error")
+                rows.append(self._row(ctx, dict(response, status=status, error=error), "batch", "batch",
+                                      None, item, item.get("rc")))
+        except Exception:
+            logger.exception("Failed to build execution records")
+            return
+        self._enqueue(rows)
+
+    def _row(self, user_context, response, kind, exec_type, command, item, rc):
+        from api.models import ExecutionRecord
+        from remote_call.metrics import exec_type_of
+
+        timings = response.get("timings") or {}
+        duration_ms = timings.get("total")
+        created_at = timezone.now()
+        if duration_ms is not None:
+            created_at -= timedelta(milliseconds=duration_ms)
+        if command is None:
+            command = user_context.command if user_context.is_command_mode() else user_context.file_path
+            if isinstance(command, list):
+                command = "\n".join(command)
+        request = {
+            k: v for k, v in user_context.to_dict().items()
+            if k not in _OMIT_REQUEST_KEYS and v not in (None, "", {})
+        }
+        stdout, stdout_bytes = _output(item.get("stdout"), self.head_bytes, self.tail_bytes)
+        stderr, stderr_bytes = _output(item.get("stderr"), self.head_bytes, self.tail_bytes)
+        error = response.get("error")
+        return ExecutionRecord(
+            execution_id=user_context.get_uuid(),
+            kind=kind,
+            erp=user_context.get_erp() or "",
+            ip=user_context.ip,
+            port=user_context.port,
+            username=user_context.username or "",
+            os_type=(user_context.os_type or "").lower(),
+            exec_type=exec_type or exec_type_of(user_context),
+            engine=user_context.engine or "",
+            command=redact_text(command or ""),
+            request=redact(request),
+            status=item.get("status") if kind == "commands" else response.get("status") or "error",
+            rc=rc if isinstance(rc, int) else None,
+            error=redact_text(error if isinstance(error, str) else str(error)) if error else "",
+            stdout=stdout,
+            stderr=stderr,
+            stdout_bytes=stdout_bytes,
+            stderr_bytes=stderr_bytes,
+            timings=timings,
+            duration_ms=duration_ms,
+            created_at=created_at,
+        )
+
+    def _enqueue(self, rows):
+        self._ensure_writer()
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                logger.warning("Execution history queue full, dropping record %s", row.execution_id)
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name="execution-history", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _writer(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._purge_expired()
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            self._purge_expired()
+
+    def _write(self, batch):
+        from api.models import ExecutionRecord
+        try:
+            ExecutionRecord.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            logger.exception("Failed to write %d execution records", len(batch))
+        finally:
+            close_old_connections()
+
+    def _purge_expired(self):
+        from api.models import ExecutionRecord
+        now = time.monotonic()
+        if self.retention_days <= 0 or now - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        try:
+            deleted, _ = ExecutionRecord.objects.filter(
+                created_at__lt=timezone.now() - timedelta(days=self.retention_days)
+            ).delete()
+            if deleted:
+                logger.info("Execution history purged %d records", deleted)
+        except Exception:
+            logger.exception("Failed to purge execution history")
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        """
+        立即写入队列中剩余的记录（进程退出时调用）。
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+
+# 进程级单例
+execution_recorder = ExecutionRecorder()
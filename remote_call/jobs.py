@@ -0,0 +1,157 @@
+"""
+异步任务管理：提交后立即返回 job_id，由后台线程池执行远程调用，
+调用方通过轮询接口获取状态、分步进度（来自任务链）以及最终结果。
+任务可被取消：尚未开始的任务直接结束，执行中（含在调度器中排队）的任务经调度器取消。
+
+任务状态保存在进程内存中，多进程部署时需保证同一 job_id 的查询路由到提交它的进程。
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from ansible.scheduler import execution_scheduler
+
+logger = logging.getLogger('django')
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCESS = "success"
+JOB_ERROR = "error"
+
+
+class Job:
+    """
+    单个异步任务的状态记录。
+    """
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = JOB_PENDING
+        self.steps = []  # [{"index", "task", "status"}]，来自 AnsibleTaskContext.get_task_chain
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.canceled = False
+        self._lock = threading.Lock()
+
+    def is_finished(self) -> bool:
+        return self.status in (JOB_SUCCESS, JOB_ERROR)
+
+    def on_progress(self, index: int, total: int, task: str, state: str):
+        """
+        任务链进度回调，由 run_ansible_with_context 在每一步开始/结束时调用。
+        :param index: 步骤序号（从 0 开始）
+        :param total: 任务链总步数
+        :param task: 步骤描述（module:args）
+        :param state: running / success / error
+        """
+        with self._lock:
+            if not self.steps:
+                self.steps = [{"index": i, "task": None, "status": JOB_PENDING} for i in range(total)]
+            if index < len(self.steps):
+                self.steps[index]["task"] = task
+                self.steps[index]["status"] = state
+
+    def to_dict(self, with_result: bool = False) -> dict:
+        with self._lock:
+            steps = [dict(step) for step in self.steps]
+        done = sum(1 for step in steps if step["status"] in (JOB_SUCCESS, JOB_ERROR))
+        d = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": {"done": done, "total": len(steps), "steps": steps},
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if with_result:
+            d["result"] = self.result
+        return d
+
+
+class JobManager:
+    """
+    异步任务管理器：有界线程池执行任务，已完成的任务保留 retention 秒后清理。
+    """
+
+    def __init__(self):
+        cfg = getattr(settings, "JOB_CONFIG", {})
+        self.max_workers = int(cfg.get("WORKERS", 8))
+        self.retention = int(cfg.get("RETENTION", 3600))
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, service: Callable, data: dict) -> Job:
+        """
+        提交任务。service 需接受 progress_callback 关键字参数并返回结果字典。
+        """
+        job = Job()
+        with self._lock:
+            self._prune()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="remote-call-job")
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, service, data)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job: Job) -> bool:
+        """
+        取消任务：尚未开始的任务直接结束，执行中的任务经调度器取消。
+        :return: 任务已结束时返回 False
+        """
+        with job._lock:
+            if job.is_finished() or job.canceled:
+                return False
+            job.canceled = True
+            pending = job.status == JOB_PENDING
+        if pending:
+            # 线程池取到该任务时发现已取消，不再执行
+            self._finish(job, {"data": None, "target": None, "error": "执行已取消", "status": JOB_ERROR})
+            return True
+        return execution_scheduler.cancel(job.id)
+
+    def _run(self, job: Job, service: Callable, data: dict):
+        # 以 job_id 作为执行标识登记取消事件，覆盖获取执行槽位之前的准备阶段
+        with execution_scheduler.cancel_scope(job.id):
+            with job._lock:
+                if job.canceled:
+                    return
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+            try:
+                data = dict(data, uuid=job.id)
+                result = service(data, progress_callback=job.on_progress)
+            except Exception as e:
+                logger.exception("Async job %s failed", job.id)
+                result = {"data": None, "target": None, "error": str(e), "status": JOB_ERROR}
+        self._finish(job, result)
+
+    @staticmethod
+    def _finish(job: Job, result: dict):
+        job.result = result
+        job.finished_at = time.time()
+        # 最后更新状态，保证状态为已完成时结果与完成时间均已就绪
+        job.status = result.get("status", JOB_SUCCESS)
+
+    def _prune(self):
+        """
+        清理超过保留期的已完成任务（调用方需持有锁）。
+        """
+        deadline = time.time() - self.retention
+        for job_id in [k for k, j in self._jobs.items() if j.is_finished() and j.finished_at < deadline]:
+            self._jobs.pop(job_id, None)
+
+
+# 进程级单例
+job_manager = JobManager()
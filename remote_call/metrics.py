@@ -0,0 +1,332 @@
+"""
+执行耗时打点与 Prometheus 指标。
+
+- 请求内分阶段计时：服务层以 request_timer() 开启计时，调用链中各阶段以 stage() 打点，
+  计时上下文通过 contextvars 传递（同步线程与 asyncio 协程均适用），结果作为响应的 timings 返回；
+- 指标：进程内自带的轻量注册表（不依赖 prometheus_client），/metrics 以 Prometheus 文本格式输出，
+  包括分阶段耗时直方图、请求耗时、执行中请求数、限流/排队等待时间以及堡垒机连接数。
+  多进程部署时每个进程单独暴露，由 Prometheus 按实例聚合。
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# 默认直方图桶（秒）：覆盖毫秒级阶段到分钟级执行
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    仪表：可 inc/dec/set，也可传入 collect 回调在抓取时取值（返回 {labels 元组: 值}）。
+    """
+    kind = "gauge"
+
+    def __init__(self, *args, collect: Optional[Callable[[], Dict[Tuple, float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self._collect is not None:
+            try:
+                items = list(self._collect().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # key -> [bucket 计数..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += series[i]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "remote_call_stage_seconds", "Duration of each execution stage.", ("stage", "os_type", "exec_type")
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "remote_call_request_seconds", "End-to-end service duration.", ("os_type", "exec_type", "status")
+))
+REQUESTS_TOTAL = registry.register(Counter(
+    "remote_call_requests_total", "Remote call requests by outcome.", ("os_type", "exec_type", "status")
+))
+IN_FLIGHT = registry.register(Gauge(
+    "remote_call_in_flight", "Remote calls currently being served.", ("os_type", "exec_type")
+))
+LIMITER_WAIT_SECONDS = registry.register(Histogram(
+    "remote_call_limiter_wait_seconds", "Time spent waiting in API rate/concurrency limiters.", ("limiter", "key")
+))
+
+
+def _scheduler_stats():
+    from ansible.scheduler import execution_scheduler
+    return execution_scheduler.stats()
+
+
+registry.register(Gauge(
+    "remote_call_scheduler_running", "Executions holding a scheduler slot.",
+    collect=lambda: {(): _scheduler_stats()["running"]}
+))
+registry.register(Gauge(
+    "remote_call_scheduler_waiting", "Executions queued for a scheduler slot.",
+    collect=lambda: {(): _scheduler_stats()["waiting"]}
+))
+registry.register(Gauge(
+    "remote_call_bastion_sessions", "Scheduler sessions in use per bastion.", ("bastion",),
+    collect=lambda: {(b,): n for b, n in _scheduler_stats()["bastion_sessions"].items()}
+))
+
+
+def _bastion_health():
+    from ansible.bastion import bastion_pool
+    return {(name,): up for name, up in bastion_pool.stats().items()}
+
+
+registry.register(Gauge(
+    "remote_call_bastion_up", "Bastion pool health (1 = selectable, 0 = marked down).", ("bastion",),
+    collect=_bastion_health
+))
+
+
+def _connection_stats():
+    from ansible.native import native_ssh_pool
+    from ansible.multiplex import control_socket_pool
+    from ansible.h3c import h3c_session_pool
+    stats = {}
+    for kind, count in native_ssh_pool.stats().items():
+        stats[("native", kind)] = count
+    for kind, count in control_socket_pool.stats().items():
+        stats[("controlmaster", kind)] = count
+    for kind, count in h3c_session_pool.stats().items():
+        stats[("h3c", kind)] = count
+    return stats
+
+
+registry.register(Gauge(
+    "remote_call_pooled_connections", "Pooled SSH connections (native paramiko pool / ControlMaster sockets / H3C CLI sessions).",
+    ("pool", "kind"), collect=_connection_stats
+))
+
+
+def _warm_pool_workers():
+    from ansible.warm_pool import warm_ansible_pool
+    return {(): warm_ansible_pool.stats()["workers"]}
+
+
+registry.register(Gauge(
+    "remote_call_warm_ansible_workers", "Live warm ansible worker processes.", collect=_warm_pool_workers
+))
+
+
+class RequestTimer:
+    """
+    单个请求的分阶段计时，同名阶段多次执行时累加（批量执行时为各主机耗时之和）。
+    """
+
+    def __init__(self, os_type: str, exec_type: str):
+        self.os_type = os_type
+        self.exec_type = exec_type
+        self.status = None
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        """
+        返回 {阶段: 毫秒, total: 毫秒}。
+        """
+        with self._lock:
+            timings = {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar("remote_call_timer", default=None)
+
+
+def exec_type_of(user_context) -> str:
+    if user_context.is_multi_command():
+        return "commands"
+    if user_context.is_command_mode():
+        return "command"
+    return "script"
+
+
+@contextmanager
+def request_timer(os_type: str, exec_type: str):
+    """
+    开启请求计时：执行中请求数 +1，退出时按 timer.status 记录请求耗时与次数。
+    嵌套调用（如多命令服务内部调用单命令服务）时复用外层计时，不重复计数。
+    :param os_type: 目标系统类型标签
+    :param exec_type: 执行类型标签（command/commands/script/batch），可由 exec_type_of() 推断
+    :return: RequestTimer，as_dict() 即响应中的 timings
+    """
+    current = _current_timer.get()
+    if current is not None:
+        yield current
+        return
+
+    os_type = (os_type or "").lower()
+    timer = RequestTimer(os_type, exec_type)
+    token = _current_timer.set(timer)
+    IN_FLIGHT.inc(os_type=os_type, exec_type=exec_type)
+    try:
+        yield timer
+    finally:
+        IN_FLIGHT.dec(os_type=os_type, exec_type=exec_type)
+        _current_timer.reset(token)
+        status = timer.status or "error"
+        REQUEST_SECONDS.observe(time.perf_counter() - timer.started, os_type=os_type, exec_type=exec_type, status=status)
+        REQUESTS_TOTAL.inc(os_type=os_type, exec_type=exec_type, status=status)
+
+
+def observe_stage(stage: str, seconds: float):
+    """
+    记录一个已知耗时的阶段（如调度排队时间）。
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        STAGE_SECONDS.observe(seconds, stage=stage, os_type="", exec_type="")
+        return
+    timer.add(stage, seconds)
+    STAGE_SECONDS.observe(seconds, stage=stage, os_type=timer.os_type, exec_type=timer.exec_type)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    阶段打点：with stage("inventory_write"): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,124 @@
+"""
+主机登记表的进程内缓存。
+
+- 首次使用时加载全部启用的 Host，按 host_id 与 tag 建立索引，请求时只查内存；
+- 本进程内的增删改通过模型信号立即失效，其他进程写入的变更在 REFRESH_INTERVAL 秒内经
+  (最大 updated_at, 行数) 比对发现并重新加载；
+- 凭据来自 HOST_REGISTRY["CREDENTIALS"]（credential_ref -> {username, password}），密码不写入数据库。
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+# 请求中由登记信息决定、不再由调用方提供的字段
+_HOST_KEYS = ("host_id", "tag")
+
+
+class HostNotFound(LookupError):
+    pass
+
+
+class HostRegistry:
+    """
+    主机登记表缓存。
+    """
+
+    def __init__(self):
+        cfg = getattr(settings, "HOST_REGISTRY", {})
+        self.refresh_interval = float(cfg.get("REFRESH_INTERVAL", 30))
+        self.credentials = cfg.get("CREDENTIALS") or {}
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_tag = {}
+        self._version = None
+        self._checked_at = 0.0
+
+    def get(self, host_id: str):
+        by_id, _ = self._snapshot()
+        host = by_id.get(host_id)
+        if host is None:
+            raise HostNotFound(f"未登记的主机: {host_id}")
+        return host
+
+    def by_tag(self, tag: str) -> list:
+        _, by_tag = self._snapshot()
+        hosts = by_tag.get(tag)
+        if not hosts:
+            raise HostNotFound(f"没有带标签 {tag} 的主机")
+        return hosts
+
+    def resolve(self, data: dict) -> dict:
+        """
+        请求携带 host_id 时以登记信息补全连接参数，否则仅去掉 host_id/tag 字段。
+        :raises HostNotFound: host_id 未登记或已停用
+        """
+        if not data.get("host_id"):
+            return {k: v for k, v in data.items() if k not in _HOST_KEYS}
+        return self.apply(self.get(data["host_id"]), data)
+
+    def apply(self, host, data: dict) -> dict:
+        """
+        以登记主机的连接参数覆盖请求参数，返回可直接构建 RemoteCallContext 的字典。
+        登记信息中未设置的用户名/密码沿用请求中的值。
+        """
+        data = {k: v for k, v in data.items() if k not in _HOST_KEYS}
+        credential = self.credentials.get(host.credential_ref) or {}
+        data.update(
+            ip=host.ip,
+            port=host.profile.get("port") or host.port,
+            os_type=host.os_type,
+            use_bastion=host.use_bastion,
+        )
+        data["username"] = host.username or credential.get("username") or data.get("username") or ""
+        if credential.get("password") is not None:
+            data["password"] = credential["password"]
+        data["extra"] = dict(
+            data.get("extra") or {},
+            host_id=host.host_id,
+            bastion=host.bastion,
+            profile=host.profile,
+        )
+        return data
+
+    def invalidate(self, **kwargs):
+        """
+        丢弃缓存，下次访问时重新加载（Host 的 post_save/post_delete 信号回调）。
+        """
+        with self._lock:
+            self._by_id = None
+
+    def _snapshot(self):
+        """
+        返回当前索引 (by_id, by_tag)，过期时先检查版本并按需重新加载。
+        """
+        now = time.monotonic()
+        by_id, by_tag = self._by_id, self._by_tag
+        if by_id is not None and now - self._checked_at < self.refresh_interval:
+            return by_id, by_tag
+        with self._lock:
+            if self._by_id is not None and now - self._checked_at < self.refresh_interval:
+                return self._by_id, self._by_tag
+            from django.db.models import Count, Max
+            from api.models import Host
+
+            version = Host.objects.aggregate(updated=Max("updated_at"), count=Count("id"))
+            version = (version["updated"], version["count"])
+            self._checked_at = now
+            if self._by_id is not None and version == self._version:
+                return self._by_id, self._by_tag
+            by_id, by_tag = {}, {}
+            for host in Host.objects.filter(enabled=True):
+                by_id[host.host_id] = host
+                for tag in host.tags or []:
+                    by_tag.setdefault(tag, []).append(host)
+            self._by_id, self._by_tag, self._version = by_id, by_tag, version
+            logger.info("Host registry loaded: %d hosts, %d tags", len(by_id), len(by_tag))
+            return by_id, by_tag
+
+
+# 进程级单例
+host_registry = HostRegistry()
@@ -0,0 +1,191 @@
+"""
+只读命令结果缓存。
+
+诊断场景下同一主机会在短时间内重复执行 df -h、uptime 等只读命令，
+对白名单内的命令按 (erp, ip, port, username, 认证方式/凭据, 是否经堡垒机, os_type, command) 缓存执行结果，
+在各命令的 TTL 内直接返回，减少对目标主机与堡垒机的重复访问。
+
+- 需请求显式开启（cache=True），且 RESULT_CACHE["ENABLED"] 为 True；
+- 白名单按规范化后的命令（合并空白）精确匹配，避免 "df -h; rm ..." 之类的拼接命令命中；
+- 只缓存执行成功的结果；
+- 后端可选：memory（进程内 LRU）/ django（Django 缓存，如 django-redis，多进程共享，淘汰由缓存服务负责）。
+"""
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+BACKEND_MEMORY = "memory"
+BACKEND_DJANGO = "django"
+
+
+def normalize_command(command: str) -> str:
+    """
+    规范化命令字符串：去除首尾空白并合并连续空白。
+    """
+    return " ".join(command.split())
+
+
+class _MemoryBackend:
+    """
+    进程内 LRU 缓存，条目数超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _DjangoCacheBackend:
+    """
+    基于 Django 缓存框架（settings.CACHES）的后端，过期与淘汰由缓存服务（如 Redis maxmemory 策略）负责。
+    """
+
+    def __init__(self, alias: str):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+
+    def get(self, key: str):
+        return self._cache.get(key)
+
+    def set(self, key: str, value, ttl: int):
+        self._cache.set(key, value, timeout=ttl)
+
+    def clear(self):
+        # 共享缓存中可能存有其他业务数据，不做整体清空，依赖 TTL 过期
+        pass
+
+
+class ResultCache:
+    """
+    只读命令结果缓存。
+    """
+
+    KEY_PREFIX = "remote_call:result:"
+
+    def __init__(self):
+        cfg = getattr(settings, "RESULT_CACHE", {})
+        self.enabled = bool(cfg.get("ENABLED", False))
+        self.commands = {normalize_command(cmd): int(ttl) for cmd, ttl in cfg.get("COMMANDS", {}).items()}
+        backend = cfg.get("BACKEND", BACKEND_MEMORY)
+        if backend == BACKEND_DJANGO:
+            self._backend = _DjangoCacheBackend(cfg.get("CACHE_ALIAS", "default"))
+        else:
+            self._backend = _MemoryBackend(int(cfg.get("MAX_ENTRIES", 1024)))
+
+    def get_ttl(self, user_context) -> Optional[int]:
+        """
+        返回请求可使用的缓存 TTL（秒），不可缓存时返回 None。
+        仅单条命令模式、请求开启 cache 且命令在白名单中时可缓存。
+        """
+        if not self.enabled or not getattr(user_context, "cache", False):
+            return None
+        if not user_context.is_command_mode() or user_context.is_multi_command():
+            return None
+        ttl = self.commands.get(normalize_command(user_context.command))
+        return ttl if ttl and ttl > 0 else None
+
+    def make_key(self, user_context) -> str:
+        """
+        缓存键：ERP 用户、目标地址、登录用户、认证方式（密码认证时含密码本身）、是否经堡垒机与规范化后的命令。
+        不同 ERP 用户、不同凭据（包括错误的密码）互不命中对方的结果；
+        以 SECRET_KEY 作 HMAC，缓存键不能用于离线猜测密码。
+        """
+        auth = f"password:{user_context.password}" if user_context.is_password_auth() else "key"
+        raw = "\0".join([
+            user_context.get_erp(),
+            user_context.ip,
+            str(user_context.get_port()),
+            user_context.username,
+            user_context.os_type.lower(),
+            auth,
+            "bastion" if user_context.is_use_bastion() else "direct",
+            normalize_command(user_context.command),
+        ])
+        digest = hmac.new(settings.SECRET_KEY.encode("utf-8"), raw.encode("utf-8"), hashlib.sha256).hexdigest()
+        return self.KEY_PREFIX + digest
+
+    def get(self, user_context) -> Optional[dict]:
+        """
+        查询缓存，命中时返回结果副本并附带 cache 元数据 {hit, age, ttl}。
+        """
+        ttl = self.get_ttl(user_context)
+        if ttl is None:
+            return None
+        try:
+            entry = self._backend.get(self.make_key(user_context))
+        except Exception as e:
+            # 缓存服务异常时退化为直接执行
+            logger.warning("Result cache get failed: %s", e)
+            return None
+        if entry is None:
+            return None
+        result = dict(entry["result"])
+        result["cache"] = {"hit": True, "age": round(time.time() - entry["stored_at"], 3), "ttl": ttl}
+        return result
+
+    def set(self, user_context, result: dict):
+        """
+        写入执行成功的结果，并为结果附加 cache 元数据 {hit: False, ttl}。
+        """
+        ttl = self.get_ttl(user_context)
+        if ttl is None or result.get("status") != "success":
+            return
+        # 排队信息只对本次执行有意义，不随缓存结果返回
+        stored = {k: v for k, v in result.items() if k != "scheduler"}
+        entry = {"stored_at": time.time(), "result": stored}
+        try:
+            self._backend.set(self.make_key(user_context), entry, ttl)
+        except Exception as e:
+            logger.warning("Result cache set failed: %s", e)
+            return
+        result["cache"] = {"hit": False, "age": 0, "ttl": ttl}
+
+    def clear(self):
+        self._backend.clear()
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    获取进程级结果缓存实例（首次使用时按配置创建）。
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
@@ -6,14 +6,47 @@
 3. 组装 Ansible 任务上下文。
 4. 调用 ansible runner 执行任务。
 """
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from remote_call.context import RemoteCallContext
 from ansible.runner import AnsibleTaskContext,run_ansible_with_context
+from ansible.async_runner import arun_ansible_with_context
 from ansible.config import get_ansible_config
-from ansible.inventory import generate_inventory
+from ansible.multiplex import control_socket_pool
+from ansible.native import use_native_engine, run_native_with_context, run_native_commands
+from ansible.h3c import use_h3c_session, run_h3c_with_context, run_h3c_commands
+from ansible.bastion import bastion_pool
+from ansible.inventory import generate_inventory, generate_batch_inventory
 from ansible.playbook import generate_playbook
+from remote_call.result_cache import get_result_cache
+from remote_call.metrics import request_timer, stage, exec_type_of
+from remote_call.history import execution_recorder
+from remote_call.registry import host_registry, HostNotFound
 
 
-def RemoteCallService(data: dict):
+def _generate_playbook_if_needed(user_context, config_context, task_context):
+    """
+    仅在任务链需要 playbook 时生成，Linux 命令/脚本、Windows 命令直接使用 ad-hoc 模块。
+    :return: (playbook 路径或 None, 清理函数)
+    """
+    if task_context.needs_playbook():
+        return generate_playbook(user_context, config_context)
+    return None, lambda: None
+
+
+def _direct_runner(user_context, config_context):
+    """
+    不经 ansible_runner 的执行引擎：H3C 命令为 CLI 会话引擎，Linux 命令按 engine 配置为原生 SSH 引擎，其余返回 None。
+    """
+    if use_h3c_session(user_context, config_context):
+        return run_h3c_with_context
+    if use_native_engine(user_context, config_context):
+        return run_native_with_context
+    return None
+
+
+def RemoteCallService(data: dict, progress_callback=None, event_handler=None):
     """
     业务流程编排服务。
     
@@ -26,55 +59,534 @@ def RemoteCallService(data: dict):
 
     Args:
         data (dict): 请求参数字典。
+        progress_callback (callable, optional): 任务链进度回调 (index, total, task, state)，异步任务模式使用。
+        event_handler (callable, optional): 执行事件回调，流式输出模式使用。
 
     Returns:
-        dict: 包含主任务输出、全部步骤结果、主任务 event_data、错误信息及状态。
+        dict: 包含主任务输出、全部步骤结果、主任务 event_data、错误信息、状态及分阶段耗时 timings。
     """
     # 1. 参数校验与上下文构建
+    # 传入 host_id 时连接参数取自主机登记表
+    try:
+        data = host_registry.resolve(data)
+    except HostNotFound as e:
+        return {"data": None, "error": str(e), "status": "error"}
     # RemoteCallContext 用于封装和校验用户请求参数，生成标准上下文对象
     user_context = RemoteCallContext(**data)
+    with request_timer(user_context.os_type, exec_type_of(user_context)) as timer:
+        response = _remote_call(user_context, progress_callback, event_handler)
+        timer.status = response.get("status")
+    response["timings"] = timer.as_dict()
+    if not (response.get("cache") or {}).get("hit"):
+        execution_recorder.record(user_context, response)
+    return response
 
-    # 2. 生成 ansible 配置
-    # get_ansible_config 返回 ansible 相关的配置信息
-    config_context = get_ansible_config(user_context)
 
-    # 3. 组装 AnsibleTaskContext（自动推断参数）
-    # 该步骤可能因参数不合法等原因抛出异常
-    try:
-        task_context = AnsibleTaskContext(user_context, config_context)
-    except Exception as e:
-        # 组装任务上下文失败，直接返回错误信息
-        return {
-            "data": None,
-            "target": None,
-            "error": str(e),
-            "status": "error"
+def _remote_call(user_context, progress_callback=None, event_handler=None):
+    """
+    RemoteCallService 的执行主体，各阶段耗时记入当前请求的 timings。
+    """
+    # 白名单内的只读命令优先读取结果缓存（流式模式需实时输出，不走缓存）
+    result_cache = get_result_cache() if event_handler is None else None
+    if result_cache is not None:
+        with stage("cache_lookup"):
+            cached = result_cache.get(user_context)
+        if cached is not None:
+            return cached
+
+    response, config_context = _execute(user_context, progress_callback, event_handler)
+    if bastion_pool.check_failover(user_context, config_context, response):
+        # 所用堡垒机不可用（已标记故障），重新选择堡垒机重试一次
+        response, _ = _execute(user_context, progress_callback, event_handler)
+    if result_cache is not None:
+        result_cache.set(user_context, response)
+    return response
+
+
+def _execute(user_context, progress_callback=None, event_handler=None):
+    """
+    _remote_call 的单次执行：生成配置（含选择堡垒机）并调用执行引擎。
+    :return: (结果, 本次使用的 ansible 配置)
+    """
+    with stage("context_build"):
+        # 2. 生成 ansible 配置（按目标主机从堡垒机池选择堡垒机）
+        # get_ansible_config 返回 ansible 相关的配置信息
+        config_context = get_ansible_config(user_context)
+        # 分配 SSH 复用控制套接字，供 inventory 的 ssh 参数引用
+        control_socket_pool.acquire(user_context, config_context)
+
+        # 3. 组装 AnsibleTaskContext（自动推断参数）
+        # 该步骤可能因参数不合法等原因抛出异常
+        try:
+            task_context = AnsibleTaskContext(user_context, config_context)
+        except Exception as e:
+            # 组装任务上下文失败，直接返回错误信息
+            return {
+                "data": None,
+                "target": None,
+                "error": str(e),
+                "status": "error"
+            }, config_context
+
+    # Linux 简单命令可走原生 SSH 引擎、H3C 命令走复用的 CLI 会话，均无需 inventory 与 ansible_runner
+    direct_runner = _direct_runner(user_context, config_context)
+    if direct_runner:
+        label = f"{task_context.module}:{task_context.module_args}"
+        if progress_callback:
+            progress_callback(0, 1, label, "running")
+        result = direct_runner(user_context, config_context, task_context, event_handler=event_handler)
+        if progress_callback:
+            progress_callback(0, 1, label, result.get("status", "success"))
+        response = {
+            "data": result.get("data"),
+            "all_results": result.get("all_results"),
+            "target": result.get("target"),
+            "error": result.get("error"),
+            "status": result.get("status", "success"),
+            "scheduler": result.get("scheduler")
         }
+        return response, config_context
 
-    # 4. 生成 inventory 文件
+    # 4. 生成 inventory 文件（按内容哈希缓存于运行时目录），按需生成 playbook
     # generate_inventory 返回 inventory 路径和清理函数
-    inventory_path, cleanup = generate_inventory(user_context, config_context)
-    playbook_path, playbook_cleanup = generate_playbook(user_context, config_context)
+    with stage("inventory_write"):
+        inventory_path, cleanup = generate_inventory(user_context, config_context)
+    with stage("playbook_write"):
+        playbook_path, playbook_cleanup = _generate_playbook_if_needed(user_context, config_context, task_context)
 
     # 5. 调用 ansible runner 执行任务
     # run_ansible_with_context 为纯函数，实际执行 ansible 任务
-    result = run_ansible_with_context(
-        user_context,
-        config_context,
-        task_context,
-        inventory_path,
-        playbook_path
-    )
-    # 执行完毕后清理临时 inventory 文件
-    cleanup()
-    playbook_cleanup()
+    try:
+        result = run_ansible_with_context(
+            user_context,
+            config_context,
+            task_context,
+            inventory_path,
+            playbook_path,
+            progress_callback=progress_callback,
+            event_handler=event_handler
+        )
+    finally:
+        # 执行完毕后清理临时 inventory 文件（含密码的 inventory 在此删除）
+        cleanup()
+        playbook_cleanup()
 
     # 返回结构化结果，便于后续扩展
-    return {
+    response = {
         "data": result.get("data"),          # 主任务输出
         "all_results": result.get("all_results"),  # 全部步骤结果
         "target": result.get("target"),      # 主任务 event_data
         "error": result.get("error"),
-        "status": result.get("status", "success")
+        "status": result.get("status", "success"),
+        "scheduler": result.get("scheduler")  # 排队信息 {queue_depth, wait_time}
+    }
+    return response, config_context
+
+
+async def AsyncRemoteCallService(data: dict):
+    """
+    RemoteCallService 的异步版本，供 ASGI 异步视图使用。
+    ansible 引擎以 asyncio 子进程执行，排队与执行等待均不占用线程；
+    native 引擎与 H3C 会话引擎（paramiko 为同步实现）在线程中执行。返回结构与 RemoteCallService 一致。
+
+    Args:
+        data (dict): 请求参数字典。
+
+    Returns:
+        dict: 包含主任务输出、全部步骤结果、主任务 event_data、错误信息、状态及分阶段耗时 timings。
+    """
+    try:
+        # 登记表缓存过期时需查询数据库，放到线程中执行
+        data = await asyncio.to_thread(host_registry.resolve, data)
+    except HostNotFound as e:
+        return {"data": None, "error": str(e), "status": "error"}
+    user_context = RemoteCallContext(**data)
+    with request_timer(user_context.os_type, exec_type_of(user_context)) as timer:
+        response = await _aremote_call(user_context)
+        timer.status = response.get("status")
+    response["timings"] = timer.as_dict()
+    if not (response.get("cache") or {}).get("hit"):
+        execution_recorder.record(user_context, response, kind="aio")
+    return response
+
+
+async def _aremote_call(user_context):
+    """
+    AsyncRemoteCallService 的执行主体。
+    """
+    result_cache = get_result_cache()
+    with stage("cache_lookup"):
+        cached = await asyncio.to_thread(result_cache.get, user_context)
+    if cached is not None:
+        return cached
+
+    response, config_context = await _aexecute(user_context)
+    if bastion_pool.check_failover(user_context, config_context, response):
+        # 所用堡垒机不可用（已标记故障），重新选择堡垒机重试一次
+        response, _ = await _aexecute(user_context)
+    await asyncio.to_thread(result_cache.set, user_context, response)
+    return response
+
+
+async def _aexecute(user_context):
+    """
+    _aremote_call 的单次执行。
+    :return: (结果, 本次使用的 ansible 配置)
+    """
+    with stage("context_build"):
+        config_context = get_ansible_config(user_context)
+        control_socket_pool.acquire(user_context, config_context)
+
+        try:
+            task_context = AnsibleTaskContext(user_context, config_context)
+        except Exception as e:
+            return {
+                "data": None,
+                "target": None,
+                "error": str(e),
+                "status": "error"
+            }, config_context
+
+    direct_runner = _direct_runner(user_context, config_context)
+    if direct_runner:
+        result = await asyncio.to_thread(direct_runner, user_context, config_context, task_context)
+    else:
+        with stage("inventory_write"):
+            inventory_path, cleanup = generate_inventory(user_context, config_context)
+        with stage("playbook_write"):
+            playbook_path, playbook_cleanup = _generate_playbook_if_needed(user_context, config_context, task_context)
+        try:
+            result = await arun_ansible_with_context(
+                user_context,
+                config_context,
+                task_context,
+                inventory_path,
+                playbook_path
+            )
+        finally:
+            cleanup()
+            playbook_cleanup()
+
+    response = {
+        "data": result.get("data"),
+        "all_results": result.get("all_results"),
+        "target": result.get("target"),
+        "error": result.get("error"),
+        "status": result.get("status", "success"),
+        "scheduler": result.get("scheduler")
+    }
+    return response, config_context
+
+
+def RemoteCallBatchService(data: dict):
+    """
+    批量执行编排服务：同一条命令/脚本下发到多台主机。
+
+    1. 解析 targets / group / tag 得到主机列表，并为每台主机构建用户上下文（tag 下的主机取自主机登记表）。
+    2. ansible 引擎：生成一份多主机 inventory，单次 ansible_runner.run 按 forks 并行执行。
+    3. native 引擎 / H3C 会话引擎：线程池按 forks 并发，在各自复用的 SSH 连接或 CLI 会话上执行。
+    4. 以主机为单位返回结果，并附带成功/失败汇总。
+
+    Args:
+        data (dict): 已校验的批量请求参数。
+
+    Returns:
+        dict: data 为按主机排列的结果列表，summary 为汇总统计，timings 为分阶段耗时。
+    """
+    with request_timer(data.get("os_type"), "batch") as timer:
+        response, user_contexts = _remote_call_batch(data)
+        timer.status = response.get("status")
+    response["timings"] = timer.as_dict()
+    execution_recorder.record_batch(user_contexts, response)
+    return response
+
+
+def _remote_call_batch(data: dict):
+    """
+    RemoteCallBatchService 的执行主体。
+    :return: (结果, 各主机的用户上下文列表)
+    """
+    data = dict(data)
+    targets = data.pop("targets", None) or []
+    group = data.pop("group", None)
+    tag = data.pop("tag", None)
+    forks = data.pop("forks", None)
+
+    if group:
+        group_hosts = get_ansible_config().host_groups.get(group)
+        if group_hosts is None:
+            return {"data": None, "error": f"未知的主机分组: {group}", "status": "error"}, []
+        targets = list(targets) + list(group_hosts)
+    # 去重并保持顺序
+    targets = list(dict.fromkeys(targets))
+
+    with stage("context_build"):
+        user_contexts = [RemoteCallContext(ip=ip, **data) for ip in targets]
+        if tag:
+            # 登记表中带该标签的主机，连接参数取自各自的登记信息
+            try:
+                tagged = host_registry.by_tag(tag)
+            except HostNotFound as e:
+                return {"data": None, "error": str(e), "status": "error"}, []
+            user_contexts += [
+                RemoteCallContext(**host_registry.apply(host, data))
+                for host in tagged if host.ip not in targets
+            ]
+        if not user_contexts:
+            # 分组为空等情况下没有解析出任何主机
+            return {"data": None, "error": "没有可执行的目标主机", "status": "error"}, []
+        if len({ctx.os_type.lower() for ctx in user_contexts}) > 1:
+            return {"data": None, "error": "批量执行的主机操作系统类型需一致", "status": "error"}, user_contexts
+        config_context = get_ansible_config(user_contexts[0])
+        forks = forks or config_context.batch_forks
+
+        # 先校验任务参数（各主机参数相同），不合法时不进入执行
+        try:
+            AnsibleTaskContext(user_contexts[0], config_context)
+        except Exception as e:
+            return {"data": None, "error": str(e), "status": "error"}, user_contexts
+
+    direct_runner = _direct_runner(user_contexts[0], config_context)
+    if direct_runner:
+        def run_one(ctx):
+            # 每台主机按各自的网段路由选择堡垒机，连接堡垒机失败时与单主机请求一样切换重试一次
+            host_config = get_ansible_config(ctx)
+            result = direct_runner(ctx, host_config, AnsibleTaskContext(ctx, host_config))
+            if bastion_pool.check_failover(ctx, host_config, result):
+                host_config = get_ansible_config(ctx)
+                result = direct_runner(ctx, host_config, AnsibleTaskContext(ctx, host_config))
+            return result.get("data") or {"host": ctx.ip, "failed": True, "msg": result.get("error")}
+
+        # 工作线程中的阶段耗时计入当前请求：每个任务在各自的上下文副本中执行
+        with ThreadPoolExecutor(max_workers=min(forks, len(user_contexts))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, run_one, ctx) for ctx in user_contexts]
+            host_results = [future.result() for future in futures]
+        all_results = None
+        scheduler = None
+    else:
+        # 不同网段可能路由到不同堡垒机：按各主机选出的堡垒机分组，每组一个 inventory、一次 ansible_runner 运行
+        groups = _batch_groups(user_contexts)
+        if len(groups) == 1:
+            outcomes = [_run_batch_group(groups[0][1], groups[0][0], forks)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, _run_batch_group, contexts, group_config, forks)
+                    for group_config, contexts in groups
+                ]
+                outcomes = [future.result() for future in futures]
+
+        if all(group_steps is None for _, group_steps, _, _ in outcomes):
+            # 执行阶段整体异常（如堡垒机不可达），所有主机均视为失败
+            _, _, scheduler, error = outcomes[0]
+            return {"data": None, "error": error, "status": "error", "scheduler": scheduler}, user_contexts
+        by_host, all_results, errors, schedulers = {}, [], {}, []
+        for (group_config, contexts), (group_by_host, group_steps, group_scheduler, error) in zip(groups, outcomes):
+            by_host.update(group_by_host)
+            _merge_steps(all_results, group_steps)
+            if group_steps is None:
+                errors.update((ctx.ip, error) for ctx in contexts)
+            if group_scheduler:
+                schedulers.append(group_scheduler)
+        # 各组分别排队，排队信息取等待最久的一组
+        scheduler = max(schedulers, key=lambda info: info.get("wait_time") or 0) if schedulers else None
+        host_results = [
+            by_host.get(ip) or {
+                "host": ip, "failed": True, "msg": errors.get(ip) or "no result (host skipped or earlier step failed)"
+            }
+            for ip in [ctx.ip for ctx in user_contexts]
+        ]
+
+    failed = sum(1 for item in host_results if item.get("failed"))
+    return {
+        "data": host_results,
+        "all_results": all_results,
+        "error": None,
+        "status": "error" if failed else "success",
+        "summary": {"total": len(host_results), "ok": len(host_results) - failed, "failed": failed},
+        "scheduler": scheduler
+    }, user_contexts
+
+
+def _batch_groups(user_contexts):
+    """
+    按各主机选出的堡垒机分组（BASTION_ROUTES 可将不同网段路由到不同堡垒机），不经堡垒机的主机为一组。
+    :return: [(该组的 ansible 配置, [用户上下文])]
+    """
+    groups = {}
+    for ctx in user_contexts:
+        config_context = get_ansible_config(ctx)
+        groups.setdefault(config_context.bastion_name, (config_context, []))[1].append(ctx)
+    return list(groups.values())
+
+
+def _run_batch_group(user_contexts, config_context, forks, failover=True):
+    """
+    经同一台堡垒机执行一组主机。连接该堡垒机失败（未到达目标）的主机按故障切换重新选择堡垒机重试一次。
+    :return: (主任务按主机的结果 {ip: item}, 全部步骤结果（整体异常时为 None）, 排队信息, 整体错误)
+    """
+    task_context = AnsibleTaskContext(user_contexts[0], config_context)
+    with stage("inventory_write"):
+        inventory_path, cleanup = generate_batch_inventory(user_contexts, config_context)
+    with stage("playbook_write"):
+        playbook_path, playbook_cleanup = _generate_playbook_if_needed(user_contexts[0], config_context, task_context)
+    try:
+        result = run_ansible_with_context(
+            user_contexts[0],
+            config_context,
+            task_context,
+            inventory_path,
+            playbook_path,
+            forks=forks,
+            targets=[ctx.get_target_addr() for ctx in user_contexts]
+        )
+    finally:
+        cleanup()
+        playbook_cleanup()
+
+    all_results = result.get("all_results")
+    # 主任务（focus）的按主机聚合结果即为批量接口的主要输出
+    by_host = {}
+    for step in all_results or []:
+        if step.get("focus"):
+            for item in step.get("result") or []:
+                by_host.setdefault(item.get("host"), item)
+    if not failover:
+        return by_host, all_results, result.get("scheduler"), result.get("error")
+
+    if all_results is None:
+        retry = user_contexts if bastion_pool.check_failover(user_contexts[0], config_context, result) else []
+    else:
+        # 逐台判断：仅 ssh 连接堡垒机被拒绝/超时的主机未到达目标，其余失败的主机不重试
+        retry = []
+        for ctx in user_contexts:
+            item = by_host.get(ctx.ip) or {}
+            if not (item.get("failed") or item.get("unreachable")):
+                continue
+            if bastion_pool.check_failover(ctx, config_context, {"status": "error", "error": item}):
+                retry.append(ctx)
+    if not retry:
+        return by_host, all_results, result.get("scheduler"), result.get("error")
+
+    retried = {ctx.ip for ctx in retry}
+    if all_results is not None:
+        all_results = [
+            dict(step, result=[item for item in step.get("result") or [] if item.get("host") not in retried])
+            for step in all_results
+        ]
+    error = result.get("error")
+    for group_config, contexts in _batch_groups(retry):
+        group_by_host, group_steps, _, group_error = _run_batch_group(contexts, group_config, forks, failover=False)
+        by_host.update(group_by_host)
+        if group_steps is not None:
+            all_results = _merge_steps(all_results or [], group_steps)
+        error = group_error
+    return by_host, all_results, result.get("scheduler"), error
+
+
+def _merge_steps(merged, steps):
+    """
+    合并各组的步骤结果：各组执行同一任务链，同序号步骤的主机结果合并到同一步骤下。
+    """
+    for index, step in enumerate(steps or []):
+        if index < len(merged):
+            results = list(merged[index].get("result") or []) + list(step.get("result") or [])
+            merged[index] = dict(merged[index], result=results)
+        else:
+            merged.append(dict(step))
+    return merged
+
+
+def _command_result(command: str, item: dict = None) -> dict:
+    """
+    将单条命令的主机结果整理为多命令接口的输出结构。
+    """
+    item = item or {"skipped": True}
+    if item.get("failed"):
+        state = "failed"
+    elif item.get("skipped"):
+        state = "skipped"
+    else:
+        state = "success"
+    duration = item.get("duration")
+    return {
+        "command": command,
+        "status": state,
+        "stdout": item.get("stdout", ""),
+        "stderr": item.get("stderr", ""),
+        "exit_code": item.get("rc"),
+        "start_time": item.get("start"),
+        "end_time": item.get("end"),
+        "duration_ms": round(duration * 1000) if duration is not None else None,
     }
 
+
+def RemoteCallCommandsService(data: dict):
+    """
+    多命令编排服务：同一目标主机上顺序执行多条命令，一次连接、一次往返返回每条命令的结果。
+
+    - native 引擎（Linux）：在同一条复用的 SSH 连接上逐条执行。
+    - H3C：在同一个复用的 CLI 会话中逐条执行，输出含 Comware 错误提示（% ...）的命令视为失败。
+    - ansible 引擎：每条命令一个 playbook 任务，单次 ansible_runner 运行内完成。
+    - continue_on_error 为 False 时，首个失败命令之后的命令标记为 skipped。
+
+    Args:
+        data (dict): 已校验的请求参数，commands 为命令列表。
+
+    Returns:
+        dict: data 为每条命令的结果列表 [{command, status, stdout, stderr, exit_code, start_time, end_time, duration_ms}]，
+            timings 为分阶段耗时
+    """
+    data = dict(data)
+    commands = data.pop("commands")
+    data["command"] = commands
+
+    try:
+        data = host_registry.resolve(data)
+    except HostNotFound as e:
+        return {"data": None, "error": str(e), "status": "error"}
+    user_context = RemoteCallContext(**data)
+    with request_timer(user_context.os_type, exec_type_of(user_context)) as timer:
+        response = _remote_call_commands(user_context, commands)
+        timer.status = response.get("status")
+    response["timings"] = timer.as_dict()
+    execution_recorder.record(user_context, response, kind="commands")
+    return response
+
+
+def _remote_call_commands(user_context, commands: list):
+    """
+    RemoteCallCommandsService 的执行主体。
+    """
+    with stage("context_build"):
+        config_context = get_ansible_config(user_context)
+
+    runner = None
+    if use_h3c_session(user_context, config_context):
+        runner = run_h3c_commands
+    elif use_native_engine(user_context, config_context):
+        runner = run_native_commands
+    if runner:
+        items, error = runner(user_context, config_context)
+        results = [
+            _command_result(command, items[index] if index < len(items) else None)
+            for index, command in enumerate(commands)
+        ]
+    else:
+        result = _remote_call(user_context)
+        all_results = result.get("all_results")
+        if all_results is None:
+            return {"data": None, "error": result.get("error"), "status": "error"}
+        error = None
+        results = []
+        for index, command in enumerate(commands):
+            step = all_results[index] if index < len(all_results) else None
+            items = (step or {}).get("result") or []
+            results.append(_command_result(command, items[0] if items else None))
+
+    failed = any(item["status"] == "failed" for item in results)
+    return {
+        "data": results,
+        "error": error,
+        "status": "error" if error or failed else "success"
+    }
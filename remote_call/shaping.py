@@ -0,0 +1,163 @@
+"""
+响应裁剪：字段选择、输出截断与去重。
+
+远程命令的输出可能达到数 MB（如 journalctl），而同一份 stdout 会同时出现在 data、all_results 与 target 中。
+在序列化前可对响应做如下处理（dedup 与截断默认关闭，由请求显式开启，不改变默认的响应结构）：
+- dedup：target 只保留元数据（去掉 res 中的 stdout/stderr），all_results 中与 data 相同的主机结果以 output_ref 引用；
+- 截断：stdout/stderr 超过 head + tail 字节时只保留首尾，标记 truncated 并记录原始字节数；
+- fields：按逗号分隔的字段路径（支持 data.stdout 形式的点号路径）选择返回内容，status 始终返回。
+"""
+from django.conf import settings
+
+OUTPUT_FIELDS = ("stdout", "stderr")
+# target.res 中与 data 重复的大字段
+TARGET_OUTPUT_KEYS = ("stdout", "stderr", "stdout_lines", "stderr_lines")
+
+
+def get_shaping_options(query_params) -> dict:
+    """
+    从查询参数解析裁剪选项，未指定时使用 RESPONSE_CONFIG 默认值（截断与去重默认关闭）。
+    查询参数：fields=status,data.stdout  head=字节数  tail=字节数  truncate=1（开启截断）  dedup=1（开启去重）
+    """
+    cfg = getattr(settings, "RESPONSE_CONFIG", {})
+    fields = query_params.get("fields")
+    return {
+        "fields": [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        "head_bytes": _int_param(query_params.get("head"), cfg.get("OUTPUT_HEAD_BYTES", 65536)),
+        "tail_bytes": _int_param(query_params.get("tail"), cfg.get("OUTPUT_TAIL_BYTES", 196608)),
+        "truncate": _bool_param(query_params.get("truncate"), cfg.get("TRUNCATE", False)),
+        "dedup": _bool_param(query_params.get("dedup"), cfg.get("DEDUP", False)),
+    }
+
+
+def _bool_param(value, default) -> bool:
+    if value is None:
+        return bool(default)
+    return value.lower() not in ("0", "false", "no")
+
+
+def _int_param(value, default) -> int:
+    try:
+        return max(0, int(value)) if value is not None else int(default)
+    except (TypeError, ValueError):
+        return int(default)
+
+
+def shape_response(resp: dict, fields=None, head_bytes: int = 65536, tail_bytes: int = 196608,
+                   truncate: bool = False, dedup: bool = False) -> dict:
+    """
+    按选项裁剪标准响应结构（build_response 的返回值），返回新的字典，不修改原结果。
+    """
+    resp = dict(resp)
+    data = resp.get("data")
+
+    if dedup:
+        target = resp.get("target")
+        if isinstance(target, dict) and isinstance(target.get("res"), dict):
+            res = {k: v for k, v in target["res"].items() if k not in TARGET_OUTPUT_KEYS}
+            resp["target"] = dict(target, res=res)
+        if isinstance(data, dict) and resp.get("all_results"):
+            resp["all_results"] = [_dedup_step(step, data) for step in resp["all_results"]]
+
+    if truncate:
+        resp["data"] = _truncate_any(data, head_bytes, tail_bytes)
+        if resp.get("all_results"):
+            resp["all_results"] = [
+                dict(step, result=_truncate_any(step.get("result"), head_bytes, tail_bytes))
+                if isinstance(step, dict) else step
+                for step in resp["all_results"]
+            ]
+
+    if fields:
+        resp = _select(resp, ["status"] + list(fields))
+    return resp
+
+
+def _dedup_step(step, data: dict):
+    """
+    all_results 中与 data 为同一主机结果（主任务）的条目，去掉输出并以 output_ref 引用 data。
+    """
+    if not isinstance(step, dict) or not step.get("focus") or not isinstance(step.get("result"), list):
+        return step
+    result = []
+    for item in step["result"]:
+        if isinstance(item, dict) and item.get("host") == data.get("host") and all(
+            item.get(key) == data.get(key) for key in OUTPUT_FIELDS
+        ):
+            item = {k: v for k, v in item.items() if k not in OUTPUT_FIELDS}
+            item["output_ref"] = "data"
+        result.append(item)
+    return dict(step, result=result)
+
+
+def _truncate_any(value, head_bytes: int, tail_bytes: int):
+    if isinstance(value, list):
+        return [_truncate_any(item, head_bytes, tail_bytes) for item in value]
+    if isinstance(value, dict):
+        return _truncate_item(value, head_bytes, tail_bytes)
+    return value
+
+
+def _truncate_item(item: dict, head_bytes: int, tail_bytes: int) -> dict:
+    shaped = None
+    for key in OUTPUT_FIELDS:
+        text = item.get(key)
+        if not isinstance(text, str):
+            continue
+        cut, size = truncate_text(text, head_bytes, tail_bytes)
+        if cut is None:
+            continue
+        if shaped is None:
+            shaped = dict(item)
+        shaped[key] = cut
+        shaped[f"{key}_bytes"] = size
+        shaped["truncated"] = True
+    return shaped if shaped is not None else item
+
+
+def truncate_text(text: str, head_bytes: int, tail_bytes: int):
+    """
+    超过 head_bytes + tail_bytes 字节时保留首尾并插入省略标记。
+    :return: (截断后的文本, 原始字节数)，未超限时返回 (None, None)
+    """
+    # UTF-8 每个字符至多 4 字节，字符数足够少时无需编码即可确定未超限
+    if len(text) <= (head_bytes + tail_bytes) // 4:
+        return None, None
+    raw = text.encode("utf-8")
+    size = len(raw)
+    if size <= head_bytes + tail_bytes:
+        return None, None
+    head = raw[:head_bytes].decode("utf-8", errors="ignore")
+    tail = raw[size - tail_bytes:].decode("utf-8", errors="ignore") if tail_bytes else ""
+    omitted = size - head_bytes - tail_bytes
+    return f"{head}\n... [truncated {omitted} bytes] ...\n{tail}", size
+
+
+def _select(value, paths):
+    """
+    按点号路径选择字段；列表中的每个元素按同一路径选择。
+    """
+    if isinstance(value, list):
+        return [_select(item, paths) for item in value]
+    if not isinstance(value, dict):
+        return value
+    tree = {}
+    for path in paths:
+        head, _, rest = path.partition(".")
+        if head not in value:
+            continue
+        if not rest:
+            tree[head] = None  # 整个字段
+        elif tree.get(head, []) is not None:
+            tree.setdefault(head, []).append(rest)
+    return {
+        key: value[key] if sub is None else _select(value[key], sub)
+        for key, sub in tree.items()
+    }
+
+
+def shape_from_request(resp: dict, query_params) -> dict:
+    """
+    视图层便捷入口：解析查询参数并裁剪响应。
+    """
+    return shape_response(resp, **get_shaping_options(query_params))
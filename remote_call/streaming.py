@@ -0,0 +1,103 @@
+"""
+流式执行：在后台线程中执行远程调用，将执行事件经有界队列转换为 SSE（text/event-stream）逐条推送。
+
+- native 引擎：命令输出到达即按行推送（event: output）。
+- ansible 引擎：ansible 模块输出在任务结束时才返回，按 ansible_runner 事件粒度推送（event: ansible）。
+- 结束时推送 event: done，只包含状态、错误、返回码与分阶段耗时，不再重复整段输出。
+"""
+import json
+import logging
+import queue
+import threading
+
+from django.conf import settings
+
+from remote_call.services import RemoteCallService
+
+logger = logging.getLogger('django')
+
+# 仅转发携带输出或主机结果的 ansible_runner 事件
+FORWARDED_ANSIBLE_EVENTS = (
+    "playbook_on_task_start",
+    "runner_on_ok",
+    "runner_on_failed",
+    "runner_on_unreachable",
+    "runner_on_skipped",
+    "verbose",
+)
+
+_SENTINEL = object()
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _to_message(event: dict):
+    """
+    将执行事件转换为 (SSE 事件名, 数据)；不需要转发的事件返回 None。
+    """
+    host = (event.get("event_data") or {}).get("host")
+    if event.get("event") == "native_output":
+        return "output", {"host": host, "stream": event.get("stream"), "line": event.get("stdout")}
+    if event.get("event") in FORWARDED_ANSIBLE_EVENTS:
+        return "ansible", {"host": host, "event": event.get("event"), "stdout": event.get("stdout", "")}
+    return None
+
+
+def stream_remote_call(data: dict):
+    """
+    执行远程调用并以生成器形式逐条产出 SSE 文本。
+    队列有界：消费端（HTTP 客户端）读取过慢时执行线程阻塞等待，内存占用不随输出增长；
+    客户端断开后执行线程丢弃后续事件，直至任务自然结束。
+    :param data: 已校验的请求参数
+    """
+    cfg = getattr(settings, "STREAM_CONFIG", {})
+    events = queue.Queue(maxsize=int(cfg.get("QUEUE_SIZE", 1000)))
+    cancelled = threading.Event()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                events.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def on_event(event):
+        message = _to_message(event)
+        if message:
+            put(message)
+        return True  # 保留事件，供 extract_ansible_events 汇总结果
+
+    def worker():
+        try:
+            result = RemoteCallService(data, event_handler=on_event)
+            focus = result.get("data") if isinstance(result.get("data"), dict) else {}
+            put(("done", {
+                "status": result.get("status"),
+                "error": result.get("error"),
+                "rc": focus.get("rc"),
+                "timings": result.get("timings"),
+            }))
+        except Exception as e:
+            logger.exception("Streaming remote call failed")
+            put(("done", {"status": "error", "error": str(e), "rc": None}))
+        finally:
+            put(_SENTINEL)
+
+    threading.Thread(target=worker, name="remote-call-stream", daemon=True).start()
+
+    try:
+        while True:
+            try:
+                item = events.get(timeout=15)
+            except queue.Empty:
+                # 长时间无输出时发送注释行保活，防止代理断开空闲连接
+                yield ": keepalive\n\n"
+                continue
+            if item is _SENTINEL:
+                break
+            yield _sse(*item)
+    finally:
+        cancelled.set()
@@ -1,5 +1,10 @@
+import fcntl
 import tempfile
 import os
+import hashlib
+import re
+import time
+from contextlib import contextmanager
 from typing import Any, Optional
 
 def build_response(
@@ -7,7 +12,11 @@ def build_response(
     data: Any = None,
     error: Optional[Any] = None,
     target: Optional[Any] = None,
-    all_results: Optional[Any] = None
+    all_results: Optional[Any] = None,
+    summary: Optional[Any] = None,
+    cache: Optional[Any] = None,
+    scheduler: Optional[Any] = None,
+    timings: Optional[Any] = None
 ) -> dict:
     """
     构造标准API响应结构，支持多步任务链结果。
@@ -16,6 +25,10 @@ def build_response(
     :param error: 错误信息
     :param target: ansible运行元数据（可选）
     :param all_results: 多步任务链全部步骤结果（可选）
+    :param summary: 批量执行的汇总统计（可选）
+    :param cache: 结果缓存元数据 {hit, age, ttl}（可选，仅可缓存的只读命令）
+    :param scheduler: 调度排队信息 {queue_depth, wait_time}（可选）
+    :param timings: 分阶段耗时（毫秒）{阶段: 耗时, total: 总耗时}（可选）
     :return: dict类型的标准响应体
     """
     resp = {
@@ -27,6 +40,14 @@ def build_response(
         resp["target"] = target  # 仅在有ansible元数据时添加
     if all_results is not None:
         resp["all_results"] = all_results  # 多步任务链时返回所有步骤结果
+    if summary is not None:
+        resp["summary"] = summary  # 批量执行时返回成功/失败主机数
+    if cache is not None:
+        resp["cache"] = cache  # 命中/写入结果缓存时返回缓存元数据
+    if scheduler is not None:
+        resp["scheduler"] = scheduler  # 排队深度与等待时长
+    if timings is not None:
+        resp["timings"] = timings  # 上下文构建、密钥获取、排队、执行等各阶段耗时
     return resp
 
 def write_temp_file(content: str, suffix: str = "", prefix: str = "tmp", dir: Optional[str] = None):
@@ -54,6 +75,79 @@ def write_temp_file(content: str, suffix: str = "", prefix: str = "tmp", dir: Op
             pass  # 文件可能已被删除，忽略异常
     return file_path, close_func, cleanup_func
 
+# 缓存目录的闲置文件清理间隔（秒），实际间隔不超过 ttl
+CACHE_PRUNE_INTERVAL = 60
+# 各缓存目录最近一次清理时间
+_pruned_at = {}
+
+
+@contextmanager
+def _dir_lock(dir: str, operation: int):
+    """
+    缓存目录的进程间文件锁：写入/复用持共享锁，清理持排他锁，避免清理掉其他进程刚复用的文件。
+    """
+    fd = os.open(os.path.join(dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, operation)
+        yield
+    finally:
+        os.close(fd)  # 关闭即释放锁
+
+
+def write_cached_file(content: str, suffix: str = "", dir: Optional[str] = None, ttl: int = 600):
+    """
+    按内容 sha256 写入缓存文件，相同内容复用同一文件，不再每次请求写入和删除。
+    文件以 600 权限原子创建，每次复用刷新修改时间；修改时间超过 ttl 秒的文件由 _prune_cached_files 按磁盘状态清理，
+    同一目录的多个服务进程共享缓存与清理。
+    :param content: 文件内容字符串（不应包含密码等敏感信息，此类文件用 write_temp_file 并在执行后删除）
+    :param suffix: 文件后缀名（如 .ini）
+    :param dir: 缓存目录（建议位于 tmpfs，如 /dev/shm）
+    :param ttl: 缓存文件闲置保留时间（秒），需大于文件写入到 ansible 读取之间的最长排队时间
+    :return: (file_path, cleanup_func)
+        file_path: 缓存文件路径
+        cleanup_func: 空操作，文件由缓存统一清理，保持与 write_temp_file 调用方式一致
+    """
+    dir = dir or tempfile.gettempdir()
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    file_path = os.path.join(dir, f"{digest}{suffix}")
+    os.makedirs(dir, mode=0o700, exist_ok=True)
+    with _dir_lock(dir, fcntl.LOCK_SH):
+        try:
+            os.utime(file_path)  # 标记为最近使用
+        except FileNotFoundError:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp", suffix=suffix, dir=dir)  # mkstemp 默认 600 权限
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)  # 原子替换，并发写入同一内容也不会读到半个文件
+    _prune_cached_files(dir, ttl)
+    return file_path, lambda: None
+
+
+def _prune_cached_files(dir: str, ttl: int):
+    """
+    删除目录中修改时间早于 ttl 秒的文件（含异常退出的进程遗留的文件），每个目录至多每 CACHE_PRUNE_INTERVAL 秒一次。
+    其他进程正在清理或写入时跳过本次，不阻塞请求。
+    """
+    now = time.monotonic()
+    if now - _pruned_at.get(dir, float("-inf")) < min(CACHE_PRUNE_INTERVAL, ttl):
+        return
+    _pruned_at[dir] = now
+    try:
+        with _dir_lock(dir, fcntl.LOCK_EX | fcntl.LOCK_NB):
+            deadline = time.time() - ttl
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    if entry.name == ".lock" or not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        if entry.stat(follow_symlinks=False).st_mtime < deadline:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass  # 文件可能已被删除，忽略异常
+    except BlockingIOError:
+        pass
+
+
 def read_file_content(file_path: str):
     """
     读取指定文件内容，返回内容和关闭文件的函数。
@@ -66,4 +160,37 @@ def read_file_content(file_path: str):
     content = f.read()  # 读取全部内容
     def close_func():
         f.close()  # 关闭文件对象
-    return content, close_func
\ No newline at end of file
+    return content, close_func
+
+REDACTED = "******"
+# 请求参数中需脱敏的字段名（小写比较，包含即匹配）
+SECRET_KEYS = ("password", "passwd", "secret", "token", "private_key", "api_key")
+# 文本中的敏感片段：key=value / key: value 形式（如 inventory 的 ansible_password=xxx、命令中的 --password=xxx）
+_SECRET_TEXT_RE = re.compile(
+    r"(?i)(\b[\w-]*(?:password|passwd|pwd|secret|token)[\w-]*\s*[=:]\s*)(\"[^\"]*\"|'[^']*'|\S+)"
+)
+
+
+def redact_text(text: str) -> str:
+    """
+    将文本中 key=value 形式的密码、令牌等替换为 ******，用于日志与执行历史。
+    """
+    if not text:
+        return text
+    return _SECRET_TEXT_RE.sub(lambda m: m.group(1) + REDACTED, text)
+
+
+def redact(value):
+    """
+    递归脱敏请求参数：敏感字段的值替换为 ******，其余字符串按 redact_text 处理。
+    """
+    if isinstance(value, dict):
+        return {
+            k: (REDACTED if v not in (None, "") and any(s in str(k).lower() for s in SECRET_KEYS) else redact(v))
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
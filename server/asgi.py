@@ -3,6 +3,9 @@ ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+异步接口 /api/remote_call/aio 需以 ASGI 方式部署，例如：
+    uvicorn server.asgi:application --host 0.0.0.0 --port 8000
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -55,6 +55,7 @@ SPECTACULAR_SETTINGS = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -140,10 +141,121 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 BASTION_CONFIG = {
     "WORKING_DIR": str(BASE_DIR),
     "BASTION_IP": "192.168.27.131",
+    "BASTION_PORT": 22,
     "BASTION_USER": "root",
     "BASTION_PRIVATE_KEY": "/root/.ssh/id_rsa",
     "BASTION_TEMP_PRIVATE_KEY": "~/.ssh/bastion_id_rsa",
     "JUMP_PRIVATE_KEY": "~/.ssh/id_rsa_ansible",
+    # 堡垒机池：配置后按目标网段路由到多台堡垒机，未配置时只使用上面的 BASTION_IP
+    # BASTIONS: [{"name": "bj-1", "ip": "10.0.0.11"}, ...]，port/user/private_key/jump_private_key 缺省取上面的值
+    # BASTION_ROUTES: [{"cidr": "10.1.0.0/16", "bastions": ["bj-1", "bj-2"]}]，最长前缀优先，未命中时在全部堡垒机中选择
+    # BASTION_SELECTION: least_connections（调度器会话最少）/ round_robin；健康探测间隔与超时（秒）
+    "BASTIONS": [],
+    "BASTION_ROUTES": [],
+    "BASTION_SELECTION": "least_connections",
+    "BASTION_HEALTH_INTERVAL": 30,
+    "BASTION_HEALTH_TIMEOUT": 3,
+    # 堡垒机私钥本地缓存有效期（秒），0 表示每次请求重新拉取；回源失败沿用旧副本后，间隔多久（秒）再回源
+    "KEY_CACHE_TTL": 300,
+    "KEY_CACHE_RETRY_INTERVAL": 30,
+    # SSH 连接复用（ControlMaster）：控制套接字目录、空闲保持时间（秒）、最大套接字数
+    "SSH_MUX_ENABLED": True,
+    "SSH_CONTROL_DIR": "/tmp/rc-mux",
+    "SSH_CONTROL_PERSIST": 300,
+    "SSH_MAX_CONTROL_SOCKETS": 256,
+    # 默认执行引擎：ansible / native（native 通过复用的 paramiko 连接直接执行 Linux 命令）
+    "EXECUTION_ENGINE": "ansible",
+    # H3C 设备命令默认经 CLI 会话引擎执行：按设备保持已登录会话，避免每次请求在交换机上重复老旧算法握手
+    # H3C_IDLE_TIMEOUT 应低于设备 VTY idle-timeout（默认 10 分钟）；请求 engine=ansible 时仍走 raw 任务
+    "H3C_SESSION_ENABLED": True,
+    "H3C_IDLE_TIMEOUT": 300,
+    "H3C_MAX_SESSIONS": 64,
+    "H3C_COMMAND_TIMEOUT": 60,
+    # 批量执行默认并行数，以及可按 group 引用的预定义主机分组（分组名 -> IP 列表）
+    "BATCH_FORKS": 20,
+    "HOST_GROUPS": {},
+    # 执行调度：全局/每堡垒机会话/每目标主机/每 ERP 用户并发上限，排队超时与单次执行默认超时（秒）
+    # SCHEDULER_MAX_PER_BASTION 应低于堡垒机 sshd 的 MaxStartups/MaxSessions，超出部分本地排队
+    "SCHEDULER_MAX_CONCURRENT": 32,
+    "SCHEDULER_MAX_PER_BASTION": 30,
+    "SCHEDULER_MAX_PER_TARGET": 4,
+    "SCHEDULER_MAX_PER_USER": 8,
+    "SCHEDULER_QUEUE_TIMEOUT": 60,
+    "DEFAULT_TIMEOUT": 600,
+    # 运行时缓存目录（inventory/playbook 按内容哈希缓存），默认 /dev/shm/remote-command；闲置保留时间（秒）
+    "RUNTIME_CACHE_TTL": 600,
+    # ansible_runner 执行产物：disk（按执行 UUID 分目录保留并定期回收）/ memory（tmpfs，执行后即删）
+    "ARTIFACTS_MODE": "disk",
+    "ARTIFACTS_DIR": str(BASE_DIR / "artifacts"),
+    "ARTIFACTS_RETENTION": 500,
+    "ARTIFACTS_MAX_AGE": 86400,
+    "ARTIFACTS_MAX_BYTES": 1024 * 1024 * 1024,
+    # 预热 ansible 工作进程池：已启动解释器并导入 ansible CLI 与常用插件的常驻进程，经本地 unix 套接字接收执行请求，
+    # 每次执行只按环境重置 ansible 配置与插件加载器；处理 WARM_POOL_MAX_JOBS 次后回收重建；0 表示关闭
+    "WARM_POOL_SIZE": 0,
+    "WARM_POOL_MAX_JOBS": 200,
+}
+
+# 异步任务：后台执行线程数、已完成任务保留时间（秒）
+JOB_CONFIG = {
+    "WORKERS": 8,
+    "RETENTION": 3600,
+}
+
+# 流式输出：事件队列上限（条），消费过慢时执行线程等待，保证内存有界
+STREAM_CONFIG = {
+    "QUEUE_SIZE": 1000,
+}
+
+# 只读命令结果缓存：需请求携带 cache=true 才生效
+# BACKEND: memory（进程内 LRU，MAX_ENTRIES 为条目上限）/ django（使用 CACHES[CACHE_ALIAS]，如 django-redis）
+# COMMANDS: 可缓存命令白名单（规范化后精确匹配）-> TTL（秒）
+RESULT_CACHE = {
+    "ENABLED": True,
+    "BACKEND": "memory",
+    "CACHE_ALIAS": "default",
+    "MAX_ENTRIES": 1024,
+    "COMMANDS": {
+        "uptime": 10,
+        "df -h": 30,
+        "free -m": 10,
+        "free -h": 10,
+        "hostname": 300,
+        "uname -a": 300,
+        "cat /etc/os-release": 300,
+    },
+}
+
+# 响应裁剪与压缩：TRUNCATE 时 stdout/stderr 超过 HEAD+TAIL 字节只保留首尾，DEDUP 去除 data/all_results/target
+# 间重复的输出；两者默认关闭（保持原有响应结构），可按请求以查询参数 truncate=1 / dedup=1 开启；
+# 响应体不小于 COMPRESS_MIN_BYTES 时按 Accept-Encoding 压缩（安装 zstandard 时支持 zstd，否则 gzip）
+RESPONSE_CONFIG = {
+    "OUTPUT_HEAD_BYTES": 64 * 1024,
+    "OUTPUT_TAIL_BYTES": 192 * 1024,
+    "TRUNCATE": False,
+    "DEDUP": False,
+    "COMPRESS_MIN_BYTES": 1024,
+    "GZIP_LEVEL": 6,
+    "ZSTD_LEVEL": 3,
+}
+
+# 执行历史：后台线程按批写入 ExecutionRecord，队列满时丢弃（不阻塞请求）；
+# stdout/stderr 保留首尾 OUTPUT_HEAD_BYTES/OUTPUT_TAIL_BYTES 字节，超过 RETENTION_DAYS 天的记录定期清理
+HISTORY_CONFIG = {
+    "ENABLED": True,
+    "QUEUE_SIZE": 10000,
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL": 1.0,
+    "OUTPUT_HEAD_BYTES": 4096,
+    "OUTPUT_TAIL_BYTES": 4096,
+    "RETENTION_DAYS": 30,
+}
+
+# 主机登记表（api.models.Host）：进程内缓存每 REFRESH_INTERVAL 秒检查一次数据库版本，变更时重新加载
+# CREDENTIALS: credential_ref -> {"username", "password"}，密码不写入数据库，建议从环境变量读取
+HOST_REGISTRY = {
+    "REFRESH_INTERVAL": 30,
+    "CREDENTIALS": {},
 }
 
 # Logging configuration
@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path,include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from api.views import MetricsView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -31,4 +32,7 @@ urlpatterns = [
     path("api/schema/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
 
     path('api/', include('api.urls')),
+
+    # Prometheus 指标
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
@@ -1,106 +1,414 @@
-import time
+"""
+基于 Redis 的接口限流：令牌桶限速 + 租约信号量限并发。
+
+- 令牌桶：Lua 脚本根据桶状态计算出精确的等待时间并预占令牌（令牌数允许为负），
+  调用方只需等待一次，不再轮询；预占按到达顺序排队，天然 FIFO；等待时间超过上限时直接拒绝。
+- 信号量：持有者登记在有序集合中（score 为租约到期时间），进程崩溃后租约到期自动回收；
+  等待者按到达顺序排队，释放时由 Lua 脚本把槽位直接移交给队首，并通过等待者专属的
+  唤醒列表（BLPOP）通知，不再 INCR/DECR 轮询。持有期间后台定期续租。
+- 同步与异步视图均可使用：装饰器根据被装饰函数自动选择实现，异步模式下阻塞等待在线程中进行。
+"""
+import asyncio
 import functools
+import math
+import threading
+import time
+import uuid
+
 from django.core.cache import cache
 from rest_framework.response import Response
 from rest_framework import status
 
-# 令牌桶Lua脚本，保证原子性
+from remote_call.metrics import LIMITER_WAIT_SECONDS
+
+# 令牌桶 Lua 脚本：计算等待时间并预占令牌，保证原子性
+# KEYS[1] 桶 key；ARGV: capacity, refill_rate, requested, max_wait（秒）
+# 返回 {是否预占成功, 需等待秒数}（浮点数以字符串返回，避免被 Redis 截断为整数）
 TOKEN_BUCKET_LUA = """
 local key = KEYS[1]
 local capacity = tonumber(ARGV[1])
 local refill_rate = tonumber(ARGV[2])
-local now = tonumber(ARGV[3])
-local requested = tonumber(ARGV[4])
+local requested = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+
+local t = redis.call("TIME")
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
 
 local bucket = redis.call("HMGET", key, "tokens", "timestamp")
 local tokens = tonumber(bucket[1]) or capacity
 local last_time = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last_time) * refill_rate)
 
-local delta = math.max(0, now - last_time)
-tokens = math.min(capacity, tokens + delta * refill_rate)
+local wait = 0
 if tokens < requested then
-    redis.call("HMSET", key, "tokens", tokens, "timestamp", now)
-    redis.call("EXPIRE", key, 60)
-    return 0
-else
-    tokens = tokens - requested
-    redis.call("HMSET", key, "tokens", tokens, "timestamp", now)
-    redis.call("EXPIRE", key, 60)
+    wait = (requested - tokens) / refill_rate
+end
+if wait > max_wait then
+    return {0, tostring(wait - max_wait)}
+end
+
+tokens = tokens - requested
+redis.call("HSET", key, "tokens", tostring(tokens), "timestamp", tostring(now))
+redis.call("EXPIRE", key, math.ceil((capacity - tokens) / refill_rate) + 1)
+return {1, tostring(wait)}
+"""
+
+# 信号量公共片段：清理过期持有者与已放弃的等待者，并把空闲槽位按队列顺序移交给等待者
+# KEYS: holders, queue, waiter_deadlines, seq；ARGV[1] token, ARGV[2] limit, ARGV[3] lease_ms, ARGV[4] wake_prefix
+_SEMAPHORE_COMMON_LUA = """
+local holders, queue, deadlines, seq = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local token = ARGV[1]
+local limit = tonumber(ARGV[2])
+local lease_ms = tonumber(ARGV[3])
+local wake_prefix = ARGV[4]
+
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+redis.call("ZREMRANGEBYSCORE", holders, "-inf", now)
+local gone = redis.call("ZRANGEBYSCORE", deadlines, "-inf", now)
+for _, waiter in ipairs(gone) do
+    redis.call("ZREM", queue, waiter)
+    redis.call("ZREM", deadlines, waiter)
+end
+
+local function admit()
+    while redis.call("ZCARD", holders) < limit do
+        local head = redis.call("ZRANGE", queue, 0, 0)[1]
+        if not head then
+            break
+        end
+        local deadline = tonumber(redis.call("ZSCORE", deadlines, head)) or (now + lease_ms)
+        redis.call("ZREM", queue, head)
+        redis.call("ZREM", deadlines, head)
+        redis.call("ZADD", holders, now + lease_ms, head)
+        local wake = wake_prefix .. head
+        redis.call("RPUSH", wake, "1")
+        redis.call("PEXPIRE", wake, math.max(1, deadline - now) + 1000)
+    end
+end
+
+local function touch(ttl_ms)
+    for _, key in ipairs(KEYS) do
+        -- 只延长不缩短，避免释放/续租时缩短长等待者所在队列的过期时间
+        if redis.call("EXISTS", key) == 1 and redis.call("PTTL", key) < ttl_ms then
+            redis.call("PEXPIRE", key, ttl_ms)
+        end
+    end
+end
+"""
+
+# 申请槽位：未排队时入队，随后按队列顺序分配空闲槽位
+# ARGV[5] 最长等待毫秒数；返回 {是否已持有, 最早租约到期的剩余毫秒数（-1 表示无持有者）}
+SEMAPHORE_ACQUIRE_LUA = _SEMAPHORE_COMMON_LUA + """
+local wait_ms = tonumber(ARGV[5])
+if not redis.call("ZSCORE", holders, token) and not redis.call("ZSCORE", queue, token) then
+    redis.call("ZADD", queue, redis.call("INCR", seq), token)
+    redis.call("ZADD", deadlines, now + wait_ms, token)
+end
+admit()
+touch(lease_ms + wait_ms)
+if redis.call("ZSCORE", holders, token) then
+    redis.call("DEL", wake_prefix .. token)
+    return {1, 0}
+end
+local first = redis.call("ZRANGE", holders, 0, 0, "WITHSCORES")
+if first[2] then
+    return {0, tonumber(first[2]) - now}
+end
+return {0, -1}
+"""
+
+# 释放槽位并移交给队首等待者
+SEMAPHORE_RELEASE_LUA = _SEMAPHORE_COMMON_LUA + """
+redis.call("ZREM", holders, token)
+admit()
+touch(lease_ms)
+return 1
+"""
+
+# 放弃等待：若在放弃前已被移交槽位则返回 1（调用方需释放），否则出队并返回 0
+SEMAPHORE_CANCEL_LUA = _SEMAPHORE_COMMON_LUA + """
+redis.call("DEL", wake_prefix .. token)
+if redis.call("ZSCORE", holders, token) then
     return 1
 end
+redis.call("ZREM", queue, token)
+redis.call("ZREM", deadlines, token)
+return 0
 """
 
+# 续租：仍持有时延长租约并返回 1，租约已过期返回 0
+SEMAPHORE_RENEW_LUA = _SEMAPHORE_COMMON_LUA + """
+if redis.call("ZSCORE", holders, token) then
+    redis.call("ZADD", holders, "XX", now + lease_ms, token)
+    touch(lease_ms)
+    return 1
+end
+return 0
+"""
+
+
+class LimitExceeded(Exception):
+    """
+    超过等待上限，retry_after 为建议的重试间隔（秒）。
+    """
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limit exceeded")
+        self.retry_after = retry_after
+
+
+def _get_client():
+    """
+    获取 django-redis 底层 Redis 客户端。
+    """
+    return cache.client.get_client(write=True)
+
+
+class TokenBucket:
+    """
+    Redis 令牌桶。
+    :param bucket_key: 桶的唯一 key
+    :param capacity: 桶容量（最大突发数）
+    :param refill_rate: 每秒补充令牌数（平均速率）
+    :param max_wait: 最大等待时间（秒），预计等待超过该值时拒绝
+    """
+
+    def __init__(self, bucket_key, capacity=5, refill_rate=1, max_wait=30):
+        self.key = f"bucket:{bucket_key}"
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_wait = max_wait
+
+    def reserve(self, requested=1) -> float:
+        """
+        预占令牌并返回需要等待的秒数，超过 max_wait 时抛出 LimitExceeded。
+        """
+        client = _get_client()
+        script = client.register_script(TOKEN_BUCKET_LUA)
+        allowed, wait = script(keys=[self.key], args=[self.capacity, self.refill_rate, requested, self.max_wait])
+        wait = float(wait)
+        if int(allowed) != 1:
+            raise LimitExceeded(retry_after=wait)
+        return wait
+
+    def acquire(self, requested=1):
+        wait = self.reserve(requested)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, requested=1):
+        wait = await asyncio.to_thread(self.reserve, requested)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class LeasedSemaphore:
+    """
+    基于租约的 Redis 分布式信号量，等待者按到达顺序获得槽位。
+    :param semaphore_key: 信号量唯一 key
+    :param max_concurrent: 最大并发数
+    :param wait_timeout: 最长等待时间（秒）
+    :param lease_timeout: 租约时长（秒），持有期间每 lease_timeout/3 续租一次，进程崩溃后最多 lease_timeout 秒回收
+    """
+
+    def __init__(self, semaphore_key, max_concurrent=5, wait_timeout=30, lease_timeout=60):
+        tag = "{" + semaphore_key + "}"  # hash tag，保证 Redis Cluster 下多个 key 落在同一 slot
+        self.keys = [f"sem:{tag}:holders", f"sem:{tag}:queue", f"sem:{tag}:deadlines", f"sem:{tag}:seq"]
+        self.wake_prefix = f"sem:{tag}:wake:"
+        self.max_concurrent = max_concurrent
+        self.wait_timeout = wait_timeout
+        self.lease_ms = int(lease_timeout * 1000)
+
+    def _run(self, client, lua, token, *extra):
+        script = client.register_script(lua)
+        return script(keys=self.keys, args=[token, self.max_concurrent, self.lease_ms, self.wake_prefix, *extra])
+
+    def acquire(self) -> str:
+        """
+        阻塞获取槽位，返回持有凭证 token；等待超时抛出 LimitExceeded。
+        等待期间阻塞在等待者专属唤醒列表上，超时上限取剩余等待时间与最早租约到期时间中的较小值，
+        以便持有者崩溃、租约过期时及时重新分配。
+        """
+        client = _get_client()
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        wait_ms = int(self.wait_timeout * 1000)
+        try:
+            while True:
+                held, next_expiry_ms = self._run(client, SEMAPHORE_ACQUIRE_LUA, token, wait_ms)
+                if int(held) == 1:
+                    return token
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                block = remaining
+                if int(next_expiry_ms) >= 0:
+                    block = min(block, int(next_expiry_ms) / 1000 + 0.01)
+                if client.blpop([self.wake_prefix + token], timeout=max(block, 0.01)) is not None:
+                    # 已被移交槽位，下一轮 acquire 脚本确认持有
+                    continue
+        except BaseException:
+            self._cancel(client, token)
+            raise
+        if self._cancel(client, token):
+            return token
+        raise LimitExceeded(retry_after=self.wait_timeout)
+
+    def _cancel(self, client, token) -> bool:
+        """
+        放弃等待；若已被移交槽位返回 True（视为获取成功）。
+        """
+        try:
+            return int(self._run(client, SEMAPHORE_CANCEL_LUA, token)) == 1
+        except Exception:
+            return False
+
+    def release(self, token):
+        """
+        释放槽位；Redis 异常时忽略，槽位在租约到期后自动回收。
+        """
+        try:
+            self._run(_get_client(), SEMAPHORE_RELEASE_LUA, token)
+        except Exception:
+            pass
+
+    def renew(self, token) -> bool:
+        return int(self._run(_get_client(), SEMAPHORE_RENEW_LUA, token)) == 1
+
+    def hold(self, token) -> threading.Event:
+        """
+        启动后台续租线程，set 返回的事件即停止续租。
+        """
+        stop = threading.Event()
+        interval = self.lease_ms / 3000
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    if not self.renew(token):
+                        return
+                except Exception:
+                    # 临时网络错误时继续尝试，租约未过期前均可续上
+                    pass
+
+        threading.Thread(target=run, name="semaphore-lease", daemon=True).start()
+        return stop
+
+
+def _error_response(err_msg, retry_after=None, code=status.HTTP_503_SERVICE_UNAVAILABLE):
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after else None
+    return Response({"error": err_msg}, status=code, headers=headers)
+
+
 def redis_token_bucket_limit(
     bucket_key,
     capacity=5,
     refill_rate=1,
     wait_timeout=30,
-    sleep_interval=0.2,
     err_msg="服务器繁忙，请稍后重试"
 ):
     """
-    Redis令牌桶限流装饰器，适用于Django接口并发控制。
+    Redis令牌桶限流装饰器，适用于Django接口（同步/异步视图）。
+    按桶状态计算出精确等待时间后只等待一次，超过 wait_timeout 的请求直接返回 503 并携带 Retry-After。
     :param bucket_key: Redis中桶的唯一key
     :param capacity: 桶容量（最大突发并发数）
     :param refill_rate: 每秒补充令牌数（平均速率）
     :param wait_timeout: 最大等待时间（秒）
-    :param sleep_interval: 等待重试间隔（秒）
     :param err_msg: 超时返回的错误信息
     """
+    bucket = TokenBucket(bucket_key, capacity=capacity, refill_rate=refill_rate, max_wait=wait_timeout)
+
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(self, request, *args, **kwargs):
-            start = time.time()
-            client = cache.client.get_client()
-            key = f"bucket:{bucket_key}"
-            while True:
-                now = int(time.time())
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, request, *args, **kwargs):
+                start = time.monotonic()
                 try:
-                    allowed = client.eval(
-                        TOKEN_BUCKET_LUA, 1, key, capacity, refill_rate, now, 1
-                    )
+                    await bucket.aacquire()
+                except LimitExceeded as e:
+                    return _error_response(err_msg, e.retry_after)
                 except Exception:
-                    return Response({"error": "限流服务异常"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                if allowed == 1:
-                    break
-                if time.time() - start > wait_timeout:
-                    return Response({"error": err_msg}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-                time.sleep(sleep_interval)
+                    return _error_response("限流服务异常", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                finally:
+                    LIMITER_WAIT_SECONDS.observe(time.monotonic() - start, limiter="token_bucket", key=bucket_key)
+                return await func(self, request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            start = time.monotonic()
             try:
-                return func(self, request, *args, **kwargs)
+                bucket.acquire()
+            except LimitExceeded as e:
+                return _error_response(err_msg, e.retry_after)
+            except Exception:
+                return _error_response("限流服务异常", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
             finally:
-                pass  # 令牌桶无需释放
+                LIMITER_WAIT_SECONDS.observe(time.monotonic() - start, limiter="token_bucket", key=bucket_key)
+            return func(self, request, *args, **kwargs)
         return wrapper
     return decorator
 
-def redis_concurrency_limit(semaphore_key, max_concurrent=5, wait_timeout=30):
+
+def redis_concurrency_limit(
+    semaphore_key,
+    max_concurrent=5,
+    wait_timeout=30,
+    lease_timeout=60,
+    err_msg="服务器繁忙，请稍后重试"
+):
+    """
+    Redis并发限制装饰器，适用于Django接口（同步/异步视图）。
+    槽位以租约形式持有并在执行期间自动续租，进程崩溃后租约到期自动回收；等待者按到达顺序获得槽位。
+    :param semaphore_key: 信号量唯一key
+    :param max_concurrent: 最大并发数
+    :param wait_timeout: 最大等待时间（秒）
+    :param lease_timeout: 租约时长（秒）
+    :param err_msg: 超时返回的错误信息
+    """
+    semaphore = LeasedSemaphore(semaphore_key, max_concurrent=max_concurrent,
+                                wait_timeout=wait_timeout, lease_timeout=lease_timeout)
+
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(self, request, *args, **kwargs):
-            start = time.time()
-            acquired = False
-            while True:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, request, *args, **kwargs):
+                start = time.monotonic()
                 try:
-                    current = cache.incr(semaphore_key, ignore_key_check=True)
+                    # 阻塞等待在线程中进行，不占用事件循环
+                    token = await asyncio.to_thread(semaphore.acquire)
+                except LimitExceeded as e:
+                    return _error_response(err_msg, e.retry_after)
                 except Exception:
-                    # 如果key不存在，初始化为1
-                    cache.set(semaphore_key, 1, timeout=60)
-                    current = 1
-                if current == 1:
-                    # 第一次设置时，设置一个过期时间，防止死锁
-                    cache.expire(semaphore_key, 60)
-                if current <= max_concurrent:
-                    acquired = True
-                    break
-                else:
-                    cache.decr(semaphore_key)
-                    if time.time() - start > wait_timeout:
-                        return Response({"error": "服务器繁忙，请稍后重试"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-                    time.sleep(0.2)
+                    return _error_response("限流服务异常", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                finally:
+                    LIMITER_WAIT_SECONDS.observe(time.monotonic() - start, limiter="concurrency", key=semaphore_key)
+                stop = semaphore.hold(token)
+                try:
+                    return await func(self, request, *args, **kwargs)
+                finally:
+                    stop.set()
+                    await asyncio.to_thread(semaphore.release, token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            start = time.monotonic()
+            try:
+                token = semaphore.acquire()
+            except LimitExceeded as e:
+                return _error_response(err_msg, e.retry_after)
+            except Exception:
+                return _error_response("限流服务异常", code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            finally:
+                LIMITER_WAIT_SECONDS.observe(time.monotonic() - start, limiter="concurrency", key=semaphore_key)
+            stop = semaphore.hold(token)
             try:
                 return func(self, request, *args, **kwargs)
             finally:
-                if acquired:
-                    cache.decr(semaphore_key)
+                stop.set()
+                semaphore.release(token)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator